@@ -1,36 +1,41 @@
-from socket import *
-from datetime import datetime, timezone
+import sys
+from fdunet_client import FDUnetClient, FDUnetError
 
 # 服务器地址和端口
 addr = ('localhost', 12000)
-# 缓冲区大小
-buffer_size = 1024
 
-# 创建TCP套接字并连接到服务器
-c = socket(AF_INET, SOCK_STREAM)
-c.connect(addr)
+# 把文件的每一行作为一条请求，经连接池流水线发送，响应按行的顺序打印
+def pipeline(client, filename):
+    with open(filename, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    responses = client.send_many(lines)
+    for response in responses:
+        print('>>', response.start_line, response.body.decode())
+    if len(responses) < len(lines):
+        # 遇到 '#quit' 后服务器关闭连接，之后的行不再发送
+        print('>> connection closed by #quit')
 
-# 客户端主循环，持续接收用户输入并发送到服务器
-while True:
-    context = input(">>input:")  # 从用户获取输入
-    if context == '#quit':  # 输入 '#quit' 时退出循环并关闭连接
-        break
-    
-    # 格式化当前时间为GMT格式
-    GMT_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
-    time_now = datetime.now(timezone.utc).strftime(GMT_FORMAT)
+# 交互模式只需一个连接，请求之间复用同一个长连接
+client = FDUnetClient(addr, pool_size=1)
 
-    # 构建自定义的FDUnet协议报文
-    data = 'POST / 1.0\r\nDate: ' + time_now + '\r\n\r\n' + context
-    
-    # 将数据发送到服务器
-    c.sendall(data.encode())
-    
-    # 从服务器接收响应数据
-    data = c.recv(buffer_size).decode()
-    
-    # 打印服务器返回的数据
-    print('>>', data)
+try:
+    if len(sys.argv) > 1:
+        # 指定了文件时以流水线方式发送文件中的所有行
+        pipeline(client, sys.argv[1])
+    else:
+        # 客户端主循环，持续接收用户输入并发送到服务器
+        while True:
+            context = input(">>input:")  # 从用户获取输入
+            if context == '#quit':  # 输入 '#quit' 时退出循环并关闭连接
+                break
 
-# 关闭客户端的连接
-c.close()
+            # 发送请求并等待一条完整的响应报文
+            response = client.request(context)
+
+            # 打印服务器返回的数据
+            print('>>', response.start_line, response.body.decode())
+except FDUnetError as e:
+    print('>>', e)
+finally:
+    # 关闭客户端的连接
+    client.close()
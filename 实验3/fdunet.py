@@ -0,0 +1,130 @@
+import time
+
+# 格式化时间所用的GMT格式
+GMT_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
+# 报文头部的最大长度，超过仍未找到空行则视为非法报文
+MAX_HEADER_SIZE = 8192
+# 头部与数据之间的分隔
+HEADER_END = b'\r\n\r\n'
+
+# 最近一次格式化的 (秒, GMT时间字节串)，同一秒内的报文复用，不必每条都调用 strftime
+_date_cache = (None, b'')
+
+# 当前时间的GMT格式字节串
+def gmt_now():
+    global _date_cache
+    second = int(time.time())
+    if _date_cache[0] != second:
+        _date_cache = (second, time.strftime(GMT_FORMAT, time.gmtime(second)).encode())
+    return _date_cache[1]
+
+# 构建带 Content-Length 的FDUnet请求报文，数据按字节计长度
+def build_request(body):
+    if isinstance(body, str):
+        body = body.encode()
+    return b'POST / 1.0\r\nDate: %s\r\nContent-Length: %d\r\n\r\n%s' % (gmt_now(), len(body), body)
+
+# 构建FDUnet响应报文的头部，数据部分可以随后分块发送
+def build_response_head(code, length):
+    return b'1.0 %s\r\nDate: %s\r\nContent-Length: %d\r\n\r\n' % (code.encode(), gmt_now(), length)
+
+# 构建带 Content-Length 的FDUnet响应报文
+def build_response(code, body):
+    if isinstance(body, str):
+        body = body.encode()
+    return build_response_head(code, len(body)) + body
+
+# 一条完整的报文：起始行、头部字段（名称小写）和数据
+class Message:
+    def __init__(self, start_line, headers, body):
+        self.start_line = start_line
+        self.headers = headers
+        self.body = body
+
+    # 响应的状态码，如 200、501
+    @property
+    def code(self):
+        return int(self.start_line.split()[1])
+
+# 流式报文解析器：缓存不完整的头部，数据部分一到达就以分块形式交出，不等待整条报文，
+# 因此内存占用与报文长度无关。feed 返回事件列表：
+#   ('head', 起始行, 头部字段, 数据长度)  数据长度为 None 表示没有 Content-Length 的旧格式报文
+#   ('body', 数据分块)
+#   ('end',)
+# 旧格式报文无法判断数据何时结束，把当前已收到的剩余内容都当作数据
+class StreamParser:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.remaining = None  # 当前报文尚未收到的数据字节数，None表示正在等待头部
+
+    # 追加新收到的数据并返回解析出的事件；报文格式错误时抛出 ValueError
+    def feed(self, data):
+        self.buffer += data
+        events = []
+        while True:
+            if self.remaining is None:
+                head = self.parse_header()
+                if head is None:
+                    break
+                events.append(('head',) + head)
+                length = head[2]
+                if length is None:
+                    events.append(('body', bytes(self.buffer)))
+                    events.append(('end',))
+                    del self.buffer[:]
+                    continue
+                self.remaining = length
+            take = min(self.remaining, len(self.buffer))
+            if take:
+                events.append(('body', bytes(self.buffer[:take])))
+                del self.buffer[:take]
+                self.remaining -= take
+            if self.remaining:
+                break
+            events.append(('end',))
+            self.remaining = None
+        return events
+
+    # 从缓冲区中解析一个报文头部，头部尚不完整时返回 None
+    def parse_header(self):
+        end = self.buffer.find(HEADER_END)
+        if end == -1:
+            if len(self.buffer) > MAX_HEADER_SIZE:
+                raise ValueError('header too long')
+            return None
+        lines = self.buffer[:end].decode().split('\r\n')
+        del self.buffer[:end + len(HEADER_END)]
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise ValueError(f'malformed header line: {line!r}')
+            headers[name.strip().lower()] = value.strip()
+        length = None
+        if 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length < 0:
+                raise ValueError('negative Content-Length')
+        return lines[0], headers, length
+
+# 有状态的报文解析器：在 StreamParser 之上把数据分块拼成完整报文，
+# 缓存不完整的读取，把一次读到的多条报文拆开
+class MessageParser:
+    def __init__(self):
+        self.stream = StreamParser()
+        self.start_line = None
+        self.headers = None
+        self.body = bytearray()
+
+    # 追加新收到的数据，返回其中所有已完整的报文；报文格式错误时抛出 ValueError
+    def feed(self, data):
+        messages = []
+        for event in self.stream.feed(data):
+            if event[0] == 'head':
+                self.start_line, self.headers = event[1], event[2]
+            elif event[0] == 'body':
+                self.body += event[1]
+            else:
+                messages.append(Message(self.start_line, self.headers, bytes(self.body)))
+                self.body = bytearray()
+        return messages
@@ -0,0 +1,345 @@
+import asyncio
+import select
+import socket
+import threading
+from fdunet import MessageParser, build_request
+
+# 默认服务器地址
+DEFAULT_ADDRESS = ('localhost', 12000)
+# 读取响应的缓冲区大小
+buffer_size = 65536
+# 流水线发送时，一批请求最多累计的字节数，限制一次交换中缓存的请求和响应
+PIPELINE_BYTES = 256 * 1024
+# 每次写入套接字的最大字节数。服务器的待发送响应过多时会暂停读取，
+# 因此客户端边写边读，不能先把整批请求（或一条很长的请求）全部写完再读响应
+SEND_CHUNK = 65536
+
+# 服务器收到该消息后不再回应，发送完之前请求的响应后关闭连接
+QUIT = '#quit'
+
+# 请求在重试次数用完后仍然失败
+class FDUnetError(Exception):
+    pass
+
+def is_quit(body):
+    return body in (QUIT, QUIT.encode())
+
+# 截去 '#quit' 及其后的消息（服务器不会处理它们），返回剩余的消息和是否需要发送 '#quit'
+def split_quit(bodies):
+    bodies = list(bodies)
+    for i, body in enumerate(bodies):
+        if is_quit(body):
+            return bodies[:i], True
+    return bodies, False
+
+# 把请求按 PIPELINE_BYTES 切成若干批，每批在一个连接上一次写出
+def pipeline_batches(requests):
+    batch, size = [], 0
+    for request in requests:
+        if batch and size + len(request) > PIPELINE_BYTES:
+            yield batch
+            batch, size = [], 0
+        batch.append(request)
+        size += len(request)
+    if batch:
+        yield batch
+
+# 同步客户端的一个长连接
+class Connection:
+    def __init__(self, address, timeout):
+        self.sock = socket.create_connection(address, timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.parser = MessageParser()
+        self.pending = []  # 已读到但尚未取走的响应
+
+    # 分块写出所有请求，同时按顺序读取同样数量的响应
+    def exchange(self, requests):
+        data = memoryview(b''.join(requests))
+        sent = 0
+        responses = []
+        while len(responses) < len(requests):
+            if self.pending:
+                responses.append(self.pending.pop(0))
+                continue
+            writers = [self.sock] if sent < len(data) else []
+            readable, writable, _ = select.select([self.sock], writers, [], self.sock.gettimeout())
+            if not readable and not writable:
+                raise socket.timeout('timed out')
+            if writable:
+                sent += self.sock.send(data[sent:sent + SEND_CHUNK])
+            if readable:
+                chunk = self.sock.recv(buffer_size)
+                if not chunk:
+                    raise ConnectionError('connection closed by server')
+                self.pending.extend(self.parser.feed(chunk))
+        return responses
+
+    # 发送 '#quit' 并读到服务器关闭连接为止
+    def quit(self):
+        self.sock.sendall(build_request(QUIT))
+        while self.sock.recv(buffer_size):
+            pass
+
+    def close(self):
+        self.sock.close()
+
+# 有界连接池：空闲连接保持打开供后续请求复用，同时借出的连接数不超过 size
+class ConnectionPool:
+    def __init__(self, address, size, timeout):
+        self.address = address
+        self.timeout = timeout
+        self.idle = []  # 空闲连接，后进先出，优先复用最近用过的连接
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise FDUnetError('timed out waiting for a pooled connection')
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        try:
+            return Connection(self.address, self.timeout)
+        except OSError:
+            self.slots.release()
+            raise
+
+    # 归还连接；出错的连接直接关闭，不放回池中
+    def release(self, conn, broken=False):
+        if broken:
+            conn.close()
+        else:
+            with self.lock:
+                self.idle.append(conn)
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+# 同步FDUnet客户端：
+#     client = FDUnetClient(pool_size=4)
+#     client.request('Hello').body        -> b'hELLO'
+#     client.send_many(['a', 'B', 'c'])   -> 按顺序排列的响应
+# '#quit' 是结束消息：它之前的消息正常发送，然后在一个连接上单独发出 '#quit'，
+# 读到连接关闭为止；服务器不回应 '#quit'，因此没有对应的响应，也不重试
+# 连接池中的连接保持打开，单条请求在已有连接上只需一次写入；
+# 连接出错或超时时换用新连接重试（大小写转换请求是幂等的，重试安全）
+class FDUnetClient:
+    def __init__(self, address=DEFAULT_ADDRESS, pool_size=4, timeout=5.0, retries=2):
+        self.pool = ConnectionPool(address, pool_size, timeout)
+        self.pool_size = pool_size
+        self.retries = retries
+
+    # 在一个连接上流水线发送一批已编码的请求，失败时重试
+    def exchange(self, requests):
+        error = None
+        for _ in range(self.retries + 1):
+            conn = None
+            try:
+                # 建立连接失败（如服务器未启动或正在重启）与请求失败一样重试
+                conn = self.pool.acquire()
+                responses = conn.exchange(requests)
+            except (OSError, ValueError) as e:
+                if conn is not None:
+                    self.pool.release(conn, broken=True)
+                error = e
+                continue
+            self.pool.release(conn)
+            return responses
+        raise FDUnetError(f'request failed after {self.retries + 1} attempts: {error}')
+
+    # 发送一条消息并返回响应；消息为 '#quit' 时返回 None
+    def request(self, body):
+        if is_quit(body):
+            self.quit()
+            return None
+        return self.exchange([build_request(body)])[0]
+
+    # 在一个池连接上发送 '#quit'，该连接随后关闭
+    def quit(self):
+        conn = None
+        try:
+            conn = self.pool.acquire()
+            conn.quit()
+        except OSError as e:
+            raise FDUnetError(f'quit failed: {e}')
+        finally:
+            if conn is not None:
+                self.pool.release(conn, broken=True)
+
+    # 返回的响应与消息顺序一致；消息中有 '#quit' 时只返回它之前的消息的响应
+    def send_many(self, bodies):
+        bodies, quit = split_quit(bodies)
+        responses = self.send_all(bodies)
+        if quit:
+            self.quit()
+        return responses
+
+    # 把请求分成 pool_size 份，各自在一个池连接上按批流水线发送
+    def send_all(self, bodies):
+        requests = [build_request(body) for body in bodies]
+        shares = [requests[i::self.pool_size] for i in range(self.pool_size)]
+        results = [None] * self.pool_size
+        errors = []
+
+        def run(index):
+            try:
+                responses = []
+                for batch in pipeline_batches(shares[index]):
+                    responses.extend(self.exchange(batch))
+                results[index] = responses
+            except FDUnetError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(1, self.pool_size) if shares[i]]
+        for thread in threads:
+            thread.start()
+        run(0)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        # 第 i 条请求在第 i % pool_size 份中的第 i // pool_size 个位置
+        return [results[i % self.pool_size][i // self.pool_size] for i in range(len(requests))]
+
+    def close(self):
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+# asyncio客户端的一个长连接
+class AsyncConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.parser = MessageParser()
+        self.pending = []
+
+    @classmethod
+    async def open(cls, address):
+        reader, writer = await asyncio.open_connection(*address)
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return cls(reader, writer)
+
+    # 写入在单独的任务中分块进行，与读取响应并发；timeout 限制每次读写等待的时间而不是整个交换，
+    # 与同步客户端的套接字超时一致，很长的请求只要仍在进展就不会超时
+    async def exchange(self, requests, timeout=None):
+        data = memoryview(b''.join(requests))
+
+        async def send():
+            for start in range(0, len(data), SEND_CHUNK):
+                self.writer.write(data[start:start + SEND_CHUNK])
+                await asyncio.wait_for(self.writer.drain(), timeout)
+
+        sender = asyncio.ensure_future(send())
+        try:
+            responses = []
+            while len(responses) < len(requests):
+                if not self.pending:
+                    chunk = await asyncio.wait_for(self.reader.read(buffer_size), timeout)
+                    if not chunk:
+                        raise ConnectionError('connection closed by server')
+                    self.pending.extend(self.parser.feed(chunk))
+                    continue
+                responses.append(self.pending.pop(0))
+            await sender
+        finally:
+            sender.cancel()
+        return responses
+
+    async def quit(self, timeout=None):
+        self.writer.write(build_request(QUIT))
+        while await asyncio.wait_for(self.reader.read(buffer_size), timeout):
+            pass
+
+    def close(self):
+        self.writer.close()
+
+# asyncio版本的FDUnet客户端，接口与 FDUnetClient 相同，方法均为协程：
+#     async with AsyncFDUnetClient() as client:
+#         responses = await client.send_many(messages)
+class AsyncFDUnetClient:
+    def __init__(self, address=DEFAULT_ADDRESS, pool_size=4, timeout=5.0, retries=2):
+        self.address = address
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.idle = []
+        self.slots = asyncio.Semaphore(pool_size)
+
+    async def exchange(self, requests):
+        error = None
+        for _ in range(self.retries + 1):
+            async with self.slots:
+                conn = self.idle.pop() if self.idle else None
+                try:
+                    if conn is None:
+                        conn = await asyncio.wait_for(AsyncConnection.open(self.address), self.timeout)
+                    responses = await conn.exchange(requests, self.timeout)
+                except (OSError, ValueError, asyncio.TimeoutError) as e:
+                    if conn is not None:
+                        conn.close()
+                    error = e
+                    continue
+                self.idle.append(conn)
+                return responses
+        raise FDUnetError(f'request failed after {self.retries + 1} attempts: {error}')
+
+    async def request(self, body):
+        if is_quit(body):
+            await self.quit()
+            return None
+        return (await self.exchange([build_request(body)]))[0]
+
+    async def quit(self):
+        async with self.slots:
+            conn = self.idle.pop() if self.idle else None
+            try:
+                if conn is None:
+                    conn = await asyncio.wait_for(AsyncConnection.open(self.address), self.timeout)
+                await conn.quit(self.timeout)
+            except (OSError, asyncio.TimeoutError) as e:
+                raise FDUnetError(f'quit failed: {e}')
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    async def send_many(self, bodies):
+        bodies, quit = split_quit(bodies)
+        responses = await self.send_all(bodies)
+        if quit:
+            await self.quit()
+        return responses
+
+    async def send_all(self, bodies):
+        requests = [build_request(body) for body in bodies]
+        shares = [requests[i::self.pool_size] for i in range(self.pool_size)]
+
+        async def run(share):
+            responses = []
+            for batch in pipeline_batches(share):
+                responses.extend(await self.exchange(batch))
+            return responses
+
+        results = await asyncio.gather(*(run(share) for share in shares))
+        return [results[i % self.pool_size][i // self.pool_size] for i in range(len(requests))]
+
+    def close(self):
+        for conn in self.idle:
+            conn.close()
+        self.idle = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import deque
+from fdunet import MessageParser, build_request
+
+# 每个数量级内的子桶数（2的幂），决定直方图的相对精度：128个子桶约为1%
+SUB_BUCKET_BITS = 7
+# 报告的延迟分位数
+PERCENTILES = (50, 90, 99, 99.9)
+# 读取响应的缓冲区大小
+buffer_size = 65536
+# 默认的响应超时（秒）：超过该时间没有读到任何数据，连接上未完成的请求都记为超时
+RESPONSE_TIMEOUT = 5.0
+
+# HDR风格的对数-线性延迟直方图（单位微秒）：每个2的幂区间再等分为若干子桶，
+# 任何量级下的相对误差都不超过 1/2^SUB_BUCKET_BITS，桶数只随量级对数增长
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = {}  # 桶编号 -> 计数
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    @staticmethod
+    def bucket(value):
+        shift = max(0, value.bit_length() - SUB_BUCKET_BITS - 1)
+        return shift, value >> shift
+
+    def record(self, seconds):
+        value = max(1, int(seconds * 1e6))
+        key = self.bucket(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    # 返回给定分位数的延迟（微秒），取所在桶的上界
+    def percentile(self, p):
+        if not self.total:
+            return 0
+        rank = max(1, math.ceil(self.total * p / 100))
+        seen = 0
+        for shift, sub in sorted(self.counts):
+            seen += self.counts[(shift, sub)]
+            if seen >= rank:
+                return min(self.max, ((sub + 1) << shift) - 1)
+        return self.max
+
+    def summary(self):
+        result = {f'p{p:g}': self.percentile(p) for p in PERCENTILES}
+        result['min'] = self.min or 0
+        result['max'] = self.max
+        result['mean'] = self.sum / self.total if self.total else 0
+        return result
+
+# 解析负载大小分布：'N' 固定大小，'A-B' 均匀分布，'exp:M' 均值为M的指数分布
+def size_sampler(spec):
+    if spec.startswith('exp:'):
+        mean = float(spec[4:])
+        return lambda: max(1, int(random.expovariate(1 / mean)))
+    if '-' in spec:
+        low, high = (int(part) for part in spec.split('-', 1))
+        return lambda: random.randint(low, high)
+    size = int(spec)
+    return lambda: size
+
+# 负载生成器：在一个事件循环中维持多个连接。
+# 闭环模式下每个连接保持固定数量的未完成请求，收到响应再发下一条；
+# 开环模式下按目标速率定时发送，不等待响应，延迟从计划发送时刻算起，避免协同遗漏低估延迟
+class LoadGenerator:
+    def __init__(self, address, connections, duration, warmup, rate, depth, sampler, timeout=RESPONSE_TIMEOUT):
+        self.address = address
+        self.connections = connections
+        self.duration = duration
+        self.warmup = warmup
+        self.rate = rate  # 所有连接合计的请求速率（请求/秒），None表示闭环
+        self.depth = depth  # 闭环模式下每个连接的未完成请求数
+        self.sampler = sampler
+        self.timeout = timeout
+        self.histogram = LatencyHistogram()
+        self.completed = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors = 0
+        self.timeouts = 0  # 超时未收到响应的请求数，同时计入 errors
+        self.block = bytes(random.choice(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(256))
+
+    # 生成指定大小的负载（循环使用一段随机字母）
+    def payload(self):
+        size = self.sampler()
+        return (self.block * (size // len(self.block) + 1))[:size]
+
+    # 只统计预热结束之后完成的请求
+    def record(self, started, finished, sent, received):
+        if started < self.measure_start or finished > self.measure_end:
+            return
+        self.histogram.record(finished - started)
+        self.completed += 1
+        self.bytes_sent += sent
+        self.bytes_received += received
+
+    async def run_connection(self, index):
+        try:
+            reader, writer = await asyncio.open_connection(*self.address)
+        except OSError:
+            self.errors += 1
+            return
+        parser = MessageParser()
+        inflight = deque()  # (开始时间, 请求字节数)，响应按请求顺序返回
+        try:
+            if self.rate is None:
+                await self.closed_loop(reader, writer, parser, inflight)
+            else:
+                await self.open_loop(index, reader, writer, parser, inflight)
+        except asyncio.TimeoutError:
+            # 服务器停止响应：该连接上未完成的请求都记为超时，不让整个测试卡住
+            self.timeouts += len(inflight)
+            self.errors += len(inflight)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            self.errors += 1
+        finally:
+            writer.close()
+
+    async def closed_loop(self, reader, writer, parser, inflight):
+        for _ in range(self.depth):
+            self.send(writer, inflight, time.perf_counter())
+        while time.perf_counter() < self.measure_end:
+            for response in await self.receive(reader, parser, inflight):
+                started, sent = inflight.popleft()
+                self.record(started, time.perf_counter(), sent, len(response.body))
+                self.send(writer, inflight, time.perf_counter())
+
+    async def open_loop(self, index, reader, writer, parser, inflight):
+        interval = self.connections / self.rate
+        # 各连接的发送时刻错开，合起来是均匀的速率
+        next_send = self.start + interval * index / self.connections
+
+        async def receive_all():
+            while inflight or time.perf_counter() < self.measure_end:
+                for response in await self.receive(reader, parser, inflight):
+                    started, sent = inflight.popleft()
+                    self.record(started, time.perf_counter(), sent, len(response.body))
+
+        receiver = asyncio.ensure_future(receive_all())
+        while next_send < self.measure_end and not receiver.done():
+            delay = next_send - time.perf_counter()
+            # 落后于计划时也让出一次事件循环，避免接收任务得不到运行
+            await asyncio.sleep(max(0, delay))
+            self.send(writer, inflight, next_send)
+            next_send += interval
+        try:
+            await asyncio.wait_for(receiver, timeout=max(1.0, self.warmup))
+        except asyncio.TimeoutError:
+            self.timeouts += len(inflight)
+            self.errors += len(inflight)
+
+    def send(self, writer, inflight, started):
+        request = build_request(self.payload())
+        writer.write(request)
+        inflight.append((started, len(request)))
+
+    # 有未完成的请求时等待响应最多 self.timeout 秒
+    async def receive(self, reader, parser, inflight):
+        data = await asyncio.wait_for(reader.read(buffer_size), self.timeout if inflight else None)
+        if not data:
+            raise asyncio.IncompleteReadError(b'', None)
+        return parser.feed(data)
+
+    async def run(self):
+        self.start = time.perf_counter()
+        self.measure_start = self.start + self.warmup
+        self.measure_end = self.measure_start + self.duration
+        await asyncio.gather(*(self.run_connection(i) for i in range(self.connections)))
+
+    def report(self, label):
+        return {
+            'label': label,
+            'address': f'{self.address[0]}:{self.address[1]}',
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'mode': 'closed' if self.rate is None else 'open',
+            'connections': self.connections,
+            'depth': self.depth if self.rate is None else None,
+            'target_rate': self.rate,
+            'duration': self.duration,
+            'requests': self.completed,
+            'throughput': self.completed / self.duration,
+            'send_mbps': self.bytes_sent * 8 / self.duration / 1e6,
+            'receive_mbps': self.bytes_received * 8 / self.duration / 1e6,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'latency_us': self.histogram.summary(),
+        }
+
+def print_report(result):
+    latency = result['latency_us']
+    print(f"[{result['label']}] {result['address']} {result['mode']}-loop, {result['connections']} connections")
+    print(f"  requests: {result['requests']}, throughput: {result['throughput']:.0f} req/s, "
+          f"errors: {result['errors']} ({result['timeouts']} timeouts)")
+    print(f"  send {result['send_mbps']:.2f} Mbit/s, receive {result['receive_mbps']:.2f} Mbit/s")
+    print("  latency (us): " + ', '.join(f"{name} {latency[name]:.0f}" for name in
+                                          [f'p{p:g}' for p in PERCENTILES] + ['mean', 'max']))
+
+def print_comparison(results):
+    header = f"{'target':<16}{'req/s':>12}" + ''.join(f"{'p' + format(p, 'g'):>10}" for p in PERCENTILES)
+    print('\n' + header)
+    for result in results:
+        latency = result['latency_us']
+        print(f"{result['label']:<16}{result['throughput']:>12.0f}" +
+              ''.join(f"{latency['p' + format(p, 'g')]:>10}" for p in PERCENTILES))
+
+def main():
+    parser = argparse.ArgumentParser(description='load generator and latency benchmark for the FDUnet server')
+    parser.add_argument('--target', action='append', metavar='[LABEL=]HOST:PORT',
+                        help='server to benchmark; repeat to compare implementations (default localhost:12000)')
+    parser.add_argument('-c', '--connections', type=int, default=50, help='concurrent connections')
+    parser.add_argument('-d', '--duration', type=float, default=10, help='measured seconds per target')
+    parser.add_argument('--warmup', type=float, default=1, help='seconds excluded from the results')
+    parser.add_argument('--rate', type=float, help='open-loop total request rate (req/s); closed-loop when omitted')
+    parser.add_argument('--depth', type=int, default=1, help='closed-loop outstanding requests per connection')
+    parser.add_argument('--size', default='64', help="payload size: 'N', 'MIN-MAX' (uniform) or 'exp:MEAN'")
+    parser.add_argument('--timeout', type=float, default=RESPONSE_TIMEOUT,
+                        help='seconds without any response data before outstanding requests count as timed out')
+    parser.add_argument('--json', metavar='FILE', help='append one JSON result per target to FILE')
+    args = parser.parse_args()
+
+    results = []
+    for target in args.target or ['localhost:12000']:
+        label, _, hostport = target.rpartition('=')
+        host, port = hostport.rsplit(':', 1)
+        generator = LoadGenerator((host, int(port)), args.connections, args.duration, args.warmup,
+                                  args.rate, args.depth, size_sampler(args.size), args.timeout)
+        asyncio.run(generator.run())
+        result = generator.report(label or hostport)
+        result['size'] = args.size
+        print_report(result)
+        results.append(result)
+        if args.json:
+            with open(args.json, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+    if len(results) > 1:
+        print_comparison(results)
+
+if __name__ == '__main__':
+    main()
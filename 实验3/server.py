@@ -1,88 +1,546 @@
 from socket import *
-from threading import Thread
-from datetime import datetime, timezone
+from collections import Counter, OrderedDict
+import argparse
+import codecs
+import json
+import os
+import selectors
+import signal
+import sys
+import time
+import traceback
+from fdunet import StreamParser, build_response, build_response_head
 
-# 处理客户端连接的函数
-def servergo(client):
-    try:
+try:
+    import resource  # 仅类Unix系统提供，用于放宽文件描述符上限
+except ImportError:
+    resource = None
+
+# 服务器地址和端口
+addr = ('localhost', 12000)
+# 缓冲区大小：报文按 Content-Length 拆分，一次可以读取多条流水线请求，大报文按该大小分块处理
+buffer_size = 65536
+# 数据不超过该长度的请求先完整缓存再处理，以便识别空数据和 '#quit'；更长的请求边收边处理
+SMALL_BODY = len('#quit')
+# 待发送的响应超过该字节数时暂停读取该连接，直到客户端取走响应
+OUTBUF_LIMIT = 1024 * 1024
+# 同时保持的最大连接数，超过后新连接被立即关闭
+MAX_CONNECTIONS = 10000
+# 连接空闲超过该时间（秒）未收到数据则关闭
+IDLE_TIMEOUT = 60
+# 事件循环每次等待的最长时间（秒），同时决定空闲检查的粒度
+POLL_INTERVAL = 1.0
+# 收到 SIGTERM 后等待进行中的请求完成的最长时间（秒），超时后强制关闭剩余连接
+DRAIN_TIMEOUT = 30
+# 工作进程向主进程上报统计的间隔（秒）
+STATS_INTERVAL = 1.0
+# 工作进程启动后不到该时间（秒）就退出时，延迟 RESTART_DELAY 秒再重启，避免反复崩溃占满CPU
+MIN_UPTIME = 1.0
+RESTART_DELAY = 1.0
+
+# 单个客户端连接的状态：所有连接都在同一个线程中由事件循环轮流处理
+class Connection:
+    def __init__(self, sock, c_addr):
+        self.sock = sock
+        self.addr = c_addr
+        self.parser = StreamParser()  # 缓存不完整的头部，拆分一次读到的多条请求，数据分块交出
+        self.pending = None  # 需要完整缓存的短请求的数据；None表示当前请求正在流式处理
+        self.swapper = None  # 当前流式请求的大小写转换状态
+        self.outbuf = bytearray()  # 尚未发送出去的响应数据，按请求顺序排列
+        self.closing = False  # 收到 '#quit' 后，发送完剩余数据即关闭
+        self.events = selectors.EVENT_READ  # 当前在选择器中登记的事件
+        self.last_active = time.monotonic()
+
+# ASCII字母大小写互换的字节转换表
+ASCII_SWAP = bytes.maketrans(
+    b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ',
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+
+# 非ASCII字符的大小写互换表，按需填充。响应头部在处理数据前就已给出长度，
+# 因此只互换UTF-8编码长度不变的字符（如 ß→SS 这类会改变长度的保持原样）
+class UnicodeSwapTable(dict):
+    def __missing__(self, code):
+        char = chr(code)
+        swapped = char.swapcase()
+        if 0xD800 <= code <= 0xDFFF or len(swapped) != 1 or len(swapped.encode()) != len(char.encode()):
+            swapped = char
+        self[code] = swapped
+        return swapped
+
+UNICODE_SWAP = UnicodeSwapTable()
+
+# 逐块互换大小写：纯ASCII分块直接用字节转换表，其余分块经增量UTF-8解码后转换，
+# 跨分块边界的多字节字符由解码器缓存。输出与输入字节数始终相同
+class CaseSwapper:
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder('utf-8')('surrogateescape')
+
+    def feed(self, chunk):
+        if chunk.isascii() and not self.decoder.getstate()[0]:
+            return chunk.translate(ASCII_SWAP)
+        text = self.decoder.decode(chunk)
+        return text.translate(UNICODE_SWAP).encode('utf-8', 'surrogateescape')
+
+    def finish(self):
+        # 数据末尾不完整的多字节序列原样输出
+        return self.decoder.decode(b'', final=True).encode('utf-8', 'surrogateescape')
+
+# 处理一条缓存完整的短请求，返回响应；收到 '#quit' 时返回 None 表示断开连接
+def servergo(body):
+    code = '200 OK'
+
+    # 如果没有数据，则返回 501 Not Implemented
+    if not body:
+        code = '501 Not Implemented'
+
+    # 如果收到 '#quit' 则断开该客户端连接
+    if body == b'#quit':
+        return None
+
+    # 将消息中的字母大小写互换
+    swapper = CaseSwapper()
+    context = swapper.feed(body) + swapper.finish()
+
+    # 构建带 Content-Length 的响应报文
+    return build_response(code, context)
+
+# 放宽进程可打开的文件描述符数量，否则默认的1024个上限远低于 MAX_CONNECTIONS
+def raise_fd_limit():
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = MAX_CONNECTIONS + 64 if hard == resource.RLIM_INFINITY else min(hard, MAX_CONNECTIONS + 64)
+    if soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError) as e:
+            print(f"Cannot raise open file limit: {e}")
+
+# 创建非阻塞的监听套接字。reuseport 为真时设置 SO_REUSEPORT，
+# 多个进程各自绑定同一端口，由内核在它们之间分配新连接
+def create_listener(address, reuseport=False):
+    # 创建TCP套接字并设置SO_REUSEADDR选项，防止地址重用问题
+    listener = socket(AF_INET, SOCK_STREAM)
+    listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    if reuseport:
+        listener.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+
+    # 绑定服务器地址并开始监听连接，积压队列足够容纳大量同时到达的连接
+    listener.bind(address)
+    listener.listen(1024)
+    listener.setblocking(False)
+    return listener
+
+# 把统计格式化为一行文本
+def format_stats(stats):
+    return (f"accepted: {stats['accepted']}, rejected: {stats['rejected']}, active: {stats['active']}, "
+            f"requests: {stats['requests']}, in: {stats['bytes_in'] / 1e6:.2f} MB, out: {stats['bytes_out'] / 1e6:.2f} MB")
+
+# 事件驱动的服务器：单线程用 selectors 同时管理监听套接字和所有客户端连接。
+# 多进程模式下每个工作进程运行一个实例，listener 为从主进程继承的共享监听套接字，
+# stats_fd 为向主进程上报统计的管道
+class FDUnetServer:
+    def __init__(self, address, listener=None, reuseport=False, stats_fd=None):
+        self.address = address
+        self.selector = selectors.DefaultSelector()
+        # 按最近活动时间排序的连接，最久未活动的在最前面，便于检查空闲超时
+        self.connections = OrderedDict()
+        self.stats = Counter(accepted=0, rejected=0, requests=0, bytes_in=0, bytes_out=0)
+        self.stats_fd = stats_fd
+        self.last_report = 0
+        self.drain_deadline = None  # 开始优雅退出后为强制关闭的时刻
+
+        self.listener = create_listener(address, reuseport) if listener is None else listener
+        self.selector.register(self.listener, selectors.EVENT_READ, None)
+        if stats_fd is not None:
+            # 主进程来不及读取时丢弃本次上报，不阻塞事件循环
+            os.set_blocking(stats_fd, False)
+
+    # 接受所有已到达的连接请求
+    def accept(self):
         while True:
-            # 接收来自客户端的数据
-            message = client.recv(buffer_size)
-            if not message:  # 客户端断开连接
-                print("Client disconnected.")
+            try:
+                client, c_addr = self.listener.accept()
+            except BlockingIOError:
+                return
+            except OSError as e:
+                # 文件描述符耗尽等情况下暂停接受，等下一轮事件
+                print(f"An error occurred while accepting: {e}")
+                return
+            if len(self.connections) >= MAX_CONNECTIONS:
+                print("Too many connections, rejecting ", c_addr)
+                client.close()
+                self.stats['rejected'] += 1
+                continue
+            self.stats['accepted'] += 1
+            print("connecting to ", c_addr)
+            client.setblocking(False)
+            conn = Connection(client, c_addr)
+            self.connections[client] = conn
+            self.selector.register(client, selectors.EVENT_READ, conn)
+
+    # 读取客户端数据，依次处理其中的请求（流水线），响应按请求顺序排队；
+    # 长请求的数据每收到一块就转换一块并排入响应，不必等整条请求到齐
+    def read(self, conn):
+        try:
+            message = conn.sock.recv(buffer_size)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            print(f"An error occurred: {e}")
+            self.close(conn)
+            return
+        if not message:  # 客户端断开连接
+            print("Client disconnected.")
+            self.close(conn)
+            return
+        conn.last_active = time.monotonic()
+        self.connections.move_to_end(conn.sock)
+        self.stats['bytes_in'] += len(message)
+        try:
+            for event in conn.parser.feed(message):
+                if not self.handle_event(conn, event):
+                    # 收到 '#quit'，发送完之前请求的响应后关闭，之后的请求不再处理
+                    conn.closing = True
+                    break
+        except Exception as e:
+            # 捕获异常（包括报文格式错误）并打印错误信息
+            print(f"An error occurred: {e}")
+            self.close(conn)
+            return
+        self.flush(conn)
+
+    # 处理一个解析事件，收到 '#quit' 时返回 False
+    def handle_event(self, conn, event):
+        kind = event[0]
+        if kind == 'head':
+            length = event[3]
+            if length is None or length <= SMALL_BODY:
+                conn.pending = bytearray()
+            else:
+                # 长度已知且不可能是 '#quit'，先发出响应头部，数据随后逐块跟上
+                conn.pending = None
+                conn.swapper = CaseSwapper()
+                conn.outbuf += build_response_head('200 OK', length)
+        elif kind == 'body':
+            if conn.pending is not None:
+                conn.pending += event[1]
+            else:
+                conn.outbuf += conn.swapper.feed(event[1])
+        elif conn.pending is not None:
+            self.stats['requests'] += 1
+            response = servergo(bytes(conn.pending))
+            conn.pending = None
+            if response is None:
+                return False
+            conn.outbuf += response
+        else:
+            self.stats['requests'] += 1
+            conn.outbuf += conn.swapper.finish()
+            conn.swapper = None
+        return True
+
+    # 尽量发送排队的响应；发不完时等待套接字可写事件
+    def flush(self, conn):
+        while conn.outbuf:
+            try:
+                sent = conn.sock.send(conn.outbuf)
+            except (BlockingIOError, InterruptedError):
                 break
-            message = message.decode()
-            
-            # 分割报文，提取数据部分
-            message_list = message.split('\r\n')
-            data = message_list[-1]
-            code = '200 OK'
-            
-            # 如果没有数据，则返回 501 Not Implemented
-            if not data:
-                code = '501 Not Implemented'
-            
-            # 如果收到 '#quit' 则断开该客户端连接
-            if data == '#quit':
+            except OSError as e:
+                print(f"An error occurred: {e}")
+                self.close(conn)
+                return
+            del conn.outbuf[:sent]
+            self.stats['bytes_out'] += sent
+        if not conn.outbuf and conn.closing:
+            self.close(conn)
+            return
+        events = selectors.EVENT_READ | selectors.EVENT_WRITE if conn.outbuf else selectors.EVENT_READ
+        if conn.closing or len(conn.outbuf) > OUTBUF_LIMIT:
+            # 客户端不读取响应时不再读入新请求，避免响应无限堆积
+            events = selectors.EVENT_WRITE
+        if events != conn.events:
+            conn.events = events
+            self.selector.modify(conn.sock, events, conn)
+
+    # 关闭客户端连接
+    def close(self, conn):
+        if self.connections.pop(conn.sock, None) is None:
+            return
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+
+    # 关闭空闲超时的连接：连接按最近活动排序，只需从最前面检查
+    def expire_idle(self):
+        deadline = time.monotonic() - IDLE_TIMEOUT
+        while self.connections:
+            conn = next(iter(self.connections.values()))
+            if conn.last_active > deadline:
                 break
-            
-            # 将消息中的字母大小写互换
-            datalist = list(data)
-            for i in range(len(datalist)):
-                if datalist[i].isupper():
-                    datalist[i] = datalist[i].lower()
-                elif datalist[i].islower():
-                    datalist[i] = datalist[i].upper()
-            context = ''.join(datalist)
-            
-            # 格式化当前时间为GMT格式
-            GMT_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
-            time_now = datetime.now(timezone.utc).strftime(GMT_FORMAT)
-            
-            # 构建响应报文
-            response = '1.0 ' + code + '\r\nDate: ' + time_now + "\r\n\r\n" + context
-            
-            # 将响应发送回客户端
-            client.send(response.encode())
-    
-    except Exception as e:
-        # 捕获异常并打印错误信息
-        print(f"An error occurred: {e}")
-    
+            print("Idle timeout, closing ", conn.addr)
+            self.close(conn)
+
+    # 请求优雅退出（在 SIGTERM 处理函数中调用）：只记录时刻，由主循环停止接受新连接
+    def request_drain(self):
+        if self.drain_deadline is None:
+            self.drain_deadline = time.monotonic() + DRAIN_TIMEOUT
+
+    # 连接上没有未完成的请求，也没有待发送的响应
+    @staticmethod
+    def is_idle(conn):
+        return (not conn.outbuf and conn.pending is None and conn.swapper is None
+                and not conn.parser.buffer and conn.parser.remaining is None)
+
+    # 优雅退出期间：关闭监听套接字，关闭已处理完的连接；
+    # 所有连接都关闭或超过期限时返回 False
+    def drain(self):
+        if self.listener is not None:
+            print("Draining, no longer accepting connections")
+            self.selector.unregister(self.listener)
+            self.listener.close()
+            self.listener = None
+        for conn in [conn for conn in self.connections.values() if self.is_idle(conn)]:
+            self.close(conn)
+        return bool(self.connections) and time.monotonic() < self.drain_deadline
+
+    # 定期把统计写入上报管道，每次一行JSON，小于PIPE_BUF因此写入是原子的
+    def report_stats(self, force=False):
+        now = time.monotonic()
+        if self.stats_fd is None or (not force and now - self.last_report < STATS_INTERVAL):
+            return
+        self.last_report = now
+        line = json.dumps(dict(self.stats, active=len(self.connections))) + '\n'
+        try:
+            os.write(self.stats_fd, line.encode())
+        except OSError:
+            pass
+
+    # 服务器主循环，持续等待并分发套接字事件，开始优雅退出后在所有连接处理完时返回
+    def serve_forever(self):
+        print("listening on port", self.address[1])
+        while self.drain_deadline is None or self.drain():
+            for key, events in self.selector.select(POLL_INTERVAL):
+                if key.data is None:
+                    self.accept()
+                    continue
+                conn = key.data
+                if conn.sock not in self.connections:  # 本轮中已被关闭
+                    continue
+                if events & selectors.EVENT_WRITE:
+                    self.flush(conn)
+                if events & selectors.EVENT_READ and conn.sock in self.connections and not conn.closing:
+                    self.read(conn)
+            self.expire_idle()
+            self.report_stats()
+        self.report_stats(force=True)
+
+    def shutdown(self):
+        for conn in list(self.connections.values()):
+            self.close(conn)
+        self.selector.close()
+        if self.listener is not None:
+            self.listener.close()
+
+# 工作进程的入口：SIGTERM 触发优雅退出，Ctrl+C 由主进程统一处理，返回进程退出码
+def run_worker(address, listener, stats_fd):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    try:
+        server = FDUnetServer(address, listener, reuseport=listener is None, stats_fd=stats_fd)
+    except OSError as e:
+        print(f"Worker {os.getpid()} cannot listen: {e}")
+        return 1
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.request_drain())
+    try:
+        server.serve_forever()
+    except Exception:
+        traceback.print_exc()
+        return 1
     finally:
-        # 关闭客户端连接
-        client.close()
+        server.shutdown()
+    return 0
 
-# 服务器地址和端口
-addr = ('localhost', 12000)
-# 缓冲区大小
-buffer_size = 1024
+# 主进程所见的一个工作进程
+class Worker:
+    def __init__(self, pid, fd):
+        self.pid = pid
+        self.fd = fd  # 统计管道的读端，工作进程退出后为 None
+        self.started = time.monotonic()
+        self.buffer = b''
+        self.stats = Counter()  # 最近一次上报的统计
 
-# 创建TCP套接字并设置SO_REUSEADDR选项，防止地址重用问题
-s = socket(AF_INET, SOCK_STREAM)
-s.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+# 预派生（pre-fork）多进程服务器的主进程：启动若干工作进程，各自运行完整的事件循环，
+# 从而绕过GIL让大报文的大小写转换利用多个CPU核心。主进程本身不处理连接，只负责
+# 重启意外退出的工作进程、在 SIGTERM/Ctrl+C 时通知所有工作进程优雅退出，以及汇总统计（SIGUSR1 打印）
+class Supervisor:
+    def __init__(self, address, count, reuseport=False):
+        self.address = address
+        self.count = count
+        # 共享模式下在 fork 之前创建监听套接字，所有工作进程继承并在同一个套接字上接受连接；
+        # SO_REUSEPORT 模式下由每个工作进程自己绑定
+        self.listener = None if reuseport else create_listener(address)
+        self.selector = selectors.DefaultSelector()
+        self.workers = {}  # pid -> Worker
+        self.retired = Counter()  # 已退出工作进程的最后统计
+        self.restarts = 0
+        self.respawn_at = []  # 等待重启的时刻
+        self.stop_deadline = None  # 开始退出后，超过该时刻仍未退出的工作进程被强制结束
+        self.report_requested = False
 
-# 绑定服务器地址并开始监听连接
-s.bind(addr)
-s.listen(5)
+    def spawn(self):
+        read_fd, write_fd = os.pipe()
+        sys.stdout.flush()  # 避免子进程重复输出父进程缓冲区中的内容
+        pid = os.fork()
+        if pid == 0:
+            # 子进程无论如何都要在这里退出，不能带着异常回到父进程的监控循环
+            code = 1
+            try:
+                os.close(read_fd)
+                for worker in self.workers.values():
+                    if worker.fd is not None:  # 已读到EOF、尚未回收的工作进程
+                        os.close(worker.fd)
+                code = run_worker(self.address, self.listener, write_fd)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                try:
+                    sys.stdout.flush()
+                finally:
+                    os._exit(code)
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        worker = Worker(pid, read_fd)
+        self.workers[pid] = worker
+        self.selector.register(read_fd, selectors.EVENT_READ, worker)
 
-# 服务器主循环，持续等待客户端连接
-try:
-    while True:
-        print("listening on port 12000")
-        
-        # 接受客户端连接请求
-        client, c_addr = s.accept()
-        print("connecting to ", c_addr)
-        
-        # 为每个连接创建一个新的线程处理
-        t = Thread(target=servergo, args=(client,))
-        t.start()
-
-except KeyboardInterrupt:
-    # 捕获 Ctrl+C 终止信号并优雅地关闭服务器
-    print("\nServer interrupted by user. Shut down.")
-
-finally:
-    # 关闭服务器套接字
-    s.close()
+    # 读取工作进程上报的统计，只保留最后一行完整的记录
+    def read_stats(self, worker):
+        try:
+            data = os.read(worker.fd, 65536)
+        except BlockingIOError:
+            return
+        if not data:
+            self.selector.unregister(worker.fd)
+            os.close(worker.fd)
+            worker.fd = None
+            return
+        lines = (worker.buffer + data).split(b'\n')
+        worker.buffer = lines.pop()
+        if lines:
+            worker.stats = Counter(json.loads(lines[-1]))
+
+    # 回收已退出的工作进程，未在退出过程中时安排重启
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            if worker.fd is not None:
+                self.read_stats(worker)
+            if worker.fd is not None:
+                self.selector.unregister(worker.fd)
+                os.close(worker.fd)
+            worker.stats.pop('active', None)
+            self.retired.update(worker.stats)
+            if self.stop_deadline is None:
+                code = os.waitstatus_to_exitcode(status)
+                print(f"Worker {pid} exited with status {code}, restarting")
+                self.restarts += 1
+                delay = RESTART_DELAY if time.monotonic() - worker.started < MIN_UPTIME else 0
+                self.respawn_at.append(time.monotonic() + delay)
+
+    # SIGTERM/SIGINT 处理函数：通知所有工作进程优雅退出
+    def stop(self, signum=None, frame=None):
+        if self.stop_deadline is not None:
+            return
+        print("\nShutting down, draining workers")
+        self.stop_deadline = time.monotonic() + DRAIN_TIMEOUT + 5
+        self.respawn_at = []
+        if self.listener is not None:
+            # 主进程不再持有监听套接字，工作进程都关闭后新连接会被拒绝
+            self.listener.close()
+            self.listener = None
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+
+    # 所有工作进程的统计之和，包括已退出的工作进程
+    def total_stats(self):
+        total = Counter(self.retired)
+        for worker in self.workers.values():
+            total.update(worker.stats)
+        total['active'] = sum(worker.stats['active'] for worker in self.workers.values())
+        return total
+
+    def print_stats(self):
+        print(f"workers: {len(self.workers)}, restarts: {self.restarts}, {format_stats(self.total_stats())}")
+        for worker in self.workers.values():
+            if worker.stats:
+                print(f"  worker {worker.pid}: {format_stats(worker.stats)}")
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGUSR1, lambda signum, frame: setattr(self, 'report_requested', True))
+        for _ in range(self.count):
+            self.spawn()
+        mode = 'SO_REUSEPORT' if self.listener is None else 'shared listener'
+        print(f"Supervisor {os.getpid()} started {self.count} workers ({mode}) on port {self.address[1]}")
+        while self.workers or self.respawn_at:
+            for key, _ in self.selector.select(POLL_INTERVAL):
+                self.read_stats(key.data)
+            self.reap()
+            now = time.monotonic()
+            for when in [when for when in self.respawn_at if when <= now]:
+                self.respawn_at.remove(when)
+                self.spawn()
+            if self.stop_deadline is not None and now > self.stop_deadline:
+                for pid in self.workers:
+                    print(f"Worker {pid} did not exit in time, killing")
+                    os.kill(pid, signal.SIGKILL)
+                self.stop_deadline = float('inf')
+            if self.report_requested:
+                self.report_requested = False
+                self.print_stats()
+        self.print_stats()
+        self.selector.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='FDUnet case-swapping server')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='worker processes; 0 starts one per CPU core (default: 1, single process)')
+    parser.add_argument('--reuseport', action='store_true',
+                        help='let each worker bind its own SO_REUSEPORT socket instead of sharing one listener')
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1 and not hasattr(os, 'fork'):
+        parser.error('--workers requires a platform with fork()')
+    if args.reuseport and 'SO_REUSEPORT' not in globals():
+        parser.error('SO_REUSEPORT is not available on this platform')
+
+    raise_fd_limit()
+    if workers > 1:
+        Supervisor(addr, workers, args.reuseport).run()
+        return
+
+    server = FDUnetServer(addr, reuseport=args.reuseport)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.request_drain())
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        # 捕获 Ctrl+C 终止信号并优雅地关闭服务器
+        print("\nServer interrupted by user. Shut down.")
+    finally:
+        # 关闭所有连接和服务器套接字
+        print(format_stats(dict(server.stats, active=len(server.connections))))
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
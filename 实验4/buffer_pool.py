@@ -0,0 +1,25 @@
+from collections import deque
+
+RECV_BUFFER_SIZE = 4096  # 单个接收缓冲区大小，足以容纳一个完整数据包
+POOL_SIZE = 256  # 预分配的缓冲区数量
+
+class BufferPool:
+    """可复用的接收缓冲区池，配合 recvfrom_into / recvmsg_into 使用，避免每个数据报分配新的 bytes"""
+    def __init__(self, count=POOL_SIZE, size=RECV_BUFFER_SIZE):
+        self.size = size  # 缓冲区大小
+        self.free = deque(bytearray(size) for _ in range(count))  # 空闲缓冲区（deque 的 append/pop 是线程安全的）
+        self.allocated = count  # 累计分配的缓冲区数量
+        self.max_free = count  # 归还时最多保留的空闲缓冲区数量
+
+    def acquire(self):
+        """取出一个空闲缓冲区；池已耗尽时临时分配新缓冲区而不是阻塞接收循环"""
+        try:
+            return self.free.pop()
+        except IndexError:
+            self.allocated += 1
+            return bytearray(self.size)
+
+    def release(self, buf):
+        """负载写入或哈希完成后归还缓冲区"""
+        if buf is not None and len(self.free) < self.max_free:
+            self.free.append(buf)
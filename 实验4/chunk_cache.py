@@ -0,0 +1,94 @@
+import os
+import threading
+import hashlib
+from collections import OrderedDict
+from packet import MSS
+from profiler import PROFILER
+
+DEFAULT_CACHE_BUDGET = 256 * 1024 * 1024  # 默认内存预算（字节）
+
+class CachedFile:
+    """一个文件按MSS切好的分块及其预先计算的MD5，由所有并发的FileSender共享且只读"""
+    def __init__(self, chunks, md5_value):
+        self.chunks = chunks  # 分块列表
+        self.md5_value = md5_value  # 十六进制MD5
+        self.size = sum(len(chunk) for chunk in chunks)  # 文件大小
+
+class ChunkCache:
+    """服务器范围的文件分块缓存，按 (路径, mtime, 大小) 为键，超过内存预算时按LRU淘汰"""
+    def __init__(self, budget=DEFAULT_CACHE_BUDGET):
+        self.budget = budget  # 内存预算（字节）
+        self.entries = OrderedDict()  # 键 -> CachedFile，按最近使用排序
+        self.loading = {}  # 键 -> 正在读取该文件的线程等待的事件
+        self.used = 0  # 已缓存的字节数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, filename):
+        """返回文件的 CachedFile；同一文件的并发请求只读盘和计算哈希一次。文件不存在时抛出 FileNotFoundError"""
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_mtime_ns, stat.st_size)
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                event = self.loading.get(key)
+                if event is None:
+                    self.misses += 1
+                    event = self.loading[key] = threading.Event()
+                    break
+            # 其他线程正在读取同一文件，等它完成后再查一次缓存
+            event.wait()
+
+        try:
+            entry = self.load(filename)
+            with self.lock:
+                self.insert(key, entry)
+            return entry
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+
+    def load(self, filename):
+        chunks = []
+        md5_hash = hashlib.md5()
+        with open(filename, 'rb') as f:
+            while True:
+                with PROFILER.phase('file read'):
+                    chunk = f.read(MSS)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                with PROFILER.phase('hash'):
+                    md5_hash.update(chunk)
+        return CachedFile(chunks, md5_hash.hexdigest())
+
+    def insert(self, key, entry):
+        if entry.size > self.budget:
+            return  # 超过整个预算的文件不缓存，仅供本次请求使用
+        # 同一路径的旧版本（mtime/大小已变化）不会再被命中，直接移除
+        for old_key in [k for k in self.entries if k[0] == key[0]]:
+            self.used -= self.entries.pop(old_key).size
+        while self.entries and self.used + entry.size > self.budget:
+            _, evicted = self.entries.popitem(last=False)
+            self.used -= evicted.size
+            self.evictions += 1
+        self.entries[key] = entry
+        self.used += entry.size
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.used,
+                'budget': self.budget,
+            }
@@ -4,22 +4,46 @@ import time
 import socket
 import hashlib
 import os
+import struct
 import traceback
-from packet import Packet, FLAG_DATA, FLAG_ACK, FLAG_FIN, FLAG_REQ, FLAG_MD5, MSS
+import random
+from packet import Packet, FLAG_DATA, FLAG_ACK, FLAG_FIN, FLAG_REQ, FLAG_MD5, FLAG_RESULT, FLAG_FILE, FLAG_PARITY, FLAG_NACK, FLAG_JOIN, NACK_RANGE_FORMAT, MSS, timestamp, elapsed_since
+from fec import FecDecoder, make_parity, group_size_for_loss, MAX_GROUP_SIZE
+from buffer_pool import BufferPool, RECV_BUFFER_SIZE
+from window import SendWindow
+from socket_tuning import DropCounter, tune_socket, buffer_size_for_bdp, DEFAULT_BANDWIDTH, DEFAULT_RTT
+from mux import Multiplexer
+from path_cache import PathMetricsCache, warm_start
+from profiler import PROFILER, add_profile_arguments, enable_from_args
 from queue import Queue
 
 SERVER_PORT = 12345
+JOIN_RETRY_INTERVAL = 1.0  # 分发模式下未收到数据时重发加入请求的间隔（秒）
+DISTRIBUTION_LINGER = 1.0  # 分发模式下报告完成后继续应答轮询的时间（秒）
+MAX_JOIN_RETRIES = 10  # 分发模式下加入请求最多重发的次数，之后放弃下载
+MAX_NACK_RANGES = 256  # 单个NACK最多携带的缺失区间数
 
 class ReliableUDPClient:
-    def __init__(self, server_ip, filename, protocol, congestion_control, operation):
+    def __init__(self, server_ip, filename, protocol, congestion_control, operation, session_files=None, fec=False,
+                 distribution=False, rcvbuf=None, sndbuf=None, mux=None, path_cache=None):
         self.server_address = (server_ip, SERVER_PORT)
         self.filename = filename
+        self.session_files = session_files  # 会话模式：在同一个套接字和拥塞窗口上连续上传的多个文件
         self.protocol = protocol
         self.congestion_control = congestion_control
         self.operation = operation
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # 随机的非零连接ID，服务器据此区分同一端点上的多个传输，并在客户端地址变化后继续识别连接
+        self.conn_id = random.getrandbits(32) or 1
+        if mux is None:
+            self.sock = PROFILER.wrap_socket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+            tune_socket(self.sock, rcvbuf, sndbuf)
+            self.drops = DropCounter(self.sock)
+        else:
+            # 与其他传输共享一个套接字，Channel 同时提供收发接口和丢包报告
+            self.sock = mux.open_channel(self.conn_id)
+            self.drops = self.sock
         self.sock.settimeout(0.1)
-        self.lock = threading.Lock()
+        self.lock = PROFILER.wrap_lock(threading.Lock())
         self.running = True
         self.md5_verified = False
         self.transfer_complete = False  
@@ -29,44 +53,98 @@ class ReliableUDPClient:
         self.queue = Queue()
         self.md5_received = False
         self.md5_timer = None
+        self.pool = BufferPool() if mux is None else mux.pool  # 多路复用时直接使用接收线程填好的缓冲区
+        self.fec = fec  # 上传时是否发送异或校验包
+        self.fec_decoder = None  # 下载时创建，收到校验包后开始缓存分组，用于恢复丢失的数据包
+        self.distribution = distribution  # 下载时是否加入一对多分发
+        self.path_cache = path_cache  # 上传时用于热启动的路径测量值缓存
 
         if self.operation == 'upload':
-            self.file_data = self.read_file()
+            self.file_headers = {}  # 文件头分组序列号 -> (文件名, MD5)
+            self.file_results = {}  # 文件名 -> 服务器确认的MD5是否一致
+            if self.session_files:
+                self.session_md5 = hashlib.md5()
+                self.file_data = self.read_session()
+            else:
+                self.file_data = self.read_file()
             self.total_packets = len(self.file_data)
             self.base = 0
             self.next_seq_num = 0
             self.window_size = 1  
             self.ssthresh = 16
-            self.timers = {}
-            self.ack_received = {}
-            self.RTT_times = {}
+            self.window = SendWindow()  # 在途分组的发送时间、确认标志、重传次数和定时器
             self.alpha = 0.125  # For RTT estimation
             self.beta = 0.25    # For RTT estimation
             self.estimated_RTT = 0.1
             self.dev_RTT = 0.05
             self.timeout_interval = 1.0
+            self.fec_group_start = 0  # 当前校验组的首个序列号
+            self.fec_group_size = MAX_GROUP_SIZE
+            self.fec_highest_sent = -1  # 首次发送过的最大序列号，重传不参与分组
+            metrics = path_cache.lookup(server_ip) if path_cache is not None else None
+            if metrics is not None:
+                loss = warm_start(self, metrics, self.window_size)
+                if loss > 0:
+                    self.fec_group_size = group_size_for_loss(loss)
+                print(f"Warm start for {server_ip}: window {self.window_size}, ssthresh {self.ssthresh}, "
+                      f"RTT {self.estimated_RTT:.4f}s, RTO {self.timeout_interval:.4f}s")
 
             self.total_data_sent = 0  # Total data sent (including retransmissions)
             self.start_time = None
             self.end_time = None
         elif self.operation == 'download':
             self.file = open(f"downloaded_{self.filename}", 'wb')
-
-    def read_file(self):
+            self.fec_decoder = FecDecoder()
+            if self.distribution:
+                self.total_packets = None  # 由第一个数据包或轮询得知
+                self.received_map = None  # 每个序列号一个字节，1表示已收到
+                self.received_count = 0
+                self.last_join = 0
+                self.join_retries = 0
+                self.last_poll = None
+
+    def read_file(self, filename=None):
+        filename = filename or self.filename
         data = []
         try:
-            with open(self.filename, 'rb') as f:
+            with open(filename, 'rb') as f:
                 while True:
-                    chunk = f.read(MSS)
+                    with PROFILER.phase('file read'):
+                        chunk = f.read(MSS)
                     if not chunk:
                         break
                     data.append(chunk)
         except FileNotFoundError:
-            print(f"File '{self.filename}' not found.")
+            print(f"File '{filename}' not found.")
             data = []
         return data
 
+    def read_session(self):
+        """将会话中的文件依次拼接到同一序列号空间，每个文件前插入一个FLAG_FILE头分组"""
+        data = []
+        for filename in self.session_files:
+            if not os.path.isfile(filename):
+                print(f"File '{filename}' not found, skipping.")
+                continue
+            chunks = self.read_file(filename)
+            md5 = hashlib.md5()
+            for chunk in chunks:
+                md5.update(chunk)
+                self.session_md5.update(chunk)
+            self.file_headers[len(data)] = (filename, md5.hexdigest())
+            data.append(f"{len(chunks)}\n{os.path.basename(filename)}".encode('utf-8'))
+            data.extend(chunks)
+        return data
+
+    def make_packet(self, seq_num):
+        flags = FLAG_FILE if seq_num in self.file_headers else FLAG_DATA
+        return Packet(seq_num=seq_num, flags=flags, payload=self.file_data[seq_num], ts_val=timestamp(), conn_id=self.conn_id)
+
     def compute_md5(self):
+        with PROFILER.phase('hash'):
+            return self.hash_file()
+
+    def hash_file(self):
         md5 = hashlib.md5()
         if self.operation == 'upload':
             try:
@@ -116,17 +194,17 @@ class ReliableUDPClient:
         while self.running:
             self.lock.acquire()
             while self.next_seq_num < self.base + self.window_size and self.next_seq_num < self.total_packets:
-                if self.next_seq_num not in self.ack_received:
-                    payload = self.file_data[self.next_seq_num]
-                    packet = Packet(seq_num=self.next_seq_num, payload=payload)
+                if not self.window.is_acked(self.next_seq_num):
+                    packet = self.make_packet(self.next_seq_num)
                     self.sock.sendto(packet.to_bytes(), self.server_address)
                     send_time = time.time()
-                    self.RTT_times[self.next_seq_num] = send_time
+                    self.window.record_send(self.next_seq_num, send_time)
                     self.total_data_sent += len(packet.to_bytes())
                     print(f"Sent packet {self.next_seq_num}")
+                    self.send_parity_if_due(self.next_seq_num)
                     if self.protocol == 'SR':
                         timer = threading.Timer(self.timeout_interval, self.handle_timeout, [self.next_seq_num])
-                        self.timers[self.next_seq_num] = timer
+                        self.window.set_timer(self.next_seq_num, timer)
                         timer.start()
                     elif self.protocol == 'GBN' and self.base == self.next_seq_num:
                         self.start_timer()
@@ -134,37 +212,59 @@ class ReliableUDPClient:
             self.lock.release()
             time.sleep(0.01)
 
+    def send_parity_if_due(self, seq_num):
+        """首次发送完一组数据包后追加一个校验包，组大小随测得的丢包率调整"""
+        if not self.fec or seq_num <= self.fec_highest_sent:
+            return
+        self.fec_highest_sent = seq_num
+        end = seq_num + 1
+        if end - self.fec_group_start < self.fec_group_size and end < self.total_packets:
+            return
+        group = [(FLAG_FILE if seq in self.file_headers else FLAG_DATA, self.file_data[seq])
+                 for seq in range(self.fec_group_start, end)]
+        parity = make_parity(self.fec_group_start, group)
+        parity.conn_id = self.conn_id
+        self.sock.sendto(parity.to_bytes(), self.server_address)
+        self.total_data_sent += len(parity.to_bytes())
+        self.fec_group_start = end
+        # 以需要重传的分组占比估计丢包率
+        self.fec_group_size = group_size_for_loss(self.window.retransmitted / end)
+
     def receive_acks(self):
         fin_sent_time = None
         MIN_TIMEOUT = 0.5  
         MAX_TIMEOUT = 5.0  
+        buf = bytearray(RECV_BUFFER_SIZE)  # ACK在本线程内处理完毕，单个缓冲区即可反复复用
+        view = memoryview(buf)
 
         while self.running:
             try:
-                data, _ = self.sock.recvfrom(1024)
-                ack_packet = Packet.from_bytes(data)
+                nbytes, _ = self.drops.receive_into(buf)
+                ack_packet = Packet.from_bytes(view[:nbytes])
                 base_before = self.base  
-                if ack_packet.flags == FLAG_ACK:
+                if ack_packet.flags == FLAG_ACK and ack_packet.ack_num >= self.window.sent_end:
+                    # 确认尚未发送的分组的ACK（伪造或错乱的报文）直接丢弃
+                    print(f"Ignored ACK {ack_packet.ack_num} beyond sent packets")
+                elif ack_packet.flags == FLAG_ACK:
                     self.lock.acquire()
                     ack_num = ack_packet.ack_num
-                    if ack_num in self.RTT_times:
-                        sample_RTT = time.time() - self.RTT_times[ack_num]
-                        self.estimated_RTT = (1 - self.alpha) * self.estimated_RTT + self.alpha * sample_RTT
-                        self.dev_RTT = (1 - self.beta) * self.dev_RTT + self.beta * abs(sample_RTT - self.estimated_RTT)
-                        self.timeout_interval = self.estimated_RTT + 4 * self.dev_RTT
+                    sample_RTT = self.sample_rtt(ack_packet)
+                    if sample_RTT is not None:
+                        self.update_rtt(sample_RTT)
                         self.timeout_interval = max(MIN_TIMEOUT, min(self.timeout_interval, MAX_TIMEOUT))
 
 
-                    self.ack_received[ack_num] = True
-                    if ack_num in self.timers:
-                        self.timers[ack_num].cancel()
-                        del self.timers[ack_num]
+                    self.window.mark_acked(ack_num)
+                    timer = self.window.pop_timer(ack_num)
+                    if timer is not None:
+                        timer.cancel()
 
                     if self.protocol == 'SR':
-                        while self.ack_received.get(self.base, False):
+                        while self.window.is_acked(self.base) and self.base < self.total_packets:
                             self.base += 1
                     elif ack_num >= self.base:
                         self.base = ack_num + 1
+                    self.window.advance(self.base)
 
                     base_after = self.base
                     base_moved = base_after > base_before  
@@ -181,17 +281,19 @@ class ReliableUDPClient:
 
                     if self.base >= self.total_packets and not self.transfer_complete:
                         print("All packets ACKed. Sending FIN.")
-                        fin_packet = Packet(flags=FLAG_FIN)
+                        fin_packet = Packet(flags=FLAG_FIN, conn_id=self.conn_id)
                         self.sock.sendto(fin_packet.to_bytes(), self.server_address)
                         self.transfer_complete = True
                         fin_sent_time = time.time()
                         self.start_md5_timer()
                     self.lock.release()
+                elif ack_packet.flags == FLAG_RESULT:
+                    self.handle_file_result(ack_packet)
                 elif ack_packet.flags == FLAG_MD5:
                     self.md5_received = True
                     if self.md5_timer is not None:
                         self.md5_timer.cancel()
-                    md5_value = ack_packet.payload.decode('utf-8')
+                    md5_value = bytes(ack_packet.payload).decode('utf-8')
                     self.compare_md5(md5_value)
                     self.running = False
 
@@ -203,7 +305,7 @@ class ReliableUDPClient:
             except socket.timeout:
                 if self.transfer_complete and not self.md5_received:
                     print("MD5 packet not received, resending FIN to request MD5.")
-                    fin_packet = Packet(flags=FLAG_FIN)
+                    fin_packet = Packet(flags=FLAG_FIN, conn_id=self.conn_id)
                     self.sock.sendto(fin_packet.to_bytes(), self.server_address)
                     self.start_md5_timer()
                 continue
@@ -213,6 +315,32 @@ class ReliableUDPClient:
                 print(f"An error occurred while receiving ACKs: {e}")
                 traceback.print_exc()
 
+    def handle_file_result(self, packet):
+        """会话模式下服务器对单个文件的异步确认，后续文件的传输不受影响"""
+        if packet.ack_num not in self.file_headers:
+            return
+        filename, local_md5 = self.file_headers[packet.ack_num]
+        if filename in self.file_results:
+            return
+        matched = bytes(packet.payload).decode('utf-8') == local_md5
+        self.file_results[filename] = matched
+        print(f"File '{filename}' {'verified' if matched else 'MD5 mismatch'} by server.")
+
+    def sample_rtt(self, ack_packet):
+        """优先使用ACK回显的时间戳测量RTT；无回显时按Karn算法跳过重传过的分组"""
+        if ack_packet.ts_ecr:
+            return elapsed_since(ack_packet.ts_ecr)
+        ack_num = ack_packet.ack_num
+        send_time = self.window.sent_time(ack_num)
+        if send_time is not None and not self.window.retransmissions(ack_num):
+            return time.time() - send_time
+        return None
+
+    def update_rtt(self, sample_RTT):
+        self.estimated_RTT = (1 - self.alpha) * self.estimated_RTT + self.alpha * sample_RTT
+        self.dev_RTT = (1 - self.beta) * self.dev_RTT + self.beta * abs(sample_RTT - self.estimated_RTT)
+        self.timeout_interval = self.estimated_RTT + 4 * self.dev_RTT
+
     def start_md5_timer(self):
         if self.md5_timer is not None:
             self.md5_timer.cancel()
@@ -221,7 +349,7 @@ class ReliableUDPClient:
 
     def resend_fin_for_md5(self):
         print("Resending FIN to request MD5 checksum.")
-        fin_packet = Packet(flags=FLAG_FIN)
+        fin_packet = Packet(flags=FLAG_FIN, conn_id=self.conn_id)
         self.sock.sendto(fin_packet.to_bytes(), self.server_address)
 
     def start_timer(self):
@@ -245,12 +373,13 @@ class ReliableUDPClient:
             self.start_timer()
         if self.protocol == 'SR' and seq_num is not None:
             if seq_num < self.total_packets:
-                packet = Packet(seq_num=seq_num, payload=self.file_data[seq_num])
+                packet = self.make_packet(seq_num)
                 self.sock.sendto(packet.to_bytes(), self.server_address)
+                self.window.record_send(seq_num, time.time())
                 self.total_data_sent += len(packet.to_bytes())
                 print(f"Resent packet {seq_num}")
                 timer = threading.Timer(self.timeout_interval, self.handle_timeout, [seq_num])
-                self.timers[seq_num] = timer
+                self.window.set_timer(seq_num, timer)
                 timer.start()
         self.lock.release()
 
@@ -278,19 +407,25 @@ class ReliableUDPClient:
         self.end_time = time.time()
         if hasattr(self, 'timer') and self.timer is not None:
             self.timer.cancel()
-        for timer in self.timers.values():
+        for timer in self.window.all_timers():
             timer.cancel()
         self.sock.close()
         print("File upload completed.")
 
+        if self.session_files:
+            for filename, _ in self.file_headers.values():
+                status = {True: 'OK', False: 'MD5 mismatch', None: 'not confirmed'}[self.file_results.get(filename)]
+                print(f"{filename}: {status}")
+
         if self.md5_verified:
             md5_hash = self.compute_md5()
             self.calculate_performance()
+            self.record_path_metrics()
         else:
             print("MD5 checksum verification failed. Transfer unsuccessful.")
 
     def calculate_performance(self):
-        file_size = sum(len(chunk) for chunk in self.file_data)
+        file_size = sum(len(chunk) for seq, chunk in enumerate(self.file_data) if seq not in self.file_headers)
         transfer_time = self.end_time - self.start_time
         effective_throughput = file_size / transfer_time if transfer_time > 0 else 0
         flow_utilization = file_size / self.total_data_sent if self.total_data_sent > 0 else 0
@@ -301,10 +436,23 @@ class ReliableUDPClient:
         print(f"Effective throughput: {effective_throughput:.2f} bytes/second")
         print(f"Total data sent (including retransmissions): {self.total_data_sent} bytes")
         print(f"Flow utilization rate: {flow_utilization:.4f}")
+        print(self.drops.report())
+
+    def record_path_metrics(self):
+        """把本次上传测得的路径特性写入缓存，供之后发往同一服务器的上传热启动"""
+        if self.path_cache is None:
+            return
+        file_size = sum(len(chunk) for seq, chunk in enumerate(self.file_data) if seq not in self.file_headers)
+        transfer_time = self.end_time - self.start_time
+        # 未发生丢包时ssthresh没有被探测到，以最终窗口作为路径能承受的下限
+        ssthresh = self.ssthresh if self.window.retransmitted else max(self.ssthresh, self.window_size)
+        self.path_cache.update(self.server_address[0], self.estimated_RTT, self.dev_RTT, ssthresh,
+                               file_size / transfer_time if transfer_time > 0 else 0,
+                               self.window.retransmitted / self.total_packets)
 
     def compare_md5(self, received_md5):
         if self.operation == 'upload':
-            local_md5 = self.compute_md5()
+            local_md5 = self.session_md5.hexdigest() if self.session_files else self.compute_md5()
         else:  
             self.file.flush()
             os.fsync(self.file.fileno())
@@ -326,65 +474,154 @@ class ReliableUDPClient:
         threading.Thread(target=self.receive_data, daemon=True).start()
 
     def send_file_request(self):
-        request_packet = Packet(flags=FLAG_REQ, payload=self.filename.encode('utf-8'))
+        if self.distribution:
+            request_packet = Packet(flags=FLAG_JOIN, payload=self.filename.encode('utf-8'), conn_id=self.conn_id)
+            self.last_join = time.time()
+        else:
+            request_packet = Packet(flags=FLAG_REQ, payload=self.filename.encode('utf-8'), conn_id=self.conn_id)
         self.sock.sendto(request_packet.to_bytes(), self.server_address)
         print(f"Sent file request for '{self.filename}'")
 
     def receive_data(self):
         while self.running:
+            buf = None
             try:
-                data, _ = self.sock.recvfrom(4096)
-                packet = Packet.from_bytes(data)
-                if packet.flags == FLAG_DATA:
-                    if self.protocol == 'GBN':
-                        self.handle_gbn(packet)
-                    elif self.protocol == 'SR':
-                        self.handle_sr(packet)
+                buf, nbytes, _ = self.drops.receive(self.pool)
+                packet = Packet.from_bytes(memoryview(buf)[:nbytes])
+                if self.distribution:
+                    self.handle_distribution(packet)
+                elif packet.flags == FLAG_DATA:
+                    self.handle_data(packet, buf)
+                    if self.protocol == 'SR':
+                        buf = None
+                elif packet.flags == FLAG_PARITY:
+                    self.handle_parity(packet)
                 elif packet.flags == FLAG_MD5:
-                    md5_value = packet.payload.decode('utf-8')
+                    md5_value = bytes(packet.payload).decode('utf-8')
                     self.compare_md5(md5_value)
                     self.running = False  
                 elif packet.flags == FLAG_FIN:
                     print("Received FIN from server.")
-                    ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK)
+                    ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
                     self.sock.sendto(ack_packet.to_bytes(), self.server_address)
                     self.transfer_complete = True  
                 else:
                     print(f"Received packet with unknown flags: {packet.flags}")
             except socket.timeout:
+                if self.distribution:
+                    self.check_distribution()
                 continue
             except ValueError as ve:
                 print(f"Received malformed packet: {ve}")
             except Exception as e:
                 print(f"An error occurred while receiving data: {e}")
                 traceback.print_exc()
+            finally:
+                # 交给handle_sr暂存的缓冲区由它在写入文件后归还，其余处理完即归还
+                self.pool.release(buf)
+
+    def handle_distribution(self, packet):
+        """分发模式：分块按序列号直接写到文件对应偏移处，无需按序缓存，也不逐包确认"""
+        if self.total_packets is None and packet.flags in (FLAG_DATA, FLAG_FIN):
+            self.total_packets = packet.ack_num
+            self.received_map = bytearray(self.total_packets)
+        if packet.flags == FLAG_DATA:
+            seq = packet.seq_num
+            if seq < self.total_packets and not self.received_map[seq]:
+                with self.lock, PROFILER.phase('write'):
+                    self.file.seek(seq * MSS)
+                    self.file.write(packet.payload)
+                self.received_map[seq] = 1
+                self.received_count += 1
+        elif packet.flags == FLAG_RESULT and self.total_packets is None:
+            # 分发开始前服务器发来的结果报文表示无法分发（如文件不存在）
+            print(f"Distribution of '{self.filename}' failed: {bytes(packet.payload).decode('utf-8')}")
+            self.running = False
+        elif packet.flags == FLAG_FIN:
+            self.last_poll = time.time()
+            if self.received_count < self.total_packets:
+                self.send_nack()
+                return
+            if not self.transfer_complete:
+                self.transfer_complete = True
+                self.compare_md5(bytes(packet.payload).decode('utf-8'))
+            result_packet = Packet(flags=FLAG_RESULT, payload=b'OK' if self.md5_verified else b'BAD', conn_id=self.conn_id)
+            self.sock.sendto(result_packet.to_bytes(), self.server_address)
+
+    def send_nack(self):
+        ranges = []
+        start = self.received_map.find(0)
+        while start != -1 and len(ranges) < MAX_NACK_RANGES:
+            end = self.received_map.find(1, start)
+            if end == -1:
+                end = self.total_packets
+            ranges.append(struct.pack(NACK_RANGE_FORMAT, start, end))
+            start = self.received_map.find(0, end)
+        nack_packet = Packet(flags=FLAG_NACK, payload=b''.join(ranges), conn_id=self.conn_id)
+        self.sock.sendto(nack_packet.to_bytes(), self.server_address)
+        print(f"Sent NACK for {self.total_packets - self.received_count} missing packets")
+
+    def check_distribution(self):
+        if self.total_packets is None and time.time() - self.last_join > JOIN_RETRY_INTERVAL:
+            if self.join_retries >= MAX_JOIN_RETRIES:
+                print(f"No response to distribution join for '{self.filename}', giving up.")
+                self.running = False
+                return
+            self.join_retries += 1
+            self.send_file_request()
+        elif self.transfer_complete and time.time() - self.last_poll > DISTRIBUTION_LINGER:
+            self.running = False
+
+    def handle_data(self, packet, buf):
+        self.fec_decoder.add(packet, self.expected_seq_num)
+        if self.protocol == 'GBN':
+            self.handle_gbn(packet)
+            # GBN丢弃的乱序分组在纠错缓存中仍有副本，缺口修复后依次交付
+            while self.fec_decoder.has(self.expected_seq_num):
+                self.handle_gbn(self.fec_decoder.get(self.expected_seq_num))
+        elif self.protocol == 'SR':
+            self.handle_sr(packet, buf)
+
+    def handle_parity(self, packet):
+        recovered = self.fec_decoder.recover(packet, self.expected_seq_num)
+        if recovered is not None:
+            print(f"Recovered packet {recovered.seq_num} from parity")
+            self.handle_data(recovered, None)
 
     def handle_gbn(self, packet):
         if packet.seq_num == self.expected_seq_num:
             with self.lock:
-                self.file.write(packet.payload)
-                self.md5_hash.update(packet.payload)
+                with PROFILER.phase('write'):
+                    self.file.write(packet.payload)
+                with PROFILER.phase('hash'):
+                    self.md5_hash.update(packet.payload)
             print(f"Received packet {packet.seq_num}")
-            ack_packet = Packet(ack_num=self.expected_seq_num, flags=FLAG_ACK)
+            ack_packet = Packet(ack_num=self.expected_seq_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
             self.sock.sendto(ack_packet.to_bytes(), self.server_address)
             self.expected_seq_num += 1
         else:
             ack_num = max(self.expected_seq_num - 1, 0)
-            ack_packet = Packet(ack_num=ack_num, flags=FLAG_ACK)
+            ack_packet = Packet(ack_num=ack_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
             self.sock.sendto(ack_packet.to_bytes(), self.server_address)
 
-    def handle_sr(self, packet):
-        ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK)
+    def handle_sr(self, packet, buf):
+        ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
         self.sock.sendto(ack_packet.to_bytes(), self.server_address)
-        if packet.seq_num not in self.received_packets:
-            self.received_packets[packet.seq_num] = packet.payload
+        if packet.seq_num >= self.expected_seq_num and packet.seq_num not in self.received_packets:
+            # 乱序分组的负载仍指向接收缓冲区，写入文件后才归还
+            self.received_packets[packet.seq_num] = (packet.payload, buf)
             print(f"Received packet {packet.seq_num}")
             while self.expected_seq_num in self.received_packets:
                 with self.lock:
-                    self.file.write(self.received_packets[self.expected_seq_num])
-                    self.md5_hash.update(self.received_packets[self.expected_seq_num])
-                    del self.received_packets[self.expected_seq_num]
+                    payload, payload_buf = self.received_packets.pop(self.expected_seq_num)
+                    with PROFILER.phase('write'):
+                        self.file.write(payload)
+                    with PROFILER.phase('hash'):
+                        self.md5_hash.update(payload)
+                    self.pool.release(payload_buf)
                     self.expected_seq_num += 1
+        else:
+            self.pool.release(buf)
 
     def finish_download(self):
         if hasattr(self, 'file'):
@@ -393,6 +630,9 @@ class ReliableUDPClient:
             self.file.close()
         self.sock.close()
         print("File download completed.")
+        print(self.drops.report())
+        if self.fec_decoder.active:
+            print(f"FEC recovered {self.fec_decoder.recovered} packets")
 
         if self.md5_verified:
             md5_hash = self.compute_md5()
@@ -402,11 +642,47 @@ class ReliableUDPClient:
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('server_ip')
-    parser.add_argument('filename')
+    parser.add_argument('filename', nargs='+', help='multiple files are uploaded in one pipelined session')
     parser.add_argument('--protocol', choices=['GBN', 'SR'], required=True)
     parser.add_argument('--congestion', choices=['loss', 'delay'], required=True)
     parser.add_argument('--operation', choices=['upload', 'download'], required=True)
+    parser.add_argument('--fec', action='store_true', help='send XOR parity packets with uploads')
+    parser.add_argument('--distribution', action='store_true',
+                        help='join a one-to-many distribution of the file instead of a unicast download')
+    parser.add_argument('--multiplex', action='store_true',
+                        help='transfer each file as a separate concurrent connection over one socket')
+    parser.add_argument('--path-cache', metavar='FILE',
+                        help='warm-start uploads from per-server path metrics kept in FILE (default: off)')
+    parser.add_argument('--rcvbuf', type=int, help='SO_RCVBUF in bytes (default: sized from --bandwidth and --rtt)')
+    parser.add_argument('--sndbuf', type=int, help='SO_SNDBUF in bytes (default: sized from --bandwidth and --rtt)')
+    parser.add_argument('--bandwidth', type=float, default=DEFAULT_BANDWIDTH, help='link bandwidth in Mbit/s for buffer sizing')
+    parser.add_argument('--rtt', type=float, default=DEFAULT_RTT, help='round-trip time in ms for buffer sizing')
+    add_profile_arguments(parser)
     args = parser.parse_args()
-
-    client = ReliableUDPClient(args.server_ip, args.filename, args.protocol, args.congestion, args.operation)
-    client.run()
+    enable_from_args(args, 'client')
+    if len(args.filename) > 1 and args.operation != 'upload' and not args.multiplex:
+        parser.error('multiple files are only supported for upload')
+    if args.distribution and args.operation != 'download':
+        parser.error('--distribution is only supported for download')
+    if args.distribution and args.multiplex:
+        parser.error('--distribution cannot be combined with --multiplex')
+
+    bdp_buffer = buffer_size_for_bdp(args.bandwidth, args.rtt)
+    path_cache = PathMetricsCache(args.path_cache) if args.path_cache and args.operation == 'upload' else None
+    if args.multiplex:
+        mux = Multiplexer(args.rcvbuf or bdp_buffer, args.sndbuf or bdp_buffer)
+        mux.start()
+        clients = [ReliableUDPClient(args.server_ip, filename, args.protocol, args.congestion, args.operation, fec=args.fec, mux=mux,
+                                     path_cache=path_cache)
+                   for filename in args.filename]
+        threads = [threading.Thread(target=client.run) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        mux.close()
+    else:
+        session_files = args.filename if len(args.filename) > 1 else None
+        client = ReliableUDPClient(args.server_ip, args.filename[0], args.protocol, args.congestion, args.operation, session_files, args.fec,
+                                   args.distribution, args.rcvbuf or bdp_buffer, args.sndbuf or bdp_buffer, path_cache=path_cache)
+        client.run()
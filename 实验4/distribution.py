@@ -0,0 +1,137 @@
+import threading
+import time
+import struct
+from packet import Packet, FLAG_DATA, FLAG_FIN, FLAG_RESULT, NACK_RANGE_FORMAT, NACK_RANGE_SIZE
+
+JOIN_WINDOW = 1.0  # 第一个接收方加入后，等待其他接收方加入的时间（秒）
+DEFAULT_RATE = 2000  # 默认发送速率（数据包/秒）
+BATCH_SIZE = 16  # 每批连续发送的数据包数量，批与批之间按速率休眠
+POLL_TIMEOUT = 0.5  # 每轮轮询等待接收方回复的时间（秒）
+MAX_SILENT_POLLS = 10  # 接收方连续多少轮无回复后视为失败
+NOT_FOUND = b'NOT FOUND'  # 文件不存在时发给已加入接收方的结果报文负载
+
+class DistributionSender(threading.Thread):
+    """一对多文件分发：每个分块只构造一次并扇出到所有接收方，接收方用NACK报告缺失区间，
+    发送方汇总各接收方的NACK后统一重传一次"""
+    def __init__(self, sock, filename, cache, rate=DEFAULT_RATE):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.filename = filename
+        self.cache = cache
+        self.rate = rate
+        self.receivers = {}  # 接收方地址 -> 状态：None（进行中）、'OK'、'MD5 mismatch'、'timeout'
+        self.silent_polls = {}  # 接收方地址 -> 连续无回复的轮数
+        self.joining = True
+        self.nacks = set()  # 本轮汇总的缺失序列号
+        self.responded = set()  # 本轮已回复的接收方
+        self.lock = threading.Lock()
+        self.total_data_sent = 0
+        self.transmissions = 0  # 构造并扇出的数据包数量
+
+    def add_receiver(self, address):
+        """加入窗口内或已是接收方时返回 True；分发已开始时返回 False，调用方应另起一次分发"""
+        with self.lock:
+            if address in self.receivers:
+                return True
+            if not self.joining:
+                return False
+            self.receivers[address] = None
+            self.silent_polls[address] = 0
+            print(f"{address} joined distribution of '{self.filename}'")
+            return True
+
+    def pending(self):
+        return [address for address, status in self.receivers.items() if status is None]
+
+    def run(self):
+        time.sleep(JOIN_WINDOW)
+        with self.lock:
+            self.joining = False
+        try:
+            entry = self.cache.get(self.filename)
+        except FileNotFoundError:
+            print(f"File '{self.filename}' not found. Cannot distribute.")
+            # 告知已加入的接收方，否则它们会一直重发加入请求
+            result_packet = Packet(flags=FLAG_RESULT, payload=NOT_FOUND)
+            for address in self.receivers:
+                self.receivers[address] = 'not found'
+                self.sock.sendto(result_packet.to_bytes(), address)
+            return
+        self.chunks = entry.chunks
+        self.md5_value = entry.md5_value
+        start_time = time.time()
+        print(f"Distributing '{self.filename}' to {len(self.receivers)} receivers")
+
+        self.send_chunks(range(len(self.chunks)))
+        while True:
+            with self.lock:
+                pending = self.pending()
+                self.nacks = set()
+                self.responded = set()
+            if not pending:
+                break
+            self.poll(pending)
+            with self.lock:
+                missing = sorted(self.nacks)
+                for address in pending:
+                    if address in self.responded:
+                        self.silent_polls[address] = 0
+                    else:
+                        self.silent_polls[address] += 1
+                        if self.silent_polls[address] >= MAX_SILENT_POLLS:
+                            self.receivers[address] = 'timeout'
+            if missing:
+                print(f"Repairing {len(missing)} packets of '{self.filename}' for {len(pending)} receivers")
+                self.send_chunks(missing)
+
+        self.report(time.time() - start_time)
+
+    def send_chunks(self, seqs):
+        """每个分块只编码一次，再发送给所有尚未完成的接收方；按配置的速率分批发送"""
+        with self.lock:
+            targets = self.pending()
+        for i, seq in enumerate(seqs):
+            data = Packet(seq_num=seq, ack_num=len(self.chunks), flags=FLAG_DATA, payload=self.chunks[seq]).to_bytes()
+            for address in targets:
+                self.sock.sendto(data, address)
+                self.total_data_sent += len(data)
+            self.transmissions += 1
+            if (i + 1) % BATCH_SIZE == 0:
+                time.sleep(BATCH_SIZE / self.rate)
+
+    def poll(self, pending):
+        """向未完成的接收方发送携带总包数和MD5的FIN，等待它们回复NACK或完成报告"""
+        fin_packet = Packet(ack_num=len(self.chunks), flags=FLAG_FIN, payload=self.md5_value.encode('utf-8'))
+        for address in pending:
+            self.sock.sendto(fin_packet.to_bytes(), address)
+        deadline = time.time() + POLL_TIMEOUT
+        while time.time() < deadline:
+            with self.lock:
+                if self.responded.issuperset(pending):
+                    return
+            time.sleep(0.01)
+
+    def receive_nack(self, address, packet):
+        payload = bytes(packet.payload)
+        with self.lock:
+            for offset in range(0, len(payload) - NACK_RANGE_SIZE + 1, NACK_RANGE_SIZE):
+                start, end = struct.unpack_from(NACK_RANGE_FORMAT, payload, offset)
+                self.nacks.update(range(start, min(end, len(self.chunks))))
+            self.responded.add(address)
+
+    def receive_result(self, address, packet):
+        with self.lock:
+            if self.receivers.get(address, 'unknown') is None:
+                self.receivers[address] = 'OK' if bytes(packet.payload) == b'OK' else 'MD5 mismatch'
+                print(f"{address} finished '{self.filename}': {self.receivers[address]}")
+            self.responded.add(address)
+
+    def report(self, transfer_time):
+        file_size = sum(len(chunk) for chunk in self.chunks)
+        print(f"\n--- Distribution Report: '{self.filename}' ---")
+        for address, status in self.receivers.items():
+            print(f"{address}: {status}")
+        print(f"File size: {file_size} bytes")
+        print(f"Transfer time: {transfer_time:.2f} seconds")
+        print(f"Packets transmitted (including repairs): {self.transmissions} for {len(self.chunks)} chunks")
+        print(f"Total data sent to all receivers: {self.total_data_sent} bytes")
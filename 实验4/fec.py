@@ -0,0 +1,80 @@
+import struct
+from packet import Packet, FLAG_PARITY
+
+MIN_GROUP_SIZE = 4  # 每组数据包数量下限（冗余度上限25%）
+MAX_GROUP_SIZE = 32  # 每组数据包数量上限（冗余度下限约3%）
+PARITY_HEADER_FORMAT = '!HH'  # 校验负载前缀：各分组长度的异或、标志位的异或
+PARITY_HEADER_SIZE = struct.calcsize(PARITY_HEADER_FORMAT)
+
+def group_size_for_loss(loss_rate):
+    """根据测得的丢包率选择分组大小：期望每组丢失约半个包，单个异或校验包即可修复"""
+    if loss_rate <= 0:
+        return MAX_GROUP_SIZE
+    return max(MIN_GROUP_SIZE, min(MAX_GROUP_SIZE, int(1 / (2 * loss_rate))))
+
+def make_parity(group_start, packets):
+    """对一组 (flags, payload) 计算异或校验包，seq_num为组首序列号，ack_num为组内包数"""
+    size = max(len(payload) for _, payload in packets)
+    length_xor = flags_xor = body_xor = 0
+    for flags, payload in packets:
+        length_xor ^= len(payload)
+        flags_xor ^= flags
+        body_xor ^= int.from_bytes(bytes(payload).ljust(size, b'\0'), 'big')
+    payload = struct.pack(PARITY_HEADER_FORMAT, length_xor, flags_xor) + body_xor.to_bytes(size, 'big')
+    return Packet(seq_num=group_start, ack_num=len(packets), flags=FLAG_PARITY, payload=payload)
+
+class FecDecoder:
+    """接收端的校验恢复器：保存尚未凑齐的分组，组内只缺一个包时由校验包重建。
+    发送方未启用纠错时不应为每个分组付出复制的代价，因此收到第一个校验包后才开始缓存，
+    在此之前到达的分组所在的组无法恢复，由重传补齐"""
+    def __init__(self):
+        self.packets = {}  # 序列号 -> (flags, payload)
+        self.low = 0  # 小于该序列号的分组都已清理
+        self.recovered = 0  # 累计恢复的数据包数量
+        self.active = False  # 是否收到过校验包
+
+    def add(self, packet, expected_seq_num):
+        if not self.active:
+            return
+        self.prune(expected_seq_num)
+        if packet.seq_num >= self.low:
+            self.packets[packet.seq_num] = (packet.flags, bytes(packet.payload))
+
+    def has(self, seq_num):
+        return seq_num in self.packets
+
+    def get(self, seq_num):
+        flags, payload = self.packets[seq_num]
+        return Packet(seq_num=seq_num, flags=flags, payload=payload)
+
+    def prune(self, expected_seq_num):
+        # 包含 expected_seq_num 的组最早从 expected_seq_num - MAX_GROUP_SIZE + 1 开始，更早的都已完整交付
+        limit = expected_seq_num - MAX_GROUP_SIZE
+        if not self.packets:
+            self.low = max(self.low, limit)
+            return
+        while self.low < limit:
+            self.packets.pop(self.low, None)
+            self.low += 1
+
+    def recover(self, parity, expected_seq_num):
+        """返回由校验包重建出的数据包；组已完整交付或缺失多于一个时返回 None"""
+        self.active = True
+        group_start, count = parity.seq_num, parity.ack_num
+        if group_start + count <= expected_seq_num:
+            return None
+        missing = [seq for seq in range(group_start, group_start + count)
+                   if seq not in self.packets and seq >= expected_seq_num]
+        present = [self.packets[seq] for seq in range(group_start, group_start + count) if seq in self.packets]
+        if len(missing) != 1 or len(present) != count - 1:
+            return None
+        length_xor, flags_xor = struct.unpack_from(PARITY_HEADER_FORMAT, parity.payload)
+        body = bytes(parity.payload[PARITY_HEADER_SIZE:])
+        body_xor = int.from_bytes(body, 'big')
+        for flags, payload in present:
+            length_xor ^= len(payload)
+            flags_xor ^= flags
+            body_xor ^= int.from_bytes(payload.ljust(len(body), b'\0'), 'big')
+        self.recovered += 1
+        payload = body_xor.to_bytes(len(body), 'big')[:length_xor]
+        return Packet(seq_num=missing[0], flags=flags_xor, payload=payload)
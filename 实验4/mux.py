@@ -0,0 +1,88 @@
+import threading
+import socket
+from queue import Queue, Empty
+from packet import peek_conn_id
+from buffer_pool import BufferPool
+from socket_tuning import DropCounter, tune_socket
+from profiler import PROFILER
+
+class Channel:
+    """多路复用套接字上的一个连接：提供客户端用到的 sendto / receive_into / receive / settimeout / close 接口，
+    同时代替 DropCounter 报告整个套接字的内核丢包"""
+    def __init__(self, mux, conn_id):
+        self.mux = mux
+        self.conn_id = conn_id
+        self.queue = Queue()  # (池缓冲区, 字节数, 对端地址)
+        self.timeout = None
+
+    def sendto(self, data, address):
+        return self.mux.sock.sendto(data, address)
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def receive(self, pool):
+        """直接交出接收线程填好的池缓冲区，不再复制；pool 应为 mux.pool，调用方用完后归还"""
+        try:
+            return self.queue.get(timeout=self.timeout)
+        except Empty:
+            raise socket.timeout('timed out')
+
+    def receive_into(self, buf):
+        pooled, nbytes, address = self.receive(self.mux.pool)
+        buf[:nbytes] = memoryview(pooled)[:nbytes]
+        self.mux.pool.release(pooled)
+        return nbytes, address
+
+    def close(self):
+        self.mux.close_channel(self.conn_id)
+
+    def report(self):
+        return self.mux.drops.report()
+
+class Multiplexer(threading.Thread):
+    """在一个UDP套接字上并发进行多个传输：接收线程读取数据包头中的连接ID，把数据报分发给对应的 Channel"""
+    def __init__(self, rcvbuf=None, sndbuf=None):
+        super().__init__(daemon=True)
+        self.sock = PROFILER.wrap_socket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+        self.sock.bind(('', 0))  # 接收线程启动时尚未发送过数据，需先绑定端口
+        tune_socket(self.sock, rcvbuf, sndbuf)
+        self.drops = DropCounter(self.sock)
+        self.pool = BufferPool()
+        self.channels = {}  # 连接ID -> Channel
+        self.lock = threading.Lock()
+        self.unknown = 0  # 没有对应连接（已关闭或连接ID未知）的数据报数量
+
+    def open_channel(self, conn_id):
+        with self.lock:
+            channel = Channel(self, conn_id)
+            self.channels[conn_id] = channel
+            return channel
+
+    def close_channel(self, conn_id):
+        with self.lock:
+            channel = self.channels.pop(conn_id, None)
+        if channel is not None:
+            while not channel.queue.empty():
+                self.pool.release(channel.queue.get()[0])
+
+    def run(self):
+        while True:
+            buf = self.pool.acquire()
+            try:
+                nbytes, address = self.drops.receive_into(buf)
+            except OSError:
+                self.pool.release(buf)
+                return
+            with self.lock:
+                channel = self.channels.get(peek_conn_id(memoryview(buf)[:nbytes]))
+            if channel is None:
+                self.unknown += 1
+                self.pool.release(buf)
+            else:
+                channel.queue.put((buf, nbytes, address))
+
+    def close(self):
+        self.sock.close()
+        if self.unknown:
+            print(f"Multiplexer dropped {self.unknown} packets for unknown connections")
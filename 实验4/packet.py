@@ -1,7 +1,12 @@
 import struct
+import time
+from profiler import PROFILER
 
 MSS = 1024  # 最大分段大小
-PACKET_HEADER_FORMAT = '!IIHII'  # struct打包格式
+PACKET_HEADER_FORMAT = '!IIHIIIII'  # struct打包格式（末尾依次为时间戳扩展的两个字段和连接ID）
+HEADER_SIZE = struct.calcsize(PACKET_HEADER_FORMAT)
+CONN_ID_OFFSET = HEADER_SIZE - 4  # 连接ID在头部中的偏移，供多路复用时不完整解析即可分发
+TS_MODULUS = 1 << 32  # 时间戳为32位微秒计数，按模回绕
 
 # 数据包标志位
 FLAG_DATA = 0
@@ -10,36 +15,63 @@ FLAG_FIN = 2
 FLAG_REQ = 4
 FLAG_MD5 = 8
 FLAG_RESULT = 16
+FLAG_FILE = 32  # 会话模式下的文件头分组，占用一个序列号，负载为“分块数\n文件名”
+FLAG_PARITY = 64  # 前向纠错的异或校验包，不占用序列号
+FLAG_NACK = 128  # 分发模式下接收方报告缺失区间，负载为若干 (起始, 结束) 对
+FLAG_JOIN = 256  # 分发模式下请求加入某个文件的一对多分发
 
 class Packet:
     """数据包类，用于创建和解析数据包"""
-    def __init__(self, seq_num=0, ack_num=0, flags=FLAG_DATA, window_size=0, payload=b''):
+    def __init__(self, seq_num=0, ack_num=0, flags=FLAG_DATA, window_size=0, payload=b'', ts_val=0, ts_ecr=0, conn_id=0):
         self.seq_num = seq_num  # 序列号
         self.ack_num = ack_num  # 确认号
         self.flags = flags  # 标志位
         self.window_size = window_size  # 窗口大小
         self.payload = payload  # 负载数据
         self.payload_length = len(payload)  # 负载长度
+        self.ts_val = ts_val  # 发送方时间戳
+        self.ts_ecr = ts_ecr  # 回显的对端时间戳，0表示无回显
+        self.conn_id = conn_id  # 连接ID，0表示按对端地址区分连接
 
     def to_bytes(self):
         """将数据包转换为字节流"""
-        header = struct.pack(
-            PACKET_HEADER_FORMAT,
-            self.seq_num,
-            self.ack_num,
-            self.flags,
-            self.window_size,
-            self.payload_length
-        )
-        return header + self.payload  # 拼接头部和负载
+        with PROFILER.phase('encode'):
+            header = struct.pack(
+                PACKET_HEADER_FORMAT,
+                self.seq_num,
+                self.ack_num,
+                self.flags,
+                self.window_size,
+                self.payload_length,
+                self.ts_val,
+                self.ts_ecr,
+                self.conn_id
+            )
+            return header + self.payload  # 拼接头部和负载
 
     @staticmethod
     def from_bytes(data):
-        """从字节流解析出数据包"""
-        header_size = struct.calcsize(PACKET_HEADER_FORMAT)
-        if len(data) < header_size:
+        """从字节流解析出数据包；传入 memoryview 时负载为零拷贝的切片视图"""
+        if len(data) < HEADER_SIZE:
             raise ValueError("Data too short to unpack Packet header.")
-        header = data[:header_size]
-        seq_num, ack_num, flags, window_size, payload_length = struct.unpack(PACKET_HEADER_FORMAT, header)
-        payload = data[header_size:header_size + payload_length]
-        return Packet(seq_num, ack_num, flags, window_size, payload)
+        with PROFILER.phase('decode'):
+            seq_num, ack_num, flags, window_size, payload_length, ts_val, ts_ecr, conn_id = struct.unpack_from(PACKET_HEADER_FORMAT, data)
+            payload = data[HEADER_SIZE:HEADER_SIZE + payload_length]
+            return Packet(seq_num, ack_num, flags, window_size, payload, ts_val, ts_ecr, conn_id)
+
+def peek_conn_id(data):
+    """只读取数据报中的连接ID；数据过短时返回 None"""
+    if len(data) < HEADER_SIZE:
+        return None
+    return struct.unpack_from('!I', data, CONN_ID_OFFSET)[0]
+
+NACK_RANGE_FORMAT = '!II'  # NACK负载中的一个缺失区间 [起始, 结束)
+NACK_RANGE_SIZE = struct.calcsize(NACK_RANGE_FORMAT)
+
+def timestamp():
+    """返回当前的32位微秒时间戳，跳过0以便用0表示“无回显”"""
+    return int(time.monotonic() * 1000000) % TS_MODULUS or 1
+
+def elapsed_since(ts):
+    """根据回显的时间戳计算经过的秒数，处理32位回绕"""
+    return ((timestamp() - ts) % TS_MODULUS) / 1000000
@@ -0,0 +1,87 @@
+import json
+import math
+import os
+import threading
+import time
+from packet import MSS
+
+DEFAULT_CACHE_FILE = 'path_metrics.json'
+EXPIRY = 3600  # 超过该时间（秒）未更新的条目视为失效
+HALF_LIFE = 600  # 旧测量值的权重每隔该时间（秒）减半
+MIN_RTO = 0.2  # 由缓存推得的初始超时时间下限（秒）
+FIELDS = ('srtt', 'rttvar', 'ssthresh', 'bandwidth', 'loss', 'updated')
+
+def valid(entry):
+    """条目是否包含全部字段且取值合理；缓存文件可能被手工修改或只写了一半"""
+    if not isinstance(entry, dict):
+        return False
+    for key in FIELDS:
+        value = entry.get(key)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+            return False
+    return entry['srtt'] > 0 and entry['loss'] <= 1
+
+class PathMetricsCache:
+    """按对端主机持久保存路径测量值（平滑RTT、RTT偏差、ssthresh、瓶颈带宽、丢包率），
+    新传输从这些值热启动，不必每次从默认的窗口和超时时间重新探测路径。
+    旧值随时间衰减，过期或不完整的条目直接丢弃"""
+    def __init__(self, path=DEFAULT_CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}  # 主机 -> 测量值字典（含更新时间 updated）
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self.entries = entries
+        except (OSError, ValueError):
+            pass
+
+    def lookup(self, host):
+        """返回该主机未过期的测量值，没有时返回 None"""
+        with self.lock:
+            return self.current(host)
+
+    def current(self, host):
+        """调用方需持有 self.lock；过期或无效的条目在此删除"""
+        entry = self.entries.get(host)
+        if entry is None:
+            return None
+        if not valid(entry) or time.time() - entry['updated'] > EXPIRY:
+            del self.entries[host]
+            return None
+        return dict(entry)
+
+    def update(self, host, srtt, rttvar, ssthresh, bandwidth, loss):
+        """把一次传输的测量值并入缓存：旧值的权重按年龄衰减，新值至少占一半"""
+        sample = {'srtt': srtt, 'rttvar': rttvar, 'ssthresh': ssthresh, 'bandwidth': bandwidth, 'loss': loss}
+        now = time.time()
+        with self.lock:
+            entry = self.current(host)
+            if entry is not None:
+                weight = 0.5 * 0.5 ** ((now - entry['updated']) / HALF_LIFE)
+                sample = {key: weight * entry[key] + (1 - weight) * value for key, value in sample.items()}
+            sample['updated'] = now
+            self.entries[host] = sample
+            self.save()
+
+    def save(self):
+        """先写临时文件再替换，多个进程同时写入时也不会留下半个文件"""
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to save path metrics to '{self.path}': {e}")
+
+def warm_start(sender, metrics, min_window):
+    """用缓存的测量值初始化发送方的RTT估计、超时时间、ssthresh和初始窗口。
+    初始窗口取带宽时延积与ssthresh中较小者，且不小于默认值；返回缓存中的丢包率"""
+    sender.estimated_RTT = metrics['srtt']
+    sender.dev_RTT = metrics['rttvar']
+    sender.timeout_interval = max(MIN_RTO, sender.estimated_RTT + 4 * sender.dev_RTT)
+    sender.ssthresh = max(2, int(metrics['ssthresh']))
+    bdp_packets = math.ceil(metrics['bandwidth'] * metrics['srtt'] / MSS)
+    sender.window_size = max(min_window, min(sender.ssthresh, bdp_packets))
+    return metrics['loss']
@@ -0,0 +1,232 @@
+import atexit
+import cProfile
+import os
+import pstats
+import re
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+SAMPLE_INTERVAL = 0.005  # 栈采样间隔（秒）
+TRACEMALLOC_FRAMES = 10  # tracemalloc 为每次分配记录的栈深度
+TOP_ALLOCATIONS = 20  # 报告中列出的内存分配热点数量
+
+def thread_label(thread):
+    """线程的可读名称：去掉自动编号，target 线程取函数名，Thread 子类取类名，使同一类线程的数据合并"""
+    match = re.fullmatch(r'Thread-\d+(?: \((.+)\))?', thread.name)
+    if match is None:
+        return thread.name
+    return match.group(1) or type(thread).__name__
+
+class _NullPhase:
+    """未开启性能分析时 phase() 返回的空上下文，不做任何计时"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_PHASE = _NullPhase()
+
+class _Phase:
+    def __init__(self, counters, name):
+        self.counters = counters
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter_ns() - self.start
+        entry = self.counters.get(self.name)
+        if entry is None:
+            self.counters[self.name] = [elapsed, 1]
+        else:
+            entry[0] += elapsed
+            entry[1] += 1
+        return False
+
+class ProfiledLock:
+    """记录获取锁的等待时间，其余行为与被包装的锁相同"""
+    def __init__(self, profiler, lock):
+        self.profiler = profiler
+        self.inner = lock
+
+    def acquire(self, *args, **kwargs):
+        with self.profiler.phase('lock wait'):
+            return self.inner.acquire(*args, **kwargs)
+
+    def release(self):
+        self.inner.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+class ProfiledSocket:
+    """记录 sendto 和各类接收调用的耗时，其余属性直接转发给被包装的套接字"""
+    def __init__(self, profiler, sock):
+        self.profiler = profiler
+        self.inner = sock
+
+    def sendto(self, *args):
+        with self.profiler.phase('sendto'):
+            return self.inner.sendto(*args)
+
+    def recvfrom_into(self, *args):
+        with self.profiler.phase('recvfrom'):
+            return self.inner.recvfrom_into(*args)
+
+    def recvmsg_into(self, *args):
+        with self.profiler.phase('recvfrom'):
+            return self.inner.recvmsg_into(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+class Profiler:
+    """内置性能分析：按阶段（读文件、编码、发送、接收、解码、写文件、哈希、等锁）累计单调时钟计时，
+    计数器按线程存放，热路径上无需加锁。另有后台线程定时采样所有线程的调用栈，
+    退出时输出各阶段耗时表和可直接交给 flamegraph.pl 的折叠栈文件；
+    可选为每个线程开启 cProfile，以及用 tracemalloc 统计内存分配热点"""
+    def __init__(self):
+        self.enabled = False
+        self.local = threading.local()
+        self.thread_counters = []  # (线程名, 该线程的计数器字典)
+        self.lock = threading.Lock()
+        self.stacks = Counter()  # 折叠栈 -> 采样次数
+        self.profiles = []  # 各线程的 cProfile.Profile
+        self.use_tracemalloc = False
+        self.prefix = None
+        self.start_time = None
+
+    def enable(self, prefix, use_cprofile=False, use_tracemalloc=False):
+        """开启性能分析；必须在创建服务器或客户端之前调用，退出时把结果写到 prefix.* 文件"""
+        self.enabled = True
+        self.prefix = prefix
+        self.start_time = time.perf_counter()
+        if use_cprofile:
+            threading.setprofile(self.start_thread_profile)
+            profile = cProfile.Profile()
+            self.profiles.append(profile)
+            profile.enable()
+        if use_tracemalloc:
+            self.use_tracemalloc = True
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        threading.Thread(target=self.sample_stacks, name='profiler', daemon=True).start()
+        atexit.register(self.report)
+        # 服务器通常被 kill 结束，把 SIGTERM 转为正常退出以便 atexit 写出结果
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    def start_thread_profile(self, frame, event, arg):
+        # 新线程首次产生事件时调用：为该线程创建并启动自己的 cProfile，取代本钩子
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def counters(self):
+        counters = getattr(self.local, 'counters', None)
+        if counters is None:
+            counters = self.local.counters = {}
+            with self.lock:
+                self.thread_counters.append((thread_label(threading.current_thread()), counters))
+        return counters
+
+    def phase(self, name):
+        """计时上下文：with PROFILER.phase('encode'): ...；未开启时几乎没有开销"""
+        if not self.enabled:
+            return NULL_PHASE
+        return _Phase(self.counters(), name)
+
+    def wrap_lock(self, lock):
+        return ProfiledLock(self, lock) if self.enabled else lock
+
+    def wrap_socket(self, sock):
+        return ProfiledSocket(self, sock) if self.enabled else sock
+
+    def sample_stacks(self):
+        me = threading.get_ident()
+        while True:
+            time.sleep(SAMPLE_INTERVAL)
+            names = {thread.ident: thread_label(thread) for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    code = frame.f_code
+                    labels.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[';'.join([names.get(ident, 'unknown')] + labels[::-1])] += 1
+
+    def breakdown(self):
+        wall = time.perf_counter() - self.start_time
+        totals = {}
+        with self.lock:
+            snapshot = [(name, dict(counters)) for name, counters in self.thread_counters]
+        for _, counters in snapshot:
+            for phase, (elapsed, calls) in counters.items():
+                total = totals.setdefault(phase, [0, 0])
+                total[0] += elapsed
+                total[1] += calls
+        lines = [f"Wall time: {wall:.3f} s", f"{'phase':<12}{'calls':>10}{'total ms':>12}{'avg us':>10}{'% wall':>9}"]
+        for phase, (elapsed, calls) in sorted(totals.items(), key=lambda item: -item[1][0]):
+            lines.append(f"{phase:<12}{calls:>10}{elapsed / 1e6:>12.1f}{elapsed / calls / 1e3:>10.1f}{elapsed / 1e7 / wall:>9.1f}")
+        lines.append("")
+        lines.append("Per thread:")
+        for name, counters in snapshot:
+            parts = ', '.join(f"{phase} {elapsed / 1e6:.1f} ms" for phase, (elapsed, _) in sorted(counters.items()))
+            lines.append(f"  {name}: {parts}")
+        if self.use_tracemalloc:
+            lines.append("")
+            lines.append(f"Top {TOP_ALLOCATIONS} allocation sites:")
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]:
+                lines.append(f"  {stat}")
+        return '\n'.join(lines)
+
+    def report(self):
+        """写出各阶段耗时表（prefix.txt）、折叠栈（prefix.folded）和 cProfile 统计（prefix.pstats）"""
+        text = self.breakdown()
+        print(f"\n--- Profile ---\n{text}")
+        with open(f"{self.prefix}.txt", 'w') as f:
+            f.write(text + '\n')
+        with open(f"{self.prefix}.folded", 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        written = [f"{self.prefix}.txt", f"{self.prefix}.folded"]
+        if self.profiles:
+            stats = None
+            for profile in list(self.profiles):
+                try:
+                    profile.disable()
+                    stats = pstats.Stats(profile) if stats is None else stats.add(profile)
+                except (TypeError, ValueError):
+                    continue  # 尚未产生任何调用记录的线程
+            if stats is not None:
+                stats.dump_stats(f"{self.prefix}.pstats")
+                written.append(f"{self.prefix}.pstats")
+        print(f"Profile written to {', '.join(written)}")
+
+PROFILER = Profiler()
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help='time each phase and sample stacks; write PREFIX.txt and PREFIX.folded at exit')
+    parser.add_argument('--profile-prefix', metavar='PREFIX',
+                        help='with --profile: output file prefix (default: profile_<role>_<pid>)')
+    parser.add_argument('--cprofile', action='store_true', help='with --profile: also run cProfile in every thread')
+    parser.add_argument('--tracemalloc', action='store_true', help='with --profile: also report top allocation sites')
+
+def enable_from_args(args, role):
+    if not args.profile:
+        return
+    PROFILER.enable(args.profile_prefix or f"profile_{role}_{os.getpid()}", args.cprofile, args.tracemalloc)
@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import deque
+from packet import MSS, HEADER_SIZE
+
+QUANTUM = MSS + HEADER_SIZE  # 权重为1的客户端每轮可发送的字节数
+BURST_TIME = 0.05  # 限速客户端令牌桶可积累的时长（秒）
+QUEUE_LIMIT = 16  # 每个客户端队列的数据报上限，超过时发送方应暂停放入新分组
+
+class ClientQueue:
+    """单个客户端的待发队列及其调度状态"""
+    def __init__(self, weight=1, rate=None):
+        self.packets = deque()  # 待发送的数据报
+        self.weight = weight  # 调度权重
+        self.rate = rate  # 限速（字节/秒），None表示不限速
+        self.deficit = 0  # DRR赤字计数
+        self.tokens = 0.0  # 令牌桶中的字节数
+        self.last_refill = time.monotonic()
+        self.served_bytes = 0  # 已发送的字节数
+        self.served_packets = 0
+
+    def refill(self, now):
+        if self.rate is None:
+            return
+        burst = max(self.rate * BURST_TIME, QUANTUM)
+        self.tokens = min(burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+class EgressScheduler(threading.Thread):
+    """服务器出口调度器：所有FileSender把数据报交给它，由一个线程按带权赤字轮询(DRR)统一发出，
+    可为每个客户端设置权重和限速。对外提供与socket相同的 sendto 接口"""
+    def __init__(self, sock, weights=None, rates=None):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.weights = weights or {}  # 'ip' 或 'ip:port' -> 权重
+        self.rates = rates or {}  # 'ip' 或 'ip:port' -> 字节/秒
+        self.queues = {}  # 客户端地址 -> ClientQueue
+        self.active = deque()  # 队列非空的客户端地址，按轮询顺序排列
+        self.condition = threading.Condition()
+        self.watchers = {}  # 客户端地址 -> 队列腾出空间时要唤醒的 Event
+
+    def lookup(self, table, address, default):
+        return table.get(f"{address[0]}:{address[1]}", table.get(address[0], default))
+
+    def sendto(self, data, address):
+        """把数据报放入该客户端的队列，立即返回"""
+        with self.condition:
+            queue = self.queues.get(address)
+            if queue is None:
+                queue = ClientQueue(self.lookup(self.weights, address, 1), self.lookup(self.rates, address, None))
+                self.queues[address] = queue
+            if not queue.packets:
+                self.active.append(address)
+            queue.packets.append(bytes(data))
+            self.condition.notify()
+        return len(data)
+
+    def has_room(self, address):
+        """该客户端的队列未满时返回 True。发送方应在队列满时暂停发送新分组，
+        否则分组在队列中等待的时间会被计入RTT，并导致超时重传"""
+        with self.condition:
+            queue = self.queues.get(address)
+            return queue is None or len(queue.packets) < QUEUE_LIMIT
+
+    def watch(self, address, event):
+        """队列从满变为未满时 set 该 event"""
+        with self.condition:
+            self.watchers.setdefault(address, set()).add(event)
+
+    def unwatch(self, address, event):
+        with self.condition:
+            events = self.watchers.get(address)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self.watchers[address]
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.active:
+                    self.condition.wait()
+                batch, wait = self.next_round()
+            for data, address in batch:
+                self.sock.sendto(data, address)
+            if not batch:
+                time.sleep(wait)
+
+    def next_round(self):
+        """为队首客户端取出本轮可发送的数据报；所有活跃客户端都被限速时返回需要等待的时间"""
+        now = time.monotonic()
+        wait = None
+        for _ in range(len(self.active)):
+            address = self.active[0]
+            queue = self.queues[address]
+            queue.refill(now)
+            queue.deficit += QUANTUM * queue.weight
+            batch = []
+            while queue.packets and len(queue.packets[0]) <= queue.deficit:
+                size = len(queue.packets[0])
+                if queue.rate is not None and queue.tokens < size:
+                    break
+                batch.append((queue.packets.popleft(), address))
+                queue.deficit -= size
+                queue.served_bytes += size
+                queue.served_packets += 1
+                if queue.rate is not None:
+                    queue.tokens -= size
+            self.active.popleft()
+            if batch and len(queue.packets) < QUEUE_LIMIT <= len(queue.packets) + len(batch):
+                for event in self.watchers.get(address, ()):
+                    event.set()
+            if queue.packets:
+                self.active.append(address)
+                if queue.rate is not None and not batch:
+                    # 受限于令牌而不是赤字，赤字不累积，避免限速解除后突发
+                    queue.deficit = min(queue.deficit, QUANTUM * queue.weight)
+                    needed = (len(queue.packets[0]) - queue.tokens) / queue.rate
+                    wait = needed if wait is None else min(wait, needed)
+            else:
+                queue.deficit = 0
+            if batch:
+                return batch, 0
+        return [], wait or 0.001
+
+    def remove(self, address):
+        """客户端传输结束且队列已清空时释放其调度状态"""
+        with self.condition:
+            queue = self.queues.get(address)
+            if queue is not None and not queue.packets:
+                del self.queues[address]
+
+    def stats(self, address=None):
+        """各客户端的调度统计；给定 address 时只返回该客户端的"""
+        with self.condition:
+            return {
+                f"{addr[0]}:{addr[1]}": {
+                    'queued': len(queue.packets),
+                    'served_bytes': queue.served_bytes,
+                    'served_packets': queue.served_packets,
+                    'weight': queue.weight,
+                    'rate': queue.rate,
+                }
+                for addr, queue in self.queues.items()
+                if address is None or addr == address
+            }
@@ -5,119 +5,263 @@ import argparse
 import hashlib
 import traceback
 import heapq
-from packet import Packet, FLAG_DATA, FLAG_ACK, FLAG_FIN, FLAG_REQ, FLAG_MD5, MSS
-from queue import Queue
+import os
+from packet import Packet, FLAG_DATA, FLAG_ACK, FLAG_FIN, FLAG_REQ, FLAG_MD5, FLAG_RESULT, FLAG_FILE, FLAG_PARITY, FLAG_NACK, FLAG_JOIN, MSS, timestamp, elapsed_since
+from fec import FecDecoder, make_parity, group_size_for_loss, MAX_GROUP_SIZE
+from buffer_pool import BufferPool
+from chunk_cache import ChunkCache, DEFAULT_CACHE_BUDGET
+from distribution import DistributionSender, DEFAULT_RATE
+from window import SendWindow
+from scheduler import EgressScheduler
+from socket_tuning import DropCounter, tune_socket, buffer_size_for_bdp, DEFAULT_BANDWIDTH, DEFAULT_RTT
+from path_cache import PathMetricsCache, warm_start
+from profiler import PROFILER, add_profile_arguments, enable_from_args
+from queue import Queue, Empty, Full
 
 SERVER_IP = '0.0.0.0'  # listening on all ports
 SERVER_PORT = 12345
+INGRESS_QUEUE_LIMIT = 1024  # 每个上传会话接收队列的默认上限（数据报数）
+MAX_REORDER = 4096  # 超出期望序列号这么多的分组视为窗口外，直接丢弃
 
 class ClientHandler(threading.Thread):
-    def __init__(self, sock, client_address, protocol):
+    def __init__(self, sock, client_address, protocol, pool, conn_id=0, queue_limit=INGRESS_QUEUE_LIMIT, shared_port=False):
         super().__init__(daemon=True)
         self.sock = sock
-        self.client_address = client_address
+        self.client_address = client_address  # 客户端地址可能在传输中途变化，由主循环按连接ID更新
         self.protocol = protocol
+        self.pool = pool
+        self.conn_id = conn_id
         self.expected_seq_num = 0
         self.received_packets = {}
         self.filename = f'received_file_{self.client_address[1]}'  
+        if shared_port:
+            # 多路复用时同一端口上有多个上传连接，文件名中加入连接ID避免互相覆盖
+            self.filename += f'_{self.conn_id:08x}'
         self.file = open(self.filename, 'wb')
         self.finished = False
-        self.queue = Queue()
-        self.lock = threading.Lock()
+        # 有界接收队列：写盘跟不上时在入队处丢包，而不是让内存无限增长
+        self.queue = Queue(maxsize=queue_limit)
+        self.max_depth = 0  # 观察到的最大队列长度
+        self.enqueued = 0
+        self.dropped_duplicate = 0  # 已交付或已缓存的重复分组（入队前直接回ACK）
+        self.dropped_window = 0  # 超出接收窗口的分组
+        self.dropped_full = 0  # 队列已满时丢弃的新分组
+        self.lock = PROFILER.wrap_lock(threading.Lock())
         self.md5_hash = hashlib.md5()
+        # 会话模式（多文件上传）下当前文件的状态
+        self.file_id = None  # 当前文件头分组的序列号
+        self.file_md5 = None
+        self.file_remaining = 0
+        self.file_results = []  # 已完成文件的 (文件头序列号, MD5)
+        self.fec = FecDecoder()  # 收到校验包后开始缓存分组，用于恢复丢失的数据包
 
     def run(self):
         print(f"Started handler for {self.client_address}")
         while not self.finished:
             try:
-                data = self.queue.get()
-                if not data:
-                    continue
+                packet, buf = self.queue.get()
 
-                try:
-                    packet = Packet.from_bytes(data)
-                except ValueError as ve:
-                    print(f"Malformed packet from {self.client_address}: {ve}")
-                    continue
-
-                if packet.flags == FLAG_DATA:
-                    if self.protocol == 'GBN':
-                        self.handle_gbn(packet)
-                    elif self.protocol == 'SR':
-                        self.handle_sr(packet)
+                if packet.flags in (FLAG_DATA, FLAG_FILE):
+                    self.handle_data(packet, buf)
+                elif packet.flags == FLAG_PARITY:
+                    self.handle_parity(packet)
+                    self.pool.release(buf)
                 elif packet.flags == FLAG_FIN:
+                    self.pool.release(buf)
                     print(f"Received FIN from {self.client_address}, closing connection.")
-                    ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK)
+                    ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
                     self.sock.sendto(ack_packet.to_bytes(), self.client_address)
                     self.finished = True
             except Exception as e:
                 print(f"An error occurred in handler {self.client_address}: {e}")
                 traceback.print_exc()
         self.file.close()
+        # 逐文件确认可能在途中丢失，结束时补发一遍
+        for file_id, file_md5 in self.file_results:
+            self.send_file_result(file_id, file_md5)
         md5_value = self.md5_hash.hexdigest()
         print(f"MD5 of received file from {self.client_address}: {md5_value}")
+        if self.fec.active:
+            print(f"FEC recovered {self.fec.recovered} packets from {self.client_address}")
+        print(f"Ingress queue for {self.client_address}: {self.ingress_stats()}")
 
-        md5_packet = Packet(flags=FLAG_MD5, payload=md5_value.encode('utf-8'))
+        md5_packet = Packet(flags=FLAG_MD5, payload=md5_value.encode('utf-8'), conn_id=self.conn_id)
         self.sock.sendto(md5_packet.to_bytes(), self.client_address)
         print(f"Sent MD5 checksum to {self.client_address}")
         print(f"Connection with {self.client_address} closed.")
 
+    def admit(self, packet, buf):
+        """由主循环在入队前调用：重复分组立即回ACK后丢弃，窗口外分组和队列已满时到达的分组直接丢弃。
+        被丢弃的分组归还缓冲区，返回是否已入队"""
+        if packet.flags in (FLAG_DATA, FLAG_FILE):
+            seq_num = packet.seq_num
+            if seq_num < self.expected_seq_num or seq_num in self.received_packets:
+                # 发送方重传通常是因为ACK丢失，不经过队列直接补发ACK
+                self.dropped_duplicate += 1
+                ack_num = seq_num if self.protocol == 'SR' else max(self.expected_seq_num - 1, 0)
+                ack_packet = Packet(ack_num=ack_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
+                self.sock.sendto(ack_packet.to_bytes(), self.client_address)
+                self.pool.release(buf)
+                return False
+            if seq_num >= self.expected_seq_num + MAX_REORDER:
+                self.dropped_window += 1
+                self.pool.release(buf)
+                return False
+        try:
+            self.queue.put_nowait((packet, buf))
+        except Full:
+            self.dropped_full += 1
+            self.pool.release(buf)
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def ingress_stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'max_depth': self.max_depth,
+            'limit': self.queue.maxsize,
+            'enqueued': self.enqueued,
+            'dropped_duplicate': self.dropped_duplicate,
+            'dropped_out_of_window': self.dropped_window,
+            'dropped_full': self.dropped_full,
+        }
+
+    def deliver(self, flags, payload):
+        """按序交付一个分组：文件头分组切换输出文件，数据分组写入当前文件"""
+        if flags == FLAG_FILE:
+            self.begin_file(payload)
+            return
+        with self.lock:
+            with PROFILER.phase('write'):
+                self.file.write(payload)
+            with PROFILER.phase('hash'):
+                self.md5_hash.update(payload)
+            if self.file_md5 is not None:
+                with PROFILER.phase('hash'):
+                    self.file_md5.update(payload)
+                self.file_remaining -= 1
+                if self.file_remaining == 0:
+                    self.end_file()
+
+    def begin_file(self, payload):
+        count, name = bytes(payload).decode('utf-8').split('\n', 1)
+        with self.lock:
+            if self.file_md5 is None and self.file.tell() == 0:
+                # 会话的第一个文件：丢弃默认创建的空文件
+                self.file.close()
+                os.remove(self.filename)
+            else:
+                self.file.close()
+            self.file_id = self.expected_seq_num
+            self.filename = f'received_file_{self.client_address[1]}_{os.path.basename(name)}'
+            self.file = open(self.filename, 'wb')
+            self.file_md5 = hashlib.md5()
+            self.file_remaining = int(count)
+            print(f"Receiving '{name}' ({count} packets) from {self.client_address}")
+            if self.file_remaining == 0:
+                self.end_file()
+
+    def end_file(self):
+        """当前文件接收完毕：异步回送该文件的MD5，发送方无需等待即可继续传输后续文件"""
+        self.file.flush()
+        file_md5 = self.file_md5.hexdigest()
+        self.file_results.append((self.file_id, file_md5))
+        self.send_file_result(self.file_id, file_md5)
+        print(f"Completed '{self.filename}' from {self.client_address}, MD5 {file_md5}")
+
+    def send_file_result(self, file_id, file_md5):
+        result_packet = Packet(ack_num=file_id, flags=FLAG_RESULT, payload=file_md5.encode('utf-8'), conn_id=self.conn_id)
+        self.sock.sendto(result_packet.to_bytes(), self.client_address)
+
+    def handle_data(self, packet, buf):
+        self.fec.add(packet, self.expected_seq_num)
+        if self.protocol == 'GBN':
+            self.handle_gbn(packet)
+            self.pool.release(buf)
+            # GBN丢弃的乱序分组在纠错缓存中仍有副本，缺口修复后依次交付
+            while self.fec.has(self.expected_seq_num):
+                self.handle_gbn(self.fec.get(self.expected_seq_num))
+        elif self.protocol == 'SR':
+            self.handle_sr(packet, buf)
+
+    def handle_parity(self, packet):
+        recovered = self.fec.recover(packet, self.expected_seq_num)
+        if recovered is not None:
+            print(f"Recovered packet {recovered.seq_num} from parity for {self.client_address}")
+            self.handle_data(recovered, None)
+
     def handle_gbn(self, packet):
         if packet.seq_num == self.expected_seq_num:
-            with self.lock:
-                self.file.write(packet.payload)
-                self.md5_hash.update(packet.payload)
+            self.deliver(packet.flags, packet.payload)
             print(f"Received packet {packet.seq_num} from {self.client_address}")
-            ack_packet = Packet(ack_num=self.expected_seq_num, flags=FLAG_ACK)
+            ack_packet = Packet(ack_num=self.expected_seq_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
             self.sock.sendto(ack_packet.to_bytes(), self.client_address)
             self.expected_seq_num += 1
         else:
             ack_num = max(self.expected_seq_num - 1, 0)
-            ack_packet = Packet(ack_num=ack_num, flags=FLAG_ACK)
+            ack_packet = Packet(ack_num=ack_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
             self.sock.sendto(ack_packet.to_bytes(), self.client_address)
 
-    def handle_sr(self, packet):
-        ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK)
+    def handle_sr(self, packet, buf):
+        ack_packet = Packet(ack_num=packet.seq_num, flags=FLAG_ACK, ts_ecr=packet.ts_val, conn_id=self.conn_id)
         self.sock.sendto(ack_packet.to_bytes(), self.client_address)
-        if packet.seq_num not in self.received_packets:
-            self.received_packets[packet.seq_num] = packet.payload
+        if packet.seq_num >= self.expected_seq_num and packet.seq_num not in self.received_packets:
+            # 乱序分组的负载仍指向接收缓冲区，写入文件后才归还
+            self.received_packets[packet.seq_num] = (packet.flags, packet.payload, buf)
             print(f"Received packet {packet.seq_num} from {self.client_address}")
             while self.expected_seq_num in self.received_packets:
-                with self.lock:
-                    self.file.write(self.received_packets[self.expected_seq_num])
-                    self.md5_hash.update(self.received_packets[self.expected_seq_num])
-                    del self.received_packets[self.expected_seq_num]
-                    self.expected_seq_num += 1
+                flags, payload, payload_buf = self.received_packets.pop(self.expected_seq_num)
+                self.deliver(flags, payload)
+                self.pool.release(payload_buf)
+                self.expected_seq_num += 1
+        else:
+            self.pool.release(buf)
 
 class FileSender(threading.Thread):
-    def __init__(self, sock, client_address, protocol, congestion_control, filename):
+    def __init__(self, sock, client_address, protocol, congestion_control, filename, cache, fec=False, conn_id=0, path_cache=None):
         super().__init__(daemon=True)
         self.sock = sock
         self.client_address = client_address
+        self.conn_id = conn_id
         self.protocol = protocol
         self.congestion_control = congestion_control
         self.filename = filename
-        self.md5_hash = hashlib.md5()
+        self.cache = cache
+        self.md5_value = ''
         self.file_data = self.read_file()
         self.total_packets = len(self.file_data)
         self.base = 0
         self.next_seq_num = 0
         self.window_size = 4  
         self.ssthresh = 16
-        self.ack_received = {}
-        self.RTT_times = {}
-        self.duplicate_ack_counts = {}
+        self.window = SendWindow()  # 在途分组的发送时间、确认标志和重传次数
         self.alpha = 0.125
         self.beta = 0.25
         self.estimated_RTT = 0.1
         self.dev_RTT = 0.05
         self.timeout_interval = 1.0
-        self.lock = threading.Lock()
+        self.fec = fec
+        self.fec_group_start = 0  # 当前校验组的首个序列号
+        self.fec_group_size = MAX_GROUP_SIZE
+        self.fec_highest_sent = -1  # 首次发送过的最大序列号，重传不参与分组
+        self.path_cache = path_cache
+        if path_cache is not None:
+            metrics = path_cache.lookup(client_address[0])
+            if metrics is not None:
+                loss = warm_start(self, metrics, self.window_size)
+                if loss > 0:
+                    self.fec_group_size = group_size_for_loss(loss)
+                print(f"Warm start for {client_address[0]}: window {self.window_size}, ssthresh {self.ssthresh}, "
+                      f"RTT {self.estimated_RTT:.4f}s, RTO {self.timeout_interval:.4f}s")
+        self.lock = PROFILER.wrap_lock(threading.Lock())
         self.running = True
         self.total_data_sent = 0
         self.start_time = None
         self.end_time = None
         self.ack_queue = Queue()
+        self.ack_event = threading.Event()  # 一批ACK处理完毕或出口队列腾出空间后唤醒发送线程
         
         self.timeout_heap = []  
         self.timeout_heap_lock = threading.Lock()
@@ -126,19 +270,14 @@ class FileSender(threading.Thread):
         self.timeout_thread.start()
 
     def read_file(self):
-        data = []
+        # 分块和MD5来自服务器共享缓存，多个客户端请求同一文件时只读盘和计算一次
         try:
-            with open(self.filename, 'rb') as f:
-                while True:
-                    chunk = f.read(MSS)
-                    if not chunk:
-                        break
-                    data.append(chunk)
-                    self.md5_hash.update(chunk)
+            entry = self.cache.get(self.filename)
         except FileNotFoundError:
             print(f"File '{self.filename}' not found. Cannot send to {self.client_address}.")
-            data = []
-        return data
+            return []
+        self.md5_value = entry.md5_value
+        return entry.chunks
 
     def run(self):
         if not self.file_data:
@@ -146,6 +285,7 @@ class FileSender(threading.Thread):
             self.running = False
             return
         self.start_time = time.time()
+        self.sock.watch(self.client_address, self.ack_event)
         threading.Thread(target=self.send_packets, daemon=True).start()
         threading.Thread(target=self.process_acks, daemon=True).start()
         while self.running:
@@ -156,72 +296,131 @@ class FileSender(threading.Thread):
         while self.running:
             with self.lock:
                 while self.next_seq_num < self.base + self.window_size and self.next_seq_num < self.total_packets:
-                    if self.next_seq_num not in self.ack_received:
+                    if not self.sock.has_room(self.client_address):
+                        break
+                    if not self.window.is_acked(self.next_seq_num):
                         payload = self.file_data[self.next_seq_num]
-                        packet = Packet(seq_num=self.next_seq_num, payload=payload)
+                        packet = Packet(seq_num=self.next_seq_num, payload=payload, ts_val=timestamp(), conn_id=self.conn_id)
                         self.sock.sendto(packet.to_bytes(), self.client_address)
                         send_time = time.time()
-                        self.RTT_times[self.next_seq_num] = send_time
+                        self.window.record_send(self.next_seq_num, send_time)
                         self.total_data_sent += len(packet.to_bytes())
                         print(f"Sent packet {self.next_seq_num} to {self.client_address}")
+                        self.send_parity_if_due(self.next_seq_num)
 
                         timeout_time = send_time + self.timeout_interval
                         with self.timeout_heap_lock:
                             heapq.heappush(self.timeout_heap, (timeout_time, self.next_seq_num))
                         
                         self.next_seq_num += 1
-            time.sleep(0.01)
+            self.ack_event.wait(0.01)
+            self.ack_event.clear()
+
+    def send_parity_if_due(self, seq_num):
+        """首次发送完一组数据包后追加一个校验包，组大小随测得的丢包率调整"""
+        if not self.fec or seq_num <= self.fec_highest_sent:
+            return
+        self.fec_highest_sent = seq_num
+        end = seq_num + 1
+        if end - self.fec_group_start < self.fec_group_size and end < self.total_packets:
+            return
+        group = [(FLAG_DATA, self.file_data[seq]) for seq in range(self.fec_group_start, end)]
+        parity = make_parity(self.fec_group_start, group)
+        parity.conn_id = self.conn_id
+        self.sock.sendto(parity.to_bytes(), self.client_address)
+        self.total_data_sent += len(parity.to_bytes())
+        self.fec_group_start = end
+        # 以需要重传的分组占比估计丢包率
+        self.fec_group_size = group_size_for_loss(self.window.retransmitted / end)
 
     def process_acks(self):
         while self.running:
             try:
-                ack_packet = self.ack_queue.get(timeout=0.1)
-                if ack_packet.flags == FLAG_ACK:
-                    ack_num = ack_packet.ack_num
-                    with self.lock:
-                        if ack_num in self.RTT_times:
-                            sample_RTT = time.time() - self.RTT_times[ack_num]
-                            self.estimated_RTT = (1 - self.alpha) * self.estimated_RTT + self.alpha * sample_RTT
-                            self.dev_RTT = (1 - self.beta) * self.dev_RTT + self.beta * abs(sample_RTT - self.estimated_RTT)
-                            self.timeout_interval = self.estimated_RTT + 4 * self.dev_RTT
-
-                        if ack_num >= self.base:
-                            self.ack_received[ack_num] = True
-
-                            with self.timeout_heap_lock:
-                                pass
-
-                            if self.protocol == 'SR':
-                                while self.base in self.ack_received and self.ack_received[self.base]:
-                                    self.base += 1
-                                    if self.base in self.duplicate_ack_counts:
-                                        del self.duplicate_ack_counts[self.base]
-                            elif ack_num >= self.base:
-                                self.base = ack_num + 1
-
-                            print(f"Received ACK {ack_num} from {self.client_address}, window moves to {self.base}")
-
-                            if self.congestion_control == 'loss':
-                                self.adjust_window_loss()
-                            elif self.congestion_control == 'delay':
-                                self.adjust_window_delay()
-
-                            if self.base >= self.total_packets and self.running:
-                                print(f"All packets ACKed by {self.client_address}.")
-                                self.running = False
-                                self.send_md5_and_fin()
-                        else:
-                            print(f"Received duplicate ACK {ack_num} from {self.client_address}")
-                            if self.protocol == 'SR':
-                                self.duplicate_ack_counts[ack_num] = self.duplicate_ack_counts.get(ack_num, 0) + 1
-                                if self.duplicate_ack_counts[ack_num] == 3:
-                                    print(f"Triple duplicate ACK for {ack_num}. Fast retransmit.")
-                                    self.handle_fast_retransmit(ack_num)
-                elif ack_packet.flags == FLAG_FIN:
+                # 阻塞等待第一个ACK，再一次性取出队列中积压的所有ACK，合并为一次状态更新
+                batch = [self.ack_queue.get(timeout=0.1)]
+            except Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self.ack_queue.get_nowait())
+                except Empty:
+                    break
+            try:
+                self.apply_acks(batch)
+            except Exception as e:
+                print(f"An error occurred while processing ACKs from {self.client_address}: {e}")
+                traceback.print_exc()
+            # 整批处理完后唤醒发送线程一次
+            self.ack_event.set()
+
+    def apply_acks(self, batch):
+        """处理一批ACK：逐个更新RTT和确认标志，窗口左沿只滑动一次，拥塞控制按新确认的分组数调整一次"""
+        with self.lock:
+            base_before = self.base
+            newly_acked = 0
+            highest_ack = None
+            for ack_packet in batch:
+                if ack_packet.flags == FLAG_FIN:
                     print(f"Received FIN from {self.client_address}")
                     self.running = False
-            except Exception:
-                continue
+                    continue
+                if ack_packet.flags != FLAG_ACK:
+                    continue
+                ack_num = ack_packet.ack_num
+                if ack_num >= self.window.sent_end:
+                    # 确认尚未发送的分组的ACK（伪造或错乱的报文）直接丢弃
+                    print(f"Ignored ACK {ack_num} beyond sent packets from {self.client_address}")
+                    continue
+                sample_RTT = self.sample_rtt(ack_packet)
+                if sample_RTT is not None:
+                    self.update_rtt(sample_RTT)
+
+                if ack_num >= self.base and not self.window.is_acked(ack_num):
+                    newly_acked += 1
+                    self.window.mark_acked(ack_num)
+                    highest_ack = ack_num if highest_ack is None else max(highest_ack, ack_num)
+                else:
+                    # SR的接收方逐个确认分组，重复ACK只说明该分组被重复收到，不代表丢包，丢包由逐包超时处理
+                    print(f"Received duplicate ACK {ack_num} from {self.client_address}")
+
+            if highest_ack is None:
+                return
+            if self.protocol == 'SR':
+                while self.window.is_acked(self.base) and self.base < self.total_packets:
+                    self.base += 1
+            elif highest_ack >= self.base:
+                # GBN的ACK是累积确认，批内最大的确认号即为新的左沿
+                newly_acked = highest_ack + 1 - self.base
+                self.base = highest_ack + 1
+            self.window.advance(self.base)
+
+            print(f"Received {len(batch)} ACKs (highest {highest_ack}) from {self.client_address}, window moves to {self.base}")
+
+            if newly_acked or self.base > base_before:
+                if self.congestion_control == 'loss':
+                    self.adjust_window_loss(newly_acked)
+                elif self.congestion_control == 'delay':
+                    self.adjust_window_delay(newly_acked)
+
+            if self.base >= self.total_packets and self.running:
+                print(f"All packets ACKed by {self.client_address}.")
+                self.running = False
+                self.send_md5_and_fin()
+
+    def sample_rtt(self, ack_packet):
+        """优先使用ACK回显的时间戳测量RTT；无回显时按Karn算法跳过重传过的分组"""
+        if ack_packet.ts_ecr:
+            return elapsed_since(ack_packet.ts_ecr)
+        ack_num = ack_packet.ack_num
+        send_time = self.window.sent_time(ack_num)
+        if send_time is not None and not self.window.retransmissions(ack_num):
+            return time.time() - send_time
+        return None
+
+    def update_rtt(self, sample_RTT):
+        self.estimated_RTT = (1 - self.alpha) * self.estimated_RTT + self.alpha * sample_RTT
+        self.dev_RTT = (1 - self.beta) * self.dev_RTT + self.beta * abs(sample_RTT - self.estimated_RTT)
+        self.timeout_interval = self.estimated_RTT + 4 * self.dev_RTT
 
     def receive_ack(self, packet):
         self.ack_queue.put(packet)
@@ -233,26 +432,16 @@ class FileSender(threading.Thread):
             with self.timeout_heap_lock:
                 while self.timeout_heap and self.timeout_heap[0][0] <= current_time:
                     timeout_time, seq_num = heapq.heappop(self.timeout_heap)
-                    if not self.ack_received.get(seq_num, False):
+                    if not self.window.is_acked(seq_num):
                         timed_out_packets.append(seq_num)
+                if len(self.timeout_heap) > 2 * (self.next_seq_num - self.base) + 64:
+                    # 已确认分组的超时项不会再触发，堆明显大于在途分组数时整体清理一次
+                    self.timeout_heap = [entry for entry in self.timeout_heap if not self.window.is_acked(entry[1])]
+                    heapq.heapify(self.timeout_heap)
             for seq_num in timed_out_packets:
                 self.handle_timeout(seq_num)
             time.sleep(0.05)  
 
-    def handle_fast_retransmit(self, ack_num):
-        with self.lock:
-            if ack_num < self.total_packets and not self.ack_received.get(ack_num, False):
-                packet = Packet(seq_num=ack_num, payload=self.file_data[ack_num])
-                self.sock.sendto(packet.to_bytes(), self.client_address)
-                send_time = time.time()
-                self.RTT_times[ack_num] = send_time
-                self.total_data_sent += len(packet.to_bytes())
-                print(f"Fast retransmitted packet {ack_num} to {self.client_address}")
-
-                timeout_time = send_time + self.timeout_interval
-                with self.timeout_heap_lock:
-                    heapq.heappush(self.timeout_heap, (timeout_time, ack_num))
-
     def handle_timeout(self, seq_num):
         with self.lock:
             if not self.running:
@@ -264,14 +453,15 @@ class FileSender(threading.Thread):
             print(f"Timeout occurred for packet {seq_num}")
             if self.protocol == 'GBN':
                 self.base = seq_num + 1
+                self.window.advance(self.base)
                 self.next_seq_num = self.base
                 print(f"GBN: Window reset to base {self.base}")
             if self.protocol == 'SR':
-                if seq_num < self.total_packets and not self.ack_received.get(seq_num, False):
-                    packet = Packet(seq_num=seq_num, payload=self.file_data[seq_num])
+                if seq_num < self.total_packets and not self.window.is_acked(seq_num):
+                    packet = Packet(seq_num=seq_num, payload=self.file_data[seq_num], ts_val=timestamp(), conn_id=self.conn_id)
                     self.sock.sendto(packet.to_bytes(), self.client_address)
                     send_time = time.time()
-                    self.RTT_times[seq_num] = send_time
+                    self.window.record_send(seq_num, send_time)
                     self.total_data_sent += len(packet.to_bytes())
                     print(f"Resent packet {seq_num} to {self.client_address}")
 
@@ -279,53 +469,70 @@ class FileSender(threading.Thread):
                     with self.timeout_heap_lock:
                         heapq.heappush(self.timeout_heap, (timeout_time, seq_num))
 
-    def adjust_window_loss(self):
-        if self.window_size < self.ssthresh:
+    def adjust_window_loss(self, acked=1):
+        """一批ACK只调整一次窗口，增长量与逐个ACK调整相同：慢启动阶段每个ACK翻倍，之后每个ACK加1"""
+        while acked and self.window_size < self.ssthresh:
             self.window_size *= 2
-            print(f"Congestion Control (Loss): Window size increased to {self.window_size}")
-        else:
-            self.window_size += 1
-            print(f"Congestion Control (Loss): Window size increased to {self.window_size}")
+            acked -= 1
+        self.window_size += acked
+        print(f"Congestion Control (Loss): Window size increased to {self.window_size}")
 
-    def adjust_window_delay(self):
+    def adjust_window_delay(self, acked=1):
         if not hasattr(self, 'base_RTT'):
             self.base_RTT = self.estimated_RTT
         diff = (self.window_size / self.estimated_RTT) - (self.window_size / self.base_RTT)
         alpha, beta = 1, 3
         if diff < alpha:
-            self.window_size += 1
+            self.window_size += acked
             print(f"Congestion Control (Delay): Window size increased to {self.window_size}")
         elif diff > beta:
-            self.window_size = max(1, self.window_size - 1)
+            self.window_size = max(1, self.window_size - acked)
             print(f"Congestion Control (Delay): Window size decreased to {self.window_size}")
 
     def send_md5_and_fin(self):
         md5_value = self.compute_md5()
-        md5_packet = Packet(flags=FLAG_MD5, payload=md5_value.encode('utf-8'))
+        md5_packet = Packet(flags=FLAG_MD5, payload=md5_value.encode('utf-8'), conn_id=self.conn_id)
         self.sock.sendto(md5_packet.to_bytes(), self.client_address)
         print(f"Sent MD5 checksum to {self.client_address}")
 
-        fin_packet = Packet(flags=FLAG_FIN)
+        fin_packet = Packet(flags=FLAG_FIN, conn_id=self.conn_id)
         self.sock.sendto(fin_packet.to_bytes(), self.client_address)
         print(f"Sent FIN to {self.client_address}")
 
     def compute_md5(self):
-        return self.md5_hash.hexdigest()
+        return self.md5_value
 
     def finish(self):
         self.end_time = time.time()
 
-        md5_value = self.md5_hash.hexdigest()
-        md5_packet = Packet(flags=FLAG_MD5, payload=md5_value.encode('utf-8'))
+        md5_value = self.md5_value
+        md5_packet = Packet(flags=FLAG_MD5, payload=md5_value.encode('utf-8'), conn_id=self.conn_id)
         self.sock.sendto(md5_packet.to_bytes(), self.client_address)
         print(f"Sent MD5 checksum to {self.client_address}")
 
-        fin_packet = Packet(flags=FLAG_FIN)
+        fin_packet = Packet(flags=FLAG_FIN, conn_id=self.conn_id)
         self.sock.sendto(fin_packet.to_bytes(), self.client_address)
         print(f"Sent FIN to {self.client_address}")
 
         print(f"File transfer to {self.client_address} completed.")
+        self.sock.unwatch(self.client_address, self.ack_event)
+        print(f"Egress scheduler: {self.sock.stats(self.client_address)}")
         self.calculate_performance()
+        if self.base >= self.total_packets:
+            # 客户端中途发送FIN结束的传输不完整，其吞吐量不能代表路径带宽
+            self.record_path_metrics()
+
+    def record_path_metrics(self):
+        """把本次传输测得的路径特性写入缓存，供之后发往同一主机的传输热启动"""
+        if self.path_cache is None:
+            return
+        file_size = sum(len(chunk) for chunk in self.file_data)
+        transfer_time = self.end_time - self.start_time
+        # 未发生丢包时ssthresh没有被探测到，以最终窗口作为路径能承受的下限
+        ssthresh = self.ssthresh if self.window.retransmitted else max(self.ssthresh, self.window_size)
+        self.path_cache.update(self.client_address[0], self.estimated_RTT, self.dev_RTT, ssthresh,
+                               file_size / transfer_time if transfer_time > 0 else 0,
+                               self.window.retransmitted / self.total_packets)
 
     def calculate_performance(self):
         file_size = sum(len(chunk) for chunk in self.file_data)
@@ -341,69 +548,179 @@ class FileSender(threading.Thread):
         print(f"Flow utilization rate: {flow_utilization:.4f}")
 
 class ReliableUDPServer:
-    def __init__(self, protocol, congestion_control):
+    def __init__(self, protocol, congestion_control, cache_budget=DEFAULT_CACHE_BUDGET, fec=False, distribution_rate=DEFAULT_RATE,
+                 weights=None, rate_limits=None, rcvbuf=None, sndbuf=None, path_cache=None, ingress_limit=INGRESS_QUEUE_LIMIT):
         self.server_address = (SERVER_IP, SERVER_PORT)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock = PROFILER.wrap_socket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
         self.sock.bind(self.server_address)
+        tune_socket(self.sock, rcvbuf, sndbuf)
+        self.drops = DropCounter(self.sock)
         self.protocol = protocol
         self.congestion_control = congestion_control
-        self.client_handlers = {}
-        self.file_senders = {}
+        self.client_handlers = {}  # 连接键 -> ClientHandler
+        self.file_senders = {}  # 连接键 -> FileSender
         self.sender_lock = threading.Lock()
+        self.pool = BufferPool()
+        self.cache = ChunkCache(cache_budget)
+        self.fec = fec
+        self.path_cache = path_cache  # 各客户端主机的路径测量值，None表示不热启动
+        self.ingress_limit = ingress_limit
+        self.distribution_rate = distribution_rate
+        self.distributions = {}  # 文件名 -> 仍在接受加入的 DistributionSender
+        self.distribution_members = {}  # 接收方地址 -> 所属的 DistributionSender
+        # 所有FileSender经由同一个出口调度器发送，按权重公平分享带宽
+        self.scheduler = EgressScheduler(self.sock, weights, rate_limits)
+        self.scheduler.start()
+
+    def join_distribution(self, filename, client_address):
+        """把接收方加入该文件正在等待加入的分发；没有则新建一次分发"""
+        member = self.distribution_members.get(client_address)
+        if member is not None and member.is_alive() and member.filename == filename:
+            # 客户端重发的 JOIN，已在进行中的分发里，不再另起一次
+            print(f"Duplicate distribution join from {client_address}, ignoring.")
+            return
+        sender = self.distributions.get(filename)
+        if sender is None or not sender.add_receiver(client_address):
+            sender = DistributionSender(self.sock, filename, self.cache, self.distribution_rate)
+            sender.add_receiver(client_address)
+            self.distributions[filename] = sender
+            sender.start()
+        self.distribution_members[client_address] = sender
+
+    def track_address(self, peer, client_address):
+        """连接ID不变而地址变化（如NAT重绑定）时，后续报文发往新地址"""
+        if peer.client_address != client_address:
+            print(f"Connection {peer.conn_id:08x} moved from {peer.client_address} to {client_address}")
+            peer.client_address = client_address
 
     def start(self):
         print("Server started, waiting for data...")
         while True:
             try:
-                data, client_address = self.sock.recvfrom(4096)
+                buf = self.pool.acquire()
+                nbytes, client_address = self.drops.receive_into(buf)
 
                 try:
-                    packet = Packet.from_bytes(data)
+                    packet = Packet.from_bytes(memoryview(buf)[:nbytes])
                 except ValueError as ve:
                     print(f"Malformed or incomplete packet from {client_address}: {ve}")
+                    self.pool.release(buf)
                     continue
 
+                if packet.flags not in (FLAG_DATA, FLAG_FILE, FLAG_PARITY, FLAG_FIN):
+                    # 仅DATA/FILE/PARITY/FIN需要把缓冲区交给ClientHandler，其余报文在此处理完即可归还
+                    packet.payload = bytes(packet.payload)
+                    self.pool.release(buf)
+                # 携带连接ID的报文按连接ID区分连接，同一端点可复用多个连接；旧客户端仍按地址区分
+                key = packet.conn_id or client_address
+
                 if packet.flags == FLAG_REQ:
                     filename = packet.payload.decode('utf-8')
                     print(f"Received file request for '{filename}' from {client_address}")
                     with self.sender_lock:
-                        if client_address not in self.file_senders or not self.file_senders[client_address].is_alive():
-                            sender = FileSender(self.sock, client_address, self.protocol, self.congestion_control, filename)
-                            self.file_senders[client_address] = sender
+                        if key not in self.file_senders or not self.file_senders[key].is_alive():
+                            sender = FileSender(self.scheduler, client_address, self.protocol, self.congestion_control, filename, self.cache, self.fec,
+                                                packet.conn_id, self.path_cache)
+                            self.file_senders[key] = sender
                             sender.start()
-                elif packet.flags in (FLAG_DATA, FLAG_FIN):
-                    if client_address not in self.client_handlers or not self.client_handlers[client_address].is_alive():
-                        handler = ClientHandler(self.sock, client_address, self.protocol)
-                        self.client_handlers[client_address] = handler
+                            print(f"Chunk cache: {self.cache.stats()}")
+                elif packet.flags in (FLAG_DATA, FLAG_FILE, FLAG_PARITY, FLAG_FIN):
+                    if key not in self.client_handlers or not self.client_handlers[key].is_alive():
+                        shared_port = packet.conn_id != 0 and any(
+                            other.client_address == client_address and other.is_alive() for other in self.client_handlers.values())
+                        handler = ClientHandler(self.sock, client_address, self.protocol, self.pool, packet.conn_id, self.ingress_limit,
+                                                shared_port)
+                        self.client_handlers[key] = handler
                         handler.start()
-                    self.client_handlers[client_address].queue.put(data)
+                    self.track_address(self.client_handlers[key], client_address)
+                    self.client_handlers[key].admit(packet, buf)
+                elif packet.flags == FLAG_JOIN:
+                    filename = packet.payload.decode('utf-8')
+                    print(f"Received distribution join for '{filename}' from {client_address}")
+                    self.join_distribution(filename, client_address)
+                elif packet.flags in (FLAG_NACK, FLAG_RESULT):
+                    sender = self.distribution_members.get(client_address)
+                    if sender is None:
+                        print(f"Received distribution feedback from {client_address} with no active distribution.")
+                    elif packet.flags == FLAG_NACK:
+                        sender.receive_nack(client_address, packet)
+                    else:
+                        sender.receive_result(client_address, packet)
                 elif packet.flags == FLAG_ACK:
                     with self.sender_lock:
-                        if client_address in self.file_senders:
-                            self.file_senders[client_address].receive_ack(packet)
+                        if key in self.file_senders:
+                            self.track_address(self.file_senders[key], client_address)
+                            self.file_senders[key].receive_ack(packet)
                         else:
                             print(f"Received ACK from {client_address} with no active FileSender.")
                 else:
                     print(f"Received packet with unknown flags from {client_address}, ignoring.")
 
-                for addr, handler in list(self.client_handlers.items()):
+                for key, handler in list(self.client_handlers.items()):
                     if not handler.is_alive():
-                        del self.client_handlers[addr]
-                for addr, sender in list(self.file_senders.items()):
+                        del self.client_handlers[key]
+                        print(self.drops.report())
+                for key, sender in list(self.file_senders.items()):
+                    if not sender.is_alive():
+                        del self.file_senders[key]
+                        print(self.drops.report())
+                        self.scheduler.remove(sender.client_address)
+                for addr, sender in list(self.distribution_members.items()):
+                    if not sender.is_alive():
+                        del self.distribution_members[addr]
+                for filename, sender in list(self.distributions.items()):
                     if not sender.is_alive():
-                        del self.file_senders[addr]
+                        del self.distributions[filename]
 
             except Exception as e:
                 print(f"An error occurred in main server: {e}")
                 traceback.print_exc()
 
+def parse_positive(parser, option, items):
+    """解析 HOST[:PORT]=VALUE 形式的参数，值必须是正数"""
+    values = {}
+    for item in items:
+        key, sep, value = item.rpartition('=')
+        try:
+            number = float(value)
+        except ValueError:
+            number = None
+        if not sep or not key or number is None or not number > 0:
+            parser.error(f"{option} expects HOST[:PORT]=VALUE with a positive VALUE, got {item!r}")
+        values[key] = number
+    return values
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--protocol', choices=['GBN', 'SR'], required=True)
     parser.add_argument('--congestion', choices=['loss', 'delay'], required=True)
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BUDGET // (1024 * 1024),
+                        help='memory budget of the shared chunk cache for downloads')
+    parser.add_argument('--fec', action='store_true', help='send XOR parity packets with downloads')
+    parser.add_argument('--dist-rate', type=int, default=DEFAULT_RATE,
+                        help='sending rate (packets/second) of one-to-many distributions')
+    parser.add_argument('--weight', action='append', default=[], metavar='HOST[:PORT]=WEIGHT',
+                        help='egress scheduling weight of a client (default 1)')
+    parser.add_argument('--rate-limit', action='append', default=[], metavar='HOST[:PORT]=BYTES_PER_SEC',
+                        help='egress rate limit of a client')
+    parser.add_argument('--ingress-limit', type=int, default=INGRESS_QUEUE_LIMIT,
+                        help='maximum queued datagrams per upload session before new ones are dropped')
+    parser.add_argument('--path-cache', metavar='FILE',
+                        help='warm-start downloads from per-client path metrics kept in FILE (default: off)')
+    parser.add_argument('--rcvbuf', type=int, help='SO_RCVBUF in bytes (default: sized from --bandwidth and --rtt)')
+    parser.add_argument('--sndbuf', type=int, help='SO_SNDBUF in bytes (default: sized from --bandwidth and --rtt)')
+    parser.add_argument('--bandwidth', type=float, default=DEFAULT_BANDWIDTH, help='link bandwidth in Mbit/s for buffer sizing')
+    parser.add_argument('--rtt', type=float, default=DEFAULT_RTT, help='round-trip time in ms for buffer sizing')
+    add_profile_arguments(parser)
     args = parser.parse_args()
-
-    server = ReliableUDPServer(args.protocol, args.congestion)
+    enable_from_args(args, 'server')
+    bdp_buffer = buffer_size_for_bdp(args.bandwidth, args.rtt)
+    weights = parse_positive(parser, '--weight', args.weight)
+    rate_limits = parse_positive(parser, '--rate-limit', args.rate_limit)
+
+    server = ReliableUDPServer(args.protocol, args.congestion, args.cache_mb * 1024 * 1024, args.fec, args.dist_rate,
+                               weights, rate_limits, args.rcvbuf or bdp_buffer, args.sndbuf or bdp_buffer,
+                               PathMetricsCache(args.path_cache) if args.path_cache else None, args.ingress_limit)
     server.start()
 
 if __name__ == '__main__':
@@ -0,0 +1,100 @@
+from array import array
+
+INITIAL_CAPACITY = 64  # 初始槽位数，必须是2的幂
+
+class SendWindow:
+    """发送窗口内每个分组的状态：发送时间、是否已确认、重传次数和定时器。
+    状态按序列号存放在环形数组中，base 前移时槽位清零复用，内存与窗口大小而不是文件大小成正比。
+    只有发送路径（record_send、set_timer）会扩容，收到的ACK不会让数组增长"""
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.base = 0  # 仍在跟踪的最小序列号，更小的序列号都已确认
+        self.allocate(capacity)
+        self.retransmitted = 0  # 至少重传过一次的分组数量
+        self.sent_end = 0  # 发送过的最大序列号加一，GBN回退后也不减小
+
+    def allocate(self, capacity):
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.send_times = array('d', bytes(8 * capacity))  # 最近一次发送时间，0表示未发送
+        self.acked = bytearray(capacity)  # 是否已确认
+        self.retransmits = array('I', bytes(4 * capacity))  # 重传次数
+        self.timers = [None] * capacity  # 逐包定时器（仅客户端SR使用）
+
+    def ensure(self, seq):
+        """序列号超出当前环形数组范围时按2的幂扩容，并把已有状态搬到新位置"""
+        if seq < self.base + self.capacity:
+            return
+        capacity = self.capacity
+        while seq >= self.base + capacity:
+            capacity *= 2
+        old = (self.mask, self.send_times, self.acked, self.retransmits, self.timers)
+        old_capacity = self.capacity
+        self.allocate(capacity)
+        old_mask, send_times, acked, retransmits, timers = old
+        for s in range(self.base, self.base + old_capacity):
+            i, j = s & old_mask, s & self.mask
+            self.send_times[j] = send_times[i]
+            self.acked[j] = acked[i]
+            self.retransmits[j] = retransmits[i]
+            self.timers[j] = timers[i]
+
+    def advance(self, new_base):
+        """窗口左沿前移，回收 new_base 之前的槽位"""
+        for s in range(self.base, min(new_base, self.base + self.capacity)):
+            i = s & self.mask
+            self.send_times[i] = 0
+            self.acked[i] = 0
+            self.retransmits[i] = 0
+            self.timers[i] = None
+        self.base = max(self.base, new_base)
+
+    def record_send(self, seq, send_time):
+        """记录一次发送；该分组此前发送过时计为重传并返回 True"""
+        self.ensure(seq)
+        i = seq & self.mask
+        retransmission = self.send_times[i] != 0
+        if retransmission:
+            if self.retransmits[i] == 0:
+                self.retransmitted += 1
+            self.retransmits[i] += 1
+        self.send_times[i] = send_time
+        self.sent_end = max(self.sent_end, seq + 1)
+        return retransmission
+
+    def sent_time(self, seq):
+        """返回最近一次发送时间；不在窗口内或尚未发送时返回 None"""
+        if seq < self.base or seq >= self.base + self.capacity:
+            return None
+        return self.send_times[seq & self.mask] or None
+
+    def retransmissions(self, seq):
+        if seq < self.base or seq >= self.base + self.capacity:
+            return 0
+        return self.retransmits[seq & self.mask]
+
+    def is_acked(self, seq):
+        if seq < self.base:
+            return True
+        if seq >= self.base + self.capacity:
+            return False
+        return bool(self.acked[seq & self.mask])
+
+    def mark_acked(self, seq):
+        """标记已确认；超出环形数组范围的序列号不可能已发送，直接忽略"""
+        if seq < self.base or seq >= self.base + self.capacity:
+            return
+        self.acked[seq & self.mask] = 1
+
+    def set_timer(self, seq, timer):
+        self.ensure(seq)
+        self.timers[seq & self.mask] = timer
+
+    def pop_timer(self, seq):
+        if seq < self.base or seq >= self.base + self.capacity:
+            return None
+        i = seq & self.mask
+        timer, self.timers[i] = self.timers[i], None
+        return timer
+
+    def all_timers(self):
+        return [timer for timer in self.timers if timer is not None]
@@ -0,0 +1,130 @@
+import os
+import shlex
+import signal
+import time
+from subprocess import STDOUT
+
+# 运行实验所需的网络操作接口。扫描程序只通过下面这些方法操作网络：
+#   start(links)                 按链路列表建立网络
+#   ip(host)                     主机的IP地址
+#   popen(host, args, output)    在主机上后台运行命令，输出写入文件，返回类似 Popen 的对象
+#   clock() / sleep(seconds)     时间，替身可以用虚拟时钟
+#   stop()                       停止网络
+# MininetBackend 使用真实的 Mininet（需要 root 权限），StubBackend 是不需要 root 的本地替身
+
+# 使用 Mininet 和 customized_topo.py 中的 NoLearnSwitch 建立网络
+class MininetBackend:
+    def __init__(self):
+        self.net = None
+        self.logs = []
+
+    def start(self, links):
+        if hasattr(os, 'geteuid') and os.geteuid() != 0:
+            raise PermissionError('Mininet must be run as root (use --stub to test without it)')
+        from mininet.link import TCLink
+        from mininet.net import Mininet
+        from mininet.topo import Topo
+        from customized_topo import NoLearnSwitch
+
+        class SpecTopo(Topo):
+            """按链路列表建立的拓扑，名称以 s 开头的节点为交换机，其余为主机"""
+
+            def __init__(self):
+                Topo.__init__(self)
+                for a, b, params in links:
+                    for name in (a, b):
+                        if name in self.nodes():
+                            continue
+                        if name.startswith('s'):
+                            self.addSwitch(name, cls=NoLearnSwitch, protocols='OpenFlow13')
+                        else:
+                            self.addHost(name)
+                    self.addLink(a, b, **params)
+
+        self.net = Mininet(topo=SpecTopo(), link=TCLink, controller=None, switch=NoLearnSwitch)
+        self.net.start()
+
+    def ip(self, host):
+        return self.net.get(host).IP()
+
+    def popen(self, host, args, output):
+        log = open(output, 'w')
+        self.logs.append(log)
+        return self.net.get(host).popen(args, stdout=log, stderr=STDOUT)
+
+    def clock(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def stop(self):
+        if self.net is not None:
+            self.net.stop()
+            self.net = None
+        for log in self.logs:
+            log.close()
+        self.logs = []
+
+# 替身中的一个后台进程：iperf 客户端在 -t 指定的时长后结束，服务器一直运行到收到信号
+class StubProcess:
+    def __init__(self, backend, host, args, output):
+        self.backend = backend
+        self.host = host
+        self.args = args
+        self.output = output
+        self.returncode = None
+        self.finish_at = None
+        if '-c' in args:
+            duration = float(args[args.index('-t') + 1]) if '-t' in args else 10.0
+            self.finish_at = backend.clock() + duration
+        with open(output, 'w') as f:
+            f.write(f"stub: {host} {shlex.join(args)}\n")
+
+    def poll(self):
+        if self.returncode is None and self.finish_at is not None and self.backend.clock() >= self.finish_at:
+            self.returncode = 0
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None and self.finish_at is not None:
+            self.backend.sleep(max(0.0, self.finish_at - self.backend.clock()))
+        return self.poll()
+
+    def send_signal(self, signum):
+        if self.returncode is None:
+            self.returncode = -signum
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+# 不需要 root 和 Mininet 的替身：记录所有调用，用虚拟时钟代替等待，
+# 使扫描程序的调度、完成检测和输出目录逻辑可以在普通用户下快速检查
+class StubBackend:
+    def __init__(self):
+        self.now = 0.0
+        self.calls = []  # (虚拟时刻, 操作, 参数)
+        self.links = None
+
+    def start(self, links):
+        self.links = links
+        self.calls.append((self.now, 'start', links))
+
+    def ip(self, host):
+        return f'10.0.0.{int(host[1:])}'
+
+    def popen(self, host, args, output):
+        self.calls.append((self.now, 'popen', (host, args)))
+        return StubProcess(self, host, args, output)
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def stop(self):
+        self.calls.append((self.now, 'stop', None))
@@ -0,0 +1,283 @@
+import argparse
+import json
+import os
+import re
+import time
+from collections import deque
+
+import numpy as np
+
+from iperf_trace import IperfTraces, load_directories, write_log
+from topo_spec import DEFAULT_SPEC, build_flows, build_links
+
+# 与 customized_topo.py 中 MyTopo 相同的链路：(端点1, 端点2, addLink 的参数)
+DUMBBELL_LINKS = build_links(DEFAULT_SPEC)
+# 与 host_iperf.py 相同的流调度：(源, 目的, 开始时刻, 持续时间)
+DUMBBELL_FLOWS = build_flows(DEFAULT_SPEC)
+
+# 仿真步长（秒），应远小于最小往返时延
+DT = 0.001
+# 输出记录的间隔（秒），与 iperf -i 0.5 一致
+INTERVAL = 0.5
+# 报文在链路上的比特数，以及其中应用数据所占的比例（1448 字节数据 / 1514 字节以太网帧）
+PACKET_BITS = 1514 * 8
+PAYLOAD_RATIO = 1448 / 1514
+# 未指定 max_queue_size 时链路队列的长度（报文数），与 netem 的默认 limit 一致
+DEFAULT_QUEUE = 1000
+# 拥塞窗口的上限（报文数）和初始值
+MAX_WINDOW = 4096
+INITIAL_WINDOW = 10
+# 重传超时的下限（秒）和最大退避次数，与 Linux 一致
+RTO_MIN = 0.2
+MAX_BACKOFF = 6
+# CUBIC 的参数：窗口增长系数 C 和乘性减小后保留的比例 β
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+
+# 解析 Mininet 风格的时延字符串，如 '2ms'、'500us'，返回秒
+def parse_delay(delay):
+    if isinstance(delay, (int, float)):
+        return delay / 1000
+    match = re.fullmatch(r'\s*([\d.]+)\s*(us|ms|s)?\s*', delay)
+    if not match:
+        raise ValueError(f'bad delay: {delay!r}')
+    return float(match[1]) * {'us': 1e-6, 'ms': 1e-3, 's': 1.0}[match[2] or 'ms']
+
+# 在无向拓扑中用广度优先搜索找出从 src 到 dst 经过的链路下标
+def find_path(links, src, dst):
+    neighbours = {}
+    for index, (a, b, _) in enumerate(links):
+        neighbours.setdefault(a, []).append((b, index))
+        neighbours.setdefault(b, []).append((a, index))
+    previous = {src: None}
+    queue = deque([src])
+    while queue:
+        node = queue.popleft()
+        if node == dst:
+            break
+        for peer, index in neighbours.get(node, []):
+            if peer not in previous:
+                previous[peer] = (node, index)
+                queue.append(peer)
+    if dst not in previous:
+        raise ValueError(f'no path from {src} to {dst}')
+    path, node = [], dst
+    while previous[node] is not None:
+        node, index = previous[node]
+        path.append(index)
+    return path[::-1]
+
+# 流级（流体）仿真器：不模拟单个报文，而是按时间步推进每条TCP流的拥塞窗口，
+# 由窗口和往返时延得到发送速率，再按链路容量、队列和随机丢包计算实际送达的速率。
+# 同时模拟一批参数不同的场景（如不同丢包率或不同随机种子），各场景的状态是数组的一行，
+# 每个时间步只需若干次向量运算，与场景数几乎无关
+class FluidModel:
+    def __init__(self, links, flows, algorithm='cubic', dt=DT, interval=INTERVAL):
+        self.links = links
+        self.flows = flows
+        self.algorithm = algorithm
+        self.dt = dt
+        self.interval = interval
+        # 每条流依次经过的链路，以及关联矩阵 [流, 链路]
+        self.paths = [find_path(links, src, dst) for src, dst, _, _ in flows]
+        self.route = np.zeros((len(flows), len(links)), dtype=bool)
+        for f, path in enumerate(self.paths):
+            self.route[f, path] = True
+        self.start = np.array([flow[2] for flow in flows], dtype=np.float64)
+        self.end = self.start + np.array([flow[3] for flow in flows], dtype=np.float64)
+
+    # 每个场景的链路参数矩阵 [场景, 链路]；overrides 为每个场景的 {(端点1, 端点2): {参数: 值}}
+    def link_params(self, overrides):
+        bw = np.empty((len(overrides), len(self.links)))
+        delay, loss, queue = np.empty_like(bw), np.empty_like(bw), np.empty_like(bw)
+        for b, override in enumerate(overrides):
+            for l, (a, c, params) in enumerate(self.links):
+                params = dict(params, **override.get((a, c), {}))
+                bw[b, l] = params['bw'] * 1e6
+                delay[b, l] = parse_delay(params.get('delay', 0))
+                loss[b, l] = params.get('loss', 0) / 100
+                queue[b, l] = (params.get('max_queue_size') or DEFAULT_QUEUE) * PACKET_BITS
+        return bw, delay, loss, queue
+
+    # 运行一批场景，返回每个场景每条流每个记录间隔的 (发送字节数, 送达字节数)，形状 [场景, 流, 间隔]
+    def simulate(self, overrides, seed=0):
+        rng = np.random.default_rng(seed)
+        bw, delay, loss, queue_limit = self.link_params(overrides)
+        route = self.route.astype(np.float64)
+        batch, flows = len(overrides), len(self.flows)
+        base_rtt = 2 * delay @ route.T  # [场景, 流]
+        # 路径上的随机丢包率：1 - Π(1 - 各链路丢包率)
+        random_loss = 1 - np.exp(np.log1p(-np.minimum(loss, 0.999)) @ route.T)
+
+        cwnd = np.full((batch, flows), float(INITIAL_WINDOW))
+        ssthresh = np.full((batch, flows), float(MAX_WINDOW))
+        w_max = np.zeros((batch, flows))
+        epoch = np.zeros((batch, flows))  # CUBIC 本轮增长开始的时刻
+        last_reduce = np.full((batch, flows), -np.inf)  # 每个往返时延内只响应一次丢包
+        paused_until = np.zeros((batch, flows))  # 重传超时结束的时刻
+        backoff = np.zeros((batch, flows))
+        queue = np.zeros((batch, len(self.links)))  # 各链路队列中的比特数
+
+        steps = int(np.ceil(self.end.max() / self.dt))
+        depth = max(len(path) for path in self.paths)
+        intervals = int(np.ceil(self.end.max() / self.interval))
+        sent = np.zeros((batch, flows, intervals))
+        delivered = np.zeros((batch, flows, intervals))
+
+        for step in range(steps):
+            t = step * self.dt
+            active = (t >= self.start) & (t < self.end)
+            if not active.any():
+                continue
+            # 排队时延只计入去程方向
+            rtt = base_rtt + (queue / bw) @ route.T
+            sending = active & (t >= paused_until)
+            rate = np.where(sending, cwnd * PACKET_BITS / rtt, 0.0)
+
+            # 各链路的到达速率；超过容量时按比例服务，多出的部分进入队列，队列满后被丢弃。
+            # 流到达下游链路的速率已被上游链路限制，因此沿路径逐跳迭代，迭代次数为最长路径的跳数
+            upstream = np.ones((batch, flows, len(self.links)))
+            share = np.ones((batch, flows))
+            for _ in range(depth):
+                arrival = np.einsum('bf,bfl->bl', rate, upstream * route)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    service = np.where(arrival > bw, bw / arrival, 1.0)
+                for f, path in enumerate(self.paths):
+                    passed = np.cumprod(service[:, path], axis=1)
+                    upstream[:, f, path[1:]] = passed[:, :-1]
+                    share[:, f] = passed[:, -1]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                queue = np.clip(queue + (arrival - bw) * self.dt, 0, queue_limit)
+                overflow = np.where((queue >= queue_limit) & (arrival > bw), 1 - bw / arrival, 0.0)
+            congestion_loss = 1 - np.exp(np.log1p(-np.minimum(overflow, 0.999)) @ route.T)
+
+            index = min(int(t / self.interval), intervals - 1)
+            sent[:, :, index] += rate * self.dt
+            delivered[:, :, index] += rate * share * (1 - random_loss) * self.dt
+
+            # 本步内是否发生丢包（至少丢失一个报文）
+            packets = rate * self.dt / PACKET_BITS
+            lost = 1 - (1 - random_loss) * (1 - congestion_loss)
+            loss_event = sending & (rng.random((batch, flows)) < 1 - (1 - lost) ** packets)
+            react = loss_event & (t - last_reduce >= rtt)
+            # 有 SACK 和早重传时，窗口不足 2 个报文（收不到重复ACK）或重传的报文再次被随机丢弃才会等到超时；
+            # 队列溢出造成的成批丢包由 SACK 在一次快速恢复中修复
+            timeout = react & ((cwnd < 2) | (rng.random((batch, flows)) < random_loss))
+            fast = react & ~timeout
+
+            ssthresh = np.where(react, np.maximum(cwnd / 2, 2), ssthresh)
+            w_max = np.where(react, cwnd, w_max)
+            epoch = np.where(react, t, epoch)
+            last_reduce = np.where(react, t, last_reduce)
+            if self.algorithm == 'cubic':
+                cwnd = np.where(fast, np.maximum(cwnd * CUBIC_BETA, 2), cwnd)
+            else:
+                cwnd = np.where(fast, ssthresh, cwnd)
+            rto = np.maximum(RTO_MIN, 2 * rtt) * 2 ** backoff
+            paused_until = np.where(timeout, t + rto, paused_until)
+            backoff = np.where(timeout, np.minimum(backoff + 1, MAX_BACKOFF), backoff)
+            cwnd = np.where(timeout, 1.0, cwnd)
+            backoff = np.where(sending & ~loss_event & (cwnd >= 2), 0, backoff)
+
+            # 没有丢包的流增大窗口：慢启动每个往返时延翻倍，拥塞避免按 Reno 或 CUBIC 增长
+            grow = sending & ~loss_event
+            slow_start = cwnd < ssthresh
+            if self.algorithm == 'cubic':
+                elapsed = t - epoch
+                k = np.cbrt(w_max * (1 - CUBIC_BETA) / CUBIC_C)
+                target = CUBIC_C * (elapsed - k) ** 3 + w_max
+                # TCP 友好区域：不慢于同样条件下的 Reno
+                reno = w_max * CUBIC_BETA + 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * elapsed / rtt
+                increase = np.clip(np.maximum(target, reno) - cwnd, 0, cwnd / 2) * self.dt / rtt
+            else:
+                increase = self.dt / rtt
+            increase = np.where(slow_start, cwnd * self.dt / rtt, increase)
+            cwnd = np.where(grow, np.minimum(cwnd + increase, MAX_WINDOW), cwnd)
+
+        return sent * PAYLOAD_RATIO / 8, delivered * PAYLOAD_RATIO / 8
+
+    # 把仿真结果转换为与解析 iperf 日志相同的 IperfTraces：发送端记录发送量，接收端记录送达量，
+    # 只保留流在发送的间隔
+    def to_traces(self, sent, delivered, runs):
+        batch, flows, intervals = sent.shape
+        start = np.arange(intervals) * self.interval
+        end = np.minimum(start + self.interval, self.end.max())
+        run, flow, index = np.meshgrid(np.arange(batch), np.arange(flows), np.arange(intervals), indexing='ij')
+        keep = (start[index] >= self.start[flow] - 1e-9) & (start[index] < self.end[flow] - 1e-9)
+        run, flow, index = run[keep], flow[keep], index[keep]
+        loss = np.array([loss for _, loss in runs])[run]
+        columns = lambda values: np.concatenate([values, values])
+        return IperfTraces(runs, columns(run), columns(flow + 1),
+                           np.repeat([False, True], len(run)), columns(loss), columns(start[index]),
+                           columns(end[index]), np.concatenate([sent[keep], delivered[keep]]),
+                           np.concatenate([sent[keep], delivered[keep]]) * 8 / self.interval / 1e6)
+
+# 以 flowN_<丢包率>.txt 和 <接收主机>_received_<丢包率>.txt 的形式写出仿真结果，
+# 与 Part2-2_data 中的文件同名，可以直接交给 iperf_analysis.py 分析
+def write_traces(traces, flows, directory):
+    os.makedirs(directory, exist_ok=True)
+    for run in np.unique(traces.run):
+        loss = traces.runs[run][1]
+        for number, (_, dst, begin, _) in enumerate(flows, 1):
+            for server, name in ((False, f'flow{number}'), (True, f'{dst}_received')):
+                part = traces.select(run=run, flow=number, server=server)
+                write_log(os.path.join(directory, f'{name}_{loss:g}.txt'), part.start, part.end, part.bytes, begin)
+
+def main():
+    parser = argparse.ArgumentParser(description='fluid-model prediction of the 实验5 dumbbell iperf experiment')
+    parser.add_argument('--spec', metavar='FILE', help='JSON scenario spec as used by sweep.py (default: MyTopo)')
+    parser.add_argument('--loss', type=float, nargs='+', default=[0, 10, 20], help='loss %% on the lossy link(s)')
+    parser.add_argument('--lossy-link', default='s1-s2', help='link whose loss is varied, as NODE1-NODE2')
+    parser.add_argument('--algorithm', choices=['reno', 'cubic'], default='cubic')
+    parser.add_argument('--replicas', type=int, default=1, help='random replicas per loss setting')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dt', type=float, default=DT, help='simulation time step in seconds')
+    parser.add_argument('--output', metavar='DIR', help='write iperf-format logs of the prediction to DIR')
+    parser.add_argument('--compare', metavar='DIR', help='recorded iperf logs to compare the prediction with')
+    args = parser.parse_args()
+
+    lossy = tuple(args.lossy_link.split('-'))
+    links, flows = DUMBBELL_LINKS, DUMBBELL_FLOWS
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+        links, flows = build_links(spec), build_flows(spec)
+    model = FluidModel(links, flows, args.algorithm, args.dt)
+    settings = [loss for loss in args.loss for _ in range(args.replicas)]
+    began = time.perf_counter()
+    sent, delivered = model.simulate([{lossy: {'loss': loss}} for loss in settings], args.seed)
+    elapsed = time.perf_counter() - began
+    simulated = model.end.max() * len(settings)
+    print(f"simulated {len(settings)} runs ({simulated:.0f} s of traffic) in {elapsed:.2f} s "
+          f"({simulated / elapsed:.0f}x real time)")
+
+    runs = [(f'sim-{args.algorithm}-{i}', loss) for i, loss in enumerate(settings)]
+    traces = model.to_traces(sent, delivered, runs)
+    if args.output:
+        # 每个重复实验写入单独的子目录，避免同名文件互相覆盖
+        for replica in range(args.replicas):
+            subset = traces.take(traces.run % args.replicas == replica)
+            write_traces(subset, flows, os.path.join(args.output, f'replica{replica}'))
+
+    # 平均有效吞吐：按流的发送时长平均，与 iperf_analysis.py 的口径相同
+    duration = model.end - model.start
+    predicted = delivered.sum(axis=2) * 8 / duration / 1e6
+    measured = {}
+    if args.compare:
+        recorded = load_directories(args.compare)
+        for run, (_, loss) in enumerate(recorded.runs):
+            part = recorded.select(run=run, server=True)
+            measured[loss] = [part.bytes[part.flow == number].sum() * 8 / duration[number - 1] / 1e6
+                              for number in range(1, len(flows) + 1)]
+
+    print(f"{'loss%':>6}" + ''.join(f"{'flow %d' % n:>12}" for n in range(1, len(flows) + 1)) +
+          (''.join(f"{'measured %d' % n:>12}" for n in range(1, len(flows) + 1)) if measured else ''))
+    for loss in args.loss:
+        mean = predicted[np.array(settings) == loss].mean(axis=0)
+        row = f"{loss:>6g}" + ''.join(f"{value:>12.2f}" for value in mean)
+        if loss in measured:
+            row += ''.join(f"{value:>12.2f}" for value in measured[loss])
+        print(row)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import os
+
+import numpy as np
+
+from iperf_trace import load_directories
+
+# 统计所用的时间分箱宽度（秒），与 host_iperf.py 中 iperf -i 0.5 的报告间隔一致
+STEP = 0.5
+# Flow 2 加入的时刻（秒）
+JOIN_TIME = 10.0
+# Jain 公平性指数不低于该值并持续 HOLD_TIME 秒，视为已收敛
+FAIRNESS_THRESHOLD = 0.9
+HOLD_TIME = 2.0
+
+# 把每次运行中每条流的间隔记录按时间分箱，返回 (流编号, 速率, 活跃掩码)：
+# 速率为接收端日志得到的 [运行, 流, 时间箱] 矩阵（Mbit/s），
+# 活跃掩码表示发送端在该时间箱内是否在发送
+def rate_matrix(traces, step=STEP):
+    flows = np.unique(traces.flow)
+    bins = int(np.ceil(traces.end.max() / step)) if len(traces) else 0
+    shape = (len(traces.runs), len(flows), bins)
+    index = np.minimum((traces.start / step + 1e-9).astype(np.int64), bins - 1)
+    column = np.searchsorted(flows, traces.flow)
+    rates = np.zeros(shape)
+    received = traces.server
+    np.add.at(rates, (traces.run[received], column[received], index[received]),
+              traces.bytes[received] * 8 / step / 1e6)
+    active = np.zeros(shape, dtype=bool)
+    sent = ~traces.server
+    active[traces.run[sent], column[sent], index[sent]] = True
+    return flows, rates, active
+
+# Jain 公平性指数随时间的变化，[运行, 时间箱]：(Σx)² / (n·Σx²)，只计入正在发送的流；
+# 没有流在发送或所有流速率都为 0 的时间箱为 NaN
+def jain_index(rates, active):
+    x = np.where(active, rates, 0.0)
+    n = active.sum(axis=1)
+    numerator = x.sum(axis=1) ** 2
+    denominator = n * (x ** 2).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+# Flow 2 加入后的收敛时间（秒），每次运行一个值：从加入时刻起，到至少两条流同时发送、
+# 且 Jain 指数连续 hold 秒不低于 threshold 的第一个时刻为止；始终未收敛的运行为 NaN
+def convergence_time(rates, active, join=JOIN_TIME, threshold=FAIRNESS_THRESHOLD, hold=HOLD_TIME, step=STEP):
+    fairness = jain_index(rates, active)
+    ok = (fairness >= threshold) & (active.sum(axis=1) >= 2)
+    width = max(1, int(round(hold / step)))
+    # 用累加和判断每个起点之后 width 个时间箱是否全部满足条件
+    total = np.concatenate([np.zeros((len(ok), 1), dtype=np.int64), np.cumsum(ok, axis=1)], axis=1)
+    stable = np.zeros_like(ok)
+    if ok.shape[1] >= width:
+        stable[:, :ok.shape[1] - width + 1] = total[:, width:] - total[:, :-width] == width
+    stable[:, :int(round(join / step))] = False
+    first = stable.argmax(axis=1)
+    return np.where(stable.any(axis=1), first * step - join, np.nan)
+
+# 每次运行每条流的发送速率与有效吞吐（Mbit/s），均按发送端实际发送的时长平均；
+# 返回 [运行, 流] 矩阵 (offered, goodput)
+def goodput_vs_offered(traces, flows):
+    column = np.searchsorted(flows, traces.flow)
+    key = traces.run * len(flows) + column
+    size = len(traces.runs) * len(flows)
+    sent = ~traces.server
+    duration = np.bincount(key[sent], traces.end[sent] - traces.start[sent], minlength=size)
+    sent_bytes = np.bincount(key[sent], traces.bytes[sent], minlength=size)
+    received_bytes = np.bincount(key[~sent], traces.bytes[~sent], minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        offered = sent_bytes * 8 / duration / 1e6
+        goodput = received_bytes * 8 / duration / 1e6
+    shape = (len(traces.runs), len(flows))
+    return offered.reshape(shape), goodput.reshape(shape)
+
+# 有效吞吐对丢包率的敏感程度：按丢包率分组取各流有效吞吐的平均值，
+# 并对总吞吐做线性拟合，斜率单位为 Mbit/s 每 1% 丢包
+def loss_sensitivity(run_loss, goodput):
+    valid = ~np.isnan(run_loss)
+    losses, group = np.unique(run_loss[valid], return_inverse=True)
+    count = np.bincount(group, minlength=len(losses))
+    mean = np.stack([np.bincount(group, np.nan_to_num(column), minlength=len(losses))
+                     for column in goodput[valid].T], axis=1) / count[:, None]
+    total = mean.sum(axis=1)
+    slope = np.polyfit(losses, total, 1)[0] if len(losses) > 1 else np.nan
+    return losses, mean, total, slope
+
+def main():
+    parser = argparse.ArgumentParser(description='parse iperf interval logs and report throughput and fairness')
+    parser.add_argument('paths', nargs='+', help='directories containing flowN_<loss>.txt / hN_received_<loss>.txt logs')
+    parser.add_argument('--step', type=float, default=STEP, help='time bin width in seconds')
+    parser.add_argument('--join', type=float, default=JOIN_TIME, help='time at which flow 2 joins')
+    parser.add_argument('--threshold', type=float, default=FAIRNESS_THRESHOLD, help="Jain's index counted as converged")
+    parser.add_argument('--hold', type=float, default=HOLD_TIME, help='seconds the index must stay above the threshold')
+    args = parser.parse_args()
+
+    traces = load_directories(args.paths)
+    if not len(traces):
+        parser.error('no iperf logs found')
+    flows, rates, active = rate_matrix(traces, args.step)
+    offered, goodput = goodput_vs_offered(traces, flows)
+    fairness = jain_index(rates, active)
+    # 两条流同时发送期间的平均公平性
+    shared = (active.sum(axis=1) >= 2) & ~np.isnan(fairness)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_fairness = np.where(shared, fairness, 0).sum(axis=1) / shared.sum(axis=1)
+    convergence = convergence_time(rates, active, args.join, args.threshold, args.hold, args.step)
+
+    print(f"{len(traces)} intervals from {len(traces.runs)} runs")
+    header = f"{'run':<24}{'loss%':>6}" + ''.join(f"{'f%d off/good' % flow:>18}" for flow in flows) + f"{'Jain':>8}{'conv(s)':>9}"
+    print(header)
+    for run, (directory, loss) in enumerate(traces.runs):
+        cells = ''.join(f"{offered[run, i]:>9.2f}/{goodput[run, i]:<8.2f}" for i in range(len(flows)))
+        print(f"{os.path.basename(os.path.normpath(directory)):<24}{loss:>6g}{cells}"
+              f"{mean_fairness[run]:>8.3f}{convergence[run]:>9.1f}")
+
+    run_loss = np.array([loss for _, loss in traces.runs])
+    losses, mean, total, slope = loss_sensitivity(run_loss, goodput)
+    if len(losses):
+        print(f"\n{'loss%':>6}" + ''.join(f"{'flow %d' % flow:>10}" for flow in flows) + f"{'total':>10}{'vs best':>9}")
+        for i, loss in enumerate(losses):
+            print(f"{loss:>6g}" + ''.join(f"{value:>10.2f}" for value in mean[i]) +
+                  f"{total[i]:>10.2f}{total[i] / total.max():>9.0%}")
+        print(f"goodput slope: {slope:.3f} Mbit/s per 1% loss")
+
+if __name__ == '__main__':
+    main()
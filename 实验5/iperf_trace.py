@@ -0,0 +1,169 @@
+import json
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+# iperf 间隔记录行，如 "[  3]  0.5- 1.0 sec   768 KBytes  12.6 Mbits/sec"
+INTERVAL_RE = re.compile(
+    rb'^\[\s*(\d+)\]\s+([\d.]+)-\s*([\d.]+)\s+sec\s+([\d.]+)\s+([KMG]?)Bytes\s+([\d.]+)\s+([KMG]?)bits/sec',
+    re.M)
+# 日志文件名：<日志类型>_<丢包率>.txt，如 flow1_10.txt、h3_received_0.txt
+LOG_NAME_RE = re.compile(r'^(?P<kind>.+?)(?:_(?P<loss>\d+(?:\.\d+)?))?\.txt$')
+
+# 每种日志对应的 (流编号, 是否为接收端日志, 流开始的时刻)。
+# iperf 的间隔时间从各自连接建立时算起，加上开始时刻后才能在同一时间轴上比较
+DEFAULT_SCHEDULE = {
+    'flow1': (1, False, 0.0),
+    'flow2': (2, False, 10.0),
+    'h3_received': (1, True, 0.0),
+    'h4_received': (2, True, 10.0),
+}
+
+# 传输量单位按 1024 进位，速率单位按 1000 进位（与 iperf 的输出一致）
+BYTE_SCALE = {b'': 1, b'K': 1024, b'M': 1024 ** 2, b'G': 1024 ** 3}
+BIT_SCALE = {b'': 1, b'K': 1e3, b'M': 1e6, b'G': 1e9}
+
+# 一个已解析的日志文件
+LogFile = namedtuple('LogFile', 'path run kind flow server loss offset')
+
+# 把单位前缀数组换算为倍数数组
+def unit_scale(units, table):
+    scale = np.ones(len(units))
+    for prefix, factor in table.items():
+        if prefix:
+            scale[units == prefix] = factor
+    return scale
+
+# 一组iperf日志的间隔记录，每个字段是一个等长的NumPy数组（每行一个间隔）：
+#   run     所属运行（runs 中的下标），同一目录下丢包率相同的日志属于同一次运行
+#   flow    流编号；server 为真表示接收端日志，否则为发送端日志
+#   loss    丢包率设置（%），文件名中没有时为 NaN
+#   start/end  间隔在统一时间轴上的起止时刻（秒）
+#   bytes   间隔内传输的字节数；mbps 为 iperf 报告的速率（Mbit/s）
+class IperfTraces:
+    FIELDS = ('run', 'flow', 'server', 'loss', 'start', 'end', 'bytes', 'mbps')
+
+    def __init__(self, runs, run, flow, server, loss, start, end, bytes, mbps):
+        self.runs = list(runs)
+        self.run = np.asarray(run, dtype=np.int32)
+        self.flow = np.asarray(flow, dtype=np.int32)
+        self.server = np.asarray(server, dtype=bool)
+        self.loss = np.asarray(loss, dtype=np.float64)
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        self.bytes = np.asarray(bytes, dtype=np.float64)
+        self.mbps = np.asarray(mbps, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.start)
+
+    # 按布尔掩码或下标取出子集
+    def take(self, index):
+        return IperfTraces(self.runs, *(getattr(self, name)[index] for name in self.FIELDS))
+
+    # 按字段取值筛选，如 traces.select(flow=2, server=True)
+    def select(self, **conditions):
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in conditions.items():
+            mask &= getattr(self, name) == value
+        return self.take(mask)
+
+    # 合并多组记录，运行编号依次平移
+    @classmethod
+    def concat(cls, parts):
+        runs, columns = [], {name: [] for name in cls.FIELDS}
+        for part in parts:
+            for name in cls.FIELDS:
+                columns[name].append(getattr(part, name) + len(runs) if name == 'run' else getattr(part, name))
+            runs.extend(part.runs)
+        return cls(runs, *(np.concatenate(columns[name]) if columns[name] else [] for name in cls.FIELDS))
+
+# 解析若干日志文件。所有文件的匹配结果拼成一个字符串矩阵后统一转换数值和单位，
+# 不逐行调用 float，解析数千个文件也只需几次向量运算
+def parse_logs(logs, runs):
+    matches, counts = [], []
+    for log in logs:
+        with open(log.path, 'rb') as f:
+            found = INTERVAL_RE.findall(f.read())
+        matches.extend(found)
+        counts.append(len(found))
+    if not matches:
+        return IperfTraces(runs, *([] for _ in IperfTraces.FIELDS))
+    table = np.array(matches)
+    owner = np.repeat(np.arange(len(logs)), counts)  # 每行所属的日志文件
+    conn = table[:, 0].astype(np.int64)
+    start = table[:, 1].astype(np.float64)
+    end = table[:, 2].astype(np.float64)
+    size = table[:, 3].astype(np.float64) * unit_scale(table[:, 4], BYTE_SCALE)
+    mbps = table[:, 5].astype(np.float64) * unit_scale(table[:, 6], BIT_SCALE) / 1e6
+
+    # 每个连接最后一行是从 0 开始的总计；每个连接只有第一个从 0 开始的间隔是真正的间隔
+    key = owner * (1 << 20) + conn
+    zero = np.flatnonzero(start == 0)
+    _, first = np.unique(key[zero], return_index=True)
+    keep = np.ones(len(table), dtype=bool)
+    keep[zero] = False
+    keep[zero[first]] = True
+
+    field = lambda name, dtype: np.array([getattr(log, name) for log in logs], dtype=dtype)[owner[keep]]
+    offset = field('offset', np.float64)
+    return IperfTraces(runs, field('run', np.int32), field('flow', np.int32), field('server', bool),
+                       field('loss', np.float64), start[keep] + offset, end[keep] + offset, size[keep], mbps[keep])
+
+# 目录中 scenario.json（由 sweep.py 写出）记录的流调度，没有时为 None
+def directory_schedule(directory):
+    try:
+        with open(os.path.join(directory, 'scenario.json')) as f:
+            return {kind: tuple(entry) for kind, entry in json.load(f)['schedule'].items()}
+    except (OSError, ValueError, KeyError):
+        return None
+
+# 加载一个或多个目录下的全部iperf日志（递归查找），runs 中每项为 (目录, 丢包率)。
+# schedule 给出日志类型到 (流编号, 是否接收端, 开始时刻) 的映射，未列出的文件被忽略；
+# 目录中有 scenario.json 时改用其中记录的调度
+def load_directories(paths, schedule=DEFAULT_SCHEDULE):
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    logs, runs, index = [], [], {}
+    for root in paths:
+        for directory, _, names in sorted(os.walk(root)):
+            kinds = directory_schedule(directory) or schedule
+            for name in sorted(names):
+                match = LOG_NAME_RE.match(name)
+                if not match or match['kind'] not in kinds:
+                    continue
+                flow, server, offset = kinds[match['kind']]
+                loss = float(match['loss']) if match['loss'] else float('nan')
+                run = index.setdefault((directory, match['loss']), len(runs))
+                if run == len(runs):
+                    runs.append((directory, loss))
+                logs.append(LogFile(os.path.join(directory, name), run, match['kind'], flow, server, loss, offset))
+    return parse_logs(logs, runs)
+
+# 按 iperf 的习惯格式化数值：自动选择单位前缀，保留三位有效数字
+def format_quantity(value, unit, table):
+    prefix = b''
+    for name, factor in table.items():
+        if value >= factor:
+            prefix = name
+    value /= table[prefix]
+    digits = 2 if value < 9.995 else 1 if value < 99.95 else 0
+    return f"{value:4.{digits}f} {prefix.decode()}{unit}"
+
+# 把一条流的间隔记录写成 iperf 格式的日志，可以被 load_directories 重新解析。
+# offset 为流开始的时刻，写出的间隔时间与 iperf 一样从连接建立时算起
+def write_log(path, start, end, size, offset=0.0, conn=3):
+    rows = []
+    for begin, finish, count in zip(start - offset, end - offset, size):
+        rows.append(f"[{conn:3d}] {begin:4.1f}-{finish:4.1f} sec  {format_quantity(count, 'Bytes', BYTE_SCALE)}"
+                    f"  {format_quantity(count * 8 / (finish - begin), 'bits/sec', BIT_SCALE)}")
+    if len(rows):
+        total = float(np.sum(size))
+        duration = float(end[-1] - start[0])
+        rows.append(f"[{conn:3d}] {0.0:4.1f}-{duration:4.1f} sec  {format_quantity(total, 'Bytes', BYTE_SCALE)}"
+                    f"  {format_quantity(total * 8 / duration, 'bits/sec', BIT_SCALE)}")
+    with open(path, 'w') as f:
+        f.write('[ ID] Interval       Transfer     Bandwidth\n')
+        f.write(''.join(row + '\n' for row in rows))
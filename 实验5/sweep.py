@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import signal
+import time
+from subprocess import TimeoutExpired
+
+from backends import MininetBackend, StubBackend
+from topo_spec import DEFAULT_SPEC, build_flows, build_links, expand_grid
+
+# iperf 的报告间隔（秒），与 host_iperf.py 一致
+REPORT_INTERVAL = 0.5
+# 第 n 条流的 iperf 服务器监听 BASE_PORT + n
+BASE_PORT = 5000
+# 启动服务器后等待其开始监听的时间（秒）
+SERVER_SETTLE = 0.5
+# 检查流状态的间隔（秒）
+POLL_INTERVAL = 0.1
+# 客户端超过计划时长仍未结束时再等待的时间（秒），之后强制结束
+GRACE = 10.0
+# 所有客户端结束后，服务器日志连续该时间（秒）不再增长即认为队列中的数据已全部送达
+QUIET_TIME = 1.0
+# 等待服务器日志稳定的最长时间（秒）
+DRAIN_TIMEOUT = 15.0
+# 发出 SIGINT 后等待 iperf 退出的时间（秒）
+STOP_TIMEOUT = 5.0
+
+# 文件大小，文件不存在时为 -1
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return -1
+
+# 在一个场景上运行全部流：按计划时刻启动 iperf 客户端，检测客户端结束而不是固定等待，
+# 所有流结束且服务器日志稳定后停止网络。日志写入 directory，文件名与 Part2-2_data 相同，
+# 另写出 scenario.json 记录场景、实际的流开始时刻和各流的状态，供 iperf_trace.load_directories 使用
+def run_scenario(backend, spec, directory, params=None):
+    os.makedirs(directory, exist_ok=True)
+    links, flows = build_links(spec), build_flows(spec)
+    loss = spec['bottleneck'].get('loss', 0)
+    receivers = [dst for _, dst, _, _ in flows]
+    result = {'spec': spec, 'params': params or {}, 'schedule': {}, 'flows': []}
+
+    backend.start(links)
+    servers, clients, server_logs = [], {}, []
+    began = backend.clock()
+    try:
+        # 每条流使用单独的服务器端口，日志按流分开；接收主机只有一条流时与原实验同名
+        for n, (src, dst, start, duration) in enumerate(flows, 1):
+            name = f'{dst}_received' if receivers.count(dst) == 1 else f'{dst}_received_flow{n}'
+            output = os.path.join(directory, f'{name}_{loss:g}.txt')
+            args = ['iperf', '-s', '-p', str(BASE_PORT + n), '-i', str(REPORT_INTERVAL)]
+            servers.append(backend.popen(dst, args, output))
+            server_logs.append(output)
+            result['flows'].append({'flow': n, 'src': src, 'dst': dst, 'planned_start': start,
+                                    'duration': duration, 'server_log': name, 'status': 'pending'})
+        backend.sleep(SERVER_SETTLE)
+
+        began = backend.clock()
+        pending = sorted(range(len(flows)), key=lambda i: flows[i][2])
+        while pending or clients:
+            now = backend.clock() - began
+            while pending and flows[pending[0]][2] <= now:
+                i = pending.pop(0)
+                src, dst, start, duration = flows[i]
+                record = result['flows'][i]
+                args = ['iperf', '-c', backend.ip(dst), '-p', str(BASE_PORT + i + 1),
+                        '-t', f'{duration:g}', '-i', str(REPORT_INTERVAL)]
+                clients[i] = backend.popen(src, args, os.path.join(directory, f'flow{i + 1}_{loss:g}.txt'))
+                record.update(start=now, status='running')
+                # 日志中的时间从连接建立时算起，记录实际开始时刻以便对齐到同一时间轴
+                result['schedule'][f'flow{i + 1}'] = [i + 1, False, now]
+                result['schedule'][record['server_log']] = [i + 1, True, now]
+                print(f"[{now:6.1f}s] start flow {i + 1}: {src} -> {dst} for {duration:g}s")
+            for i, process in list(clients.items()):
+                record = result['flows'][i]
+                code = process.poll()
+                if code is not None:
+                    record.update(end=now, status='ok' if code == 0 else f'exit {code}')
+                    del clients[i]
+                    print(f"[{now:6.1f}s] flow {i + 1} finished ({record['status']})")
+                elif now > record['start'] + record['duration'] + GRACE:
+                    process.kill()
+                    process.wait()
+                    record.update(end=now, status='timeout')
+                    del clients[i]
+                    print(f"[{now:6.1f}s] flow {i + 1} did not finish, killed")
+            if pending or clients:
+                # 没有进行中的流时直接等到下一条流的开始时刻，否则定期检查客户端是否结束
+                wait = flows[pending[0]][2] - now if pending else POLL_INTERVAL
+                backend.sleep(max(0.0, min(wait, POLL_INTERVAL) if clients else wait))
+
+        # 客户端结束后瓶颈队列中可能还有数据，等服务器日志不再增长再停止
+        sizes, quiet_since, deadline = None, backend.clock(), backend.clock() + DRAIN_TIMEOUT
+        while backend.clock() < deadline:
+            current = [file_size(path) for path in server_logs]
+            if current != sizes:
+                sizes, quiet_since = current, backend.clock()
+            elif backend.clock() - quiet_since >= QUIET_TIME:
+                break
+            backend.sleep(POLL_INTERVAL)
+    finally:
+        for process in list(clients.values()) + servers:
+            process.send_signal(signal.SIGINT)
+        for process in list(clients.values()) + servers:
+            try:
+                process.wait(timeout=STOP_TIMEOUT)
+            except TimeoutExpired:
+                process.kill()
+                process.wait()
+        backend.stop()
+
+    result['elapsed'] = backend.clock() - began
+    result['status'] = 'ok' if all(flow['status'] == 'ok' for flow in result['flows']) else 'failed'
+    with open(os.path.join(directory, 'scenario.json'), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
+
+# 解析 --grid 参数 'PATH=V1,V2,...'，取值按 JSON 解析，失败时作为字符串（如 '2ms'）
+def parse_grid(items):
+    grid = {}
+    for item in items:
+        path, sep, values = item.partition('=')
+        if not sep:
+            raise ValueError(f'bad grid item: {item!r}')
+        grid[path] = []
+        for value in values.split(','):
+            try:
+                grid[path].append(json.loads(value))
+            except ValueError:
+                grid[path].append(value)
+    return grid
+
+# 场景是否已经成功运行过，用于中断后继续扫描
+def completed(directory):
+    try:
+        with open(os.path.join(directory, 'scenario.json')) as f:
+            return json.load(f).get('status') == 'ok'
+    except (OSError, ValueError):
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description='run the 实验5 iperf experiment over a grid of topology parameters')
+    parser.add_argument('--spec', metavar='FILE', help='JSON scenario spec (default: the MyTopo dumbbell)')
+    parser.add_argument('--grid', action='append', default=[], metavar='PATH=V1,V2,...',
+                        help="sweep a spec parameter, e.g. bottleneck.loss=0,10,20 or senders=2,4 (repeatable)")
+    parser.add_argument('--output', default='sweep_results', help='directory for per-scenario results')
+    parser.add_argument('--force', action='store_true', help='rerun scenarios that already completed')
+    parser.add_argument('--stub', action='store_true', help='use a local stub instead of Mininet (no root needed)')
+    args = parser.parse_args()
+
+    base = DEFAULT_SPEC
+    if args.spec:
+        with open(args.spec) as f:
+            base = json.load(f)
+    scenarios = expand_grid(base, parse_grid(args.grid))
+    print(f"{len(scenarios)} scenarios -> {args.output}")
+    for number, (name, spec, params) in enumerate(scenarios, 1):
+        directory = os.path.join(args.output, name)
+        if not args.force and completed(directory):
+            print(f"[{number}/{len(scenarios)}] {name}: already done, skipping")
+            continue
+        print(f"[{number}/{len(scenarios)}] {name}")
+        backend = StubBackend() if args.stub else MininetBackend()
+        began = time.perf_counter()
+        result = run_scenario(backend, spec, directory, params)
+        print(f"[{number}/{len(scenarios)}] {name}: {result['status']}, "
+              f"{result['elapsed']:.1f}s experiment time, {time.perf_counter() - began:.1f}s wall time")
+
+if __name__ == '__main__':
+    main()
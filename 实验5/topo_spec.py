@@ -0,0 +1,80 @@
+import copy
+import itertools
+import json
+
+# 与 customized_topo.py 中 MyTopo、host_iperf.py 中流调度相同的场景描述：
+#   senders/receivers  发送/接收主机到 s1/s2 的链路参数列表；也可以是主机数，此时每条链路使用 access/egress 中的参数
+#   bottleneck         s1–s2 链路的参数
+#   flows              (可选) 显式给出的流 [{src, dst, start, duration}]；省略时第 i 个发送主机
+#                      向第 i 个接收主机（循环使用）发送，第 i 条流在 i * stagger 秒开始，持续 duration 秒
+# 链路参数与 Mininet addLink 的参数相同：bw(Mbit/s)、delay、loss(%)、max_queue_size(报文数)
+DEFAULT_SPEC = {
+    'senders': [
+        {'bw': 10, 'delay': '2ms', 'loss': 0},
+        {'bw': 20, 'delay': '10ms', 'loss': 0},
+    ],
+    'receivers': [
+        {'bw': 10, 'delay': '2ms', 'loss': 0},
+        {'bw': 20, 'delay': '10ms', 'loss': 0},
+    ],
+    'access': {'bw': 10, 'delay': '2ms', 'loss': 0},
+    'egress': {'bw': 10, 'delay': '2ms', 'loss': 0},
+    'bottleneck': {'bw': 20, 'delay': '2ms', 'loss': 10},
+    'stagger': 10.0,
+    'duration': 20.0,
+}
+
+# 发送或接收主机的链路参数列表
+def host_links(spec, role, template):
+    hosts = spec[role]
+    if isinstance(hosts, int):
+        return [dict(spec[template]) for _ in range(hosts)]
+    return [dict(params) for params in hosts]
+
+# 主机名：发送主机为 h1..hN，接收主机接着编号，与 MyTopo 一致
+def host_names(spec):
+    senders = len(host_links(spec, 'senders', 'access'))
+    receivers = len(host_links(spec, 'receivers', 'egress'))
+    return ([f'h{i + 1}' for i in range(senders)],
+            [f'h{senders + i + 1}' for i in range(receivers)])
+
+# 由场景描述生成链路列表 [(端点1, 端点2, addLink 的参数)]，顺序与 MyTopo 中 addLink 的调用一致
+def build_links(spec):
+    senders, receivers = host_names(spec)
+    links = [(host, 's1', params) for host, params in zip(senders, host_links(spec, 'senders', 'access'))]
+    links.append(('s1', 's2', dict(spec['bottleneck'])))
+    links += [('s2', host, params) for host, params in zip(receivers, host_links(spec, 'receivers', 'egress'))]
+    return links
+
+# 由场景描述生成流调度 [(源, 目的, 开始时刻, 持续时间)]
+def build_flows(spec):
+    if spec.get('flows'):
+        return [(flow['src'], flow['dst'], float(flow['start']), float(flow['duration'])) for flow in spec['flows']]
+    senders, receivers = host_names(spec)
+    return [(src, receivers[i % len(receivers)], i * spec['stagger'], spec['duration'])
+            for i, src in enumerate(senders)]
+
+# 按点分路径修改场景中的一个参数，如 'bottleneck.loss'、'senders.1.bw'、'senders'
+def set_param(spec, path, value):
+    keys = path.split('.')
+    target = spec
+    for key in keys[:-1]:
+        target = target[int(key)] if isinstance(target, list) else target.setdefault(key, {})
+    if isinstance(target, list):
+        target[int(keys[-1])] = value
+    else:
+        target[keys[-1]] = value
+
+# 参数网格的全部组合：grid 为 {参数路径: 取值列表}，返回 [(场景名, 场景描述, 本场景的参数)]
+def expand_grid(base, grid):
+    names = list(grid)
+    scenarios = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        spec = copy.deepcopy(base)
+        params = dict(zip(names, values))
+        for path, value in params.items():
+            set_param(spec, path, value)
+        label = '_'.join(f"{path}={json.dumps(value) if not isinstance(value, str) else value}"
+                         for path, value in params.items()) or 'default'
+        scenarios.append((label.replace('/', '-').replace(' ', ''), spec, params))
+    return scenarios
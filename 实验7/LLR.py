@@ -1,3 +1,4 @@
+from ryu import cfg
 from ryu.base import app_manager
 from ryu.controller import mac_to_port
 from ryu.controller import ofp_event
@@ -15,6 +16,19 @@ from ryu.topology import event
 from collections import defaultdict
 import random
 
+# 下发的流表项的超时时间（秒，0 表示不超时），可在 ryu-manager --config-file 指定的配置文件中修改
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt('flow_idle_timeout', default=10, help='idle timeout of installed flow entries (0: none)'),
+    cfg.IntOpt('flow_hard_timeout', default=0, help='hard timeout of installed flow entries (0: none)'),
+])
+
+# 按流下发的表项的优先级，高于优先级为 0 的 table-miss 表项
+FLOW_PRIORITY = 1
+# table-miss 时送往控制器的最大字节数：交换机能缓存报文时只需送出足以解析首部的部分，
+# 报文留在交换机中，由下发的流表项直接释放
+MISS_SEND_LEN = 128
+
 
 class ProjectControllerRSR(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
@@ -33,71 +47,103 @@ class ProjectControllerRSR(app_manager.RyuApp):
 
         # 初始化路由表和负载
         self.table = {}
-        # 正确初始化 self.load，每一行都是独立的列表
+        # self.load[a][b] 为交换机 a 上经链路 a -> b 转发的流表项数，每一行都是独立的列表
         self.load = [[0] * 21 for _ in range(21)]
+        # 每个交换机上各流表项使用的下一跳交换机，删除表项时据此减少负载
+        self.flow_link = {}
+        # 边缘交换机选定的上行路径：(汇聚交换机, 源地址, 目的地址) -> 核心交换机
+        self.up_path = {}
+        self.idle_timeout = CONF.flow_idle_timeout
+        self.hard_timeout = CONF.flow_hard_timeout
         self.path_store = []  # 用于存储前10条流路径
 
-    def addr_get(self, dpid: int, dst_ip: str):
+    # 路径上各链路的负载：先比较最重的一段，再比较总和，负载相同时随机选择以分散流
+    def path_cost(self, path):
+        loads = [self.load[a][b] for a, b in zip(path, path[1:])]
+        return max(loads), sum(loads), random.random()
+
+    # 路径上的链路是否都已发现
+    def path_up(self, path):
+        return all(b in self.adjacency[a] for a, b in zip(path, path[1:]))
+
+    # 从 dpid 出发的候选路径中负载最低的一条，没有可用路径时返回 None
+    def least_loaded(self, paths):
+        paths = [path for path in paths if self.path_up(path)]
+        if not paths:
+            return None
+        return min(paths, key=self.path_cost)
+
+    # 计算 dpid 上发往 dst_ip 的输出端口和下一跳交换机（直连主机时下一跳为 None）。
+    # 边缘交换机按整条上行路径（汇聚 -> 核心 -> 目的 pod 的汇聚 -> 目的边缘）的负载选择，
+    # 并把选中的核心交换机记在 self.up_path 中，流到达汇聚交换机时沿用；下行路径是确定的
+    def addr_get(self, dpid: int, dst_ip: str, src_ip: str):
         # 检查 dst_ip 是否存在于 hosts 中
         if dst_ip not in self.hosts:
-            return None  # 或者返回一个默认端口
+            return None, None
 
         s, port = self.hosts[dst_ip]
         if not (1 <= s <= 8):
-            return None  # 或者返回一个默认端口
+            return None, None
 
+        # 目的 pod 中的两个汇聚交换机，奇数号连接核心 17/18，偶数号连接核心 19/20
         s1 = (s + 1) // 2 * 2 + 7
-        s2 = s1 + 1
 
-        dest = None
+        def down(core):
+            return s1 if core <= 18 else s1 + 1
 
-        try:
-            if 1 <= dpid <= 8:
-                if dpid == s:
-                    return port
-                dest = (dpid + 1) // 2 * 2 + 7 + random.randint(0, 1)
-                if dest > 20:
-                    return None
-
-            elif 9 <= dpid <= 16:
-                if (s1 <= dpid < s1 + 2):
-                    dest = s
-                elif dpid % 2 == 0:
-                    dest = 19 + random.randint(0, 1)
-                else:
-                    dest = 17 + random.randint(0, 1)
-                if dest > 20:
-                    return None
+        def cores(agg):
+            return (17, 18) if agg % 2 else (19, 20)
 
-            elif 17 <= dpid <= 18:
-                dest = (s + 1) // 2 * 2 + 7
-                if dest > 20:
-                    return None
+        if 1 <= dpid <= 8:
+            if dpid == s:
+                return port, None
+            a1 = (dpid + 1) // 2 * 2 + 7
+            if a1 == s1:
+                path = self.least_loaded([(dpid, agg, s) for agg in (a1, a1 + 1)])
+            else:
+                path = self.least_loaded([(dpid, agg, core, down(core), s)
+                                          for agg in (a1, a1 + 1) for core in cores(agg)])
+                if path is not None:
+                    self.up_path[(path[1], src_ip, dst_ip)] = path[2]
+            dest = path[1] if path is not None else None
+
+        elif 9 <= dpid <= 16:
+            if s1 <= dpid < s1 + 2:
+                dest = s
+            else:
+                core = self.up_path.pop((dpid, src_ip, dst_ip), None)
+                if core in self.adjacency[dpid]:
+                    dest = core
+                else:
+                    path = self.least_loaded([(dpid, core, down(core), s) for core in cores(dpid)])
+                    dest = path[1] if path is not None else None
 
-            elif 19 <= dpid <= 20:
-                dest = (s + 1) // 2 * 2 + 8
-                if dest > 20:
-                    return None
+        elif 17 <= dpid <= 20:
+            dest = down(dpid)
 
-            else:
-                return None  # 或者返回一个默认端口
+        else:
+            return None, None
 
-            # 更新负载
-            self.load[dpid][dest] += 1
-            self.load[dest][dpid] += 1
+        # 检查 adjacency 是否存在
+        if dest not in self.adjacency[dpid]:
+            return None, None
 
-            # 检查 adjacency 是否存在
-            if dest not in self.adjacency[dpid]:
-                return None  # 或者返回一个默认端口
+        return self.adjacency[dpid][dest], dest
 
-            return self.adjacency[dpid][dest]
+    # 流表项对应的链路负载：下发时加一，FlowRemoved（超时或被删除）时减一
+    def add_load(self, dpid, info, dest):
+        self.flow_link.setdefault(dpid, {})[info] = dest
+        self.load[dpid][dest] += 1
 
-        except IndexError as e:
-            return None  # 或者返回一个默认端口
-        except KeyError as e:
-            return None  # 或者返回一个默认端口
+    def remove_load(self, dpid, info):
+        dest = self.flow_link.get(dpid, {}).pop(info, None)
+        if dest is not None:
+            self.load[dpid][dest] -= 1
+            if 1 <= dpid <= 8:
+                # 汇聚交换机上已有该流的表项时不会来取边缘交换机选定的核心交换机，随边缘表项一起清除
+                self.up_path.pop((dest, info[2], info[3]), None)
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None, idle_timeout=0, hard_timeout=0, flags=0):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
@@ -108,14 +154,20 @@ class ProjectControllerRSR(app_manager.RyuApp):
                 buffer_id=buffer_id,
                 priority=priority,
                 match=match,
-                instructions=inst
+                instructions=inst,
+                idle_timeout=idle_timeout,
+                hard_timeout=hard_timeout,
+                flags=flags
             )
         else:
             mod = parser.OFPFlowMod(
                 datapath=datapath,
                 priority=priority,
                 match=match,
-                instructions=inst
+                instructions=inst,
+                idle_timeout=idle_timeout,
+                hard_timeout=hard_timeout,
+                flags=flags
             )
         datapath.send_msg(mod)
 
@@ -126,7 +178,7 @@ class ProjectControllerRSR(app_manager.RyuApp):
         parser = datapath.ofproto_parser
 
         match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, MISS_SEND_LEN)]
         self.add_flow(datapath, 0, match, actions)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
@@ -144,11 +196,13 @@ class ProjectControllerRSR(app_manager.RyuApp):
             _ipv4 = pkt.get_protocol(ipv4.ipv4)
             src_addr = _ipv4.src
             dst_addr = _ipv4.dst
+            match = parser.OFPMatch(eth_type=eth.ethertype, in_port=in_port, ipv4_src=src_addr, ipv4_dst=dst_addr)
             pkt_type = 'IP'
         elif eth.ethertype == ether_types.ETH_TYPE_ARP:
             arp_pkt = pkt.get_protocol(arp.arp)
             src_addr = arp_pkt.src_ip
             dst_addr = arp_pkt.dst_ip
+            match = parser.OFPMatch(eth_type=eth.ethertype, in_port=in_port, arp_spa=src_addr, arp_tpa=dst_addr)
             pkt_type = 'ARP'
         else:
             return
@@ -161,19 +215,34 @@ class ProjectControllerRSR(app_manager.RyuApp):
         if info in self.table[dpid]:
             out_port = self.table[dpid][info]
         else:
-            out_port = self.addr_get(dpid, dst_addr)
+            out_port, dest = self.addr_get(dpid, dst_addr, src_addr)
             if out_port is None:
                 # 无法确定输出端口，丢弃数据包
                 return
             self.table[dpid][info] = out_port
+            if dest is not None:
+                self.add_load(dpid, info, dest)
 
             # 监控并打印前10条唯一流路径（包括 ARP 和 IP）
             key = (pkt_type, src_addr, dst_addr)
             if len(self.path_store) < 10 and key not in self.path_store:
                 self.path_store.append(key)
-                print(f"{pkt_type} {src_addr} -> {dst_addr} path = {dpid}")
+                print(f"{pkt_type} {src_addr} -> {dst_addr} path = {dpid}"
+                      + (f" -> {dest}" if dest is not None else ""))
+
+            # 把转发决定下发为流表项（匹配以太网类型、入端口、源和目的地址），该流的后续报文
+            # 由交换机直接转发，不再经过控制器；表项删除时交换机发来 FlowRemoved
+            actions = [parser.OFPActionOutput(out_port)]
+            flags = ofproto.OFPFF_SEND_FLOW_REM
+            if msg.buffer_id != ofproto.OFP_NO_BUFFER:
+                # 报文缓存在交换机中，由流表项直接释放，不需要再发 PacketOut
+                self.add_flow(datapath, FLOW_PRIORITY, match, actions, msg.buffer_id,
+                              self.idle_timeout, self.hard_timeout, flags)
+                return
+            self.add_flow(datapath, FLOW_PRIORITY, match, actions,
+                          idle_timeout=self.idle_timeout, hard_timeout=self.hard_timeout, flags=flags)
 
-        # 发送并转发
+        # 发送并转发（流表项生效前到达的报文也由这里发出）
         actions = [parser.OFPActionOutput(out_port)]
         data = None
         if msg.buffer_id == ofproto.OFP_NO_BUFFER:
@@ -188,6 +257,21 @@ class ProjectControllerRSR(app_manager.RyuApp):
         )
         datapath.send_msg(out)
 
+    # 流表项超时或被删除后清除对应的转发决定并减少链路负载，该流的下一个报文重新送往控制器
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        match = msg.match
+        if match.get('ipv4_src') is not None:
+            src, dst = match['ipv4_src'], match['ipv4_dst']
+        elif match.get('arp_spa') is not None:
+            src, dst = match['arp_spa'], match['arp_tpa']
+        else:
+            return
+        info = (match['eth_type'], match['in_port'], src, dst)
+        self.table.get(msg.datapath.id, {}).pop(info, None)
+        self.remove_load(msg.datapath.id, info)
+
     @set_ev_cls(event.EventSwitchEnter)
     def switch_enter_handler(self, ev):
         switch = ev.switch.dp
@@ -202,6 +286,10 @@ class ProjectControllerRSR(app_manager.RyuApp):
             self.switches.remove(switch)
             del self.datapath_list[switch]
             del self.adjacency[switch]
+            # 交换机离开后其流表项不会再发来 FlowRemoved，直接清除它们的负载
+            self.table.pop(switch, None)
+            for info in list(self.flow_link.get(switch, {})):
+                self.remove_load(switch, info)
 
     # 获取 fat tree 的邻接矩阵
     @set_ev_cls(event.EventLinkAdd, MAIN_DISPATCHER)
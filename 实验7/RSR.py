@@ -1,3 +1,4 @@
+from ryu import cfg
 from ryu.base import app_manager
 from ryu.controller import mac_to_port
 from ryu.controller import ofp_event
@@ -15,6 +16,19 @@ from ryu.topology import event
 from collections import defaultdict
 import random
 
+# 下发的流表项的超时时间（秒，0 表示不超时），可在 ryu-manager --config-file 指定的配置文件中修改
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt('flow_idle_timeout', default=10, help='idle timeout of installed flow entries (0: none)'),
+    cfg.IntOpt('flow_hard_timeout', default=0, help='hard timeout of installed flow entries (0: none)'),
+])
+
+# 按流下发的表项的优先级，高于优先级为 0 的 table-miss 表项
+FLOW_PRIORITY = 1
+# table-miss 时送往控制器的最大字节数：交换机能缓存报文时只需送出足以解析首部的部分，
+# 报文留在交换机中，由下发的流表项直接释放
+MISS_SEND_LEN = 128
+
 
 class ProjectControllerRSR(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
@@ -35,6 +49,8 @@ class ProjectControllerRSR(app_manager.RyuApp):
         self.table = {}
         # 正确初始化 self.load，每一行都是独立的列表
         self.load = [[0] * 21 for _ in range(21)]
+        self.idle_timeout = CONF.flow_idle_timeout
+        self.hard_timeout = CONF.flow_hard_timeout
         self.path_store = []
 
     def addr_get(self, dpid: int, dst_ip: str) -> int:
@@ -104,7 +120,7 @@ class ProjectControllerRSR(app_manager.RyuApp):
             # self.logger.error(f"Load index out of range: {e}")
             return None  # 或者返回一个默认端口
 
-    def add_flow(self, datapath, priority, match, actions, buffer_id=None):
+    def add_flow(self, datapath, priority, match, actions, buffer_id=None, idle_timeout=0, hard_timeout=0, flags=0):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
 
@@ -115,14 +131,20 @@ class ProjectControllerRSR(app_manager.RyuApp):
                 buffer_id=buffer_id,
                 priority=priority,
                 match=match,
-                instructions=inst
+                instructions=inst,
+                idle_timeout=idle_timeout,
+                hard_timeout=hard_timeout,
+                flags=flags
             )
         else:
             mod = parser.OFPFlowMod(
                 datapath=datapath,
                 priority=priority,
                 match=match,
-                instructions=inst
+                instructions=inst,
+                idle_timeout=idle_timeout,
+                hard_timeout=hard_timeout,
+                flags=flags
             )
         datapath.send_msg(mod)
 
@@ -133,7 +155,7 @@ class ProjectControllerRSR(app_manager.RyuApp):
         parser = datapath.ofproto_parser
 
         match = parser.OFPMatch()
-        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, ofproto.OFPCML_NO_BUFFER)]
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER, MISS_SEND_LEN)]
         self.add_flow(datapath, 0, match, actions)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
@@ -151,11 +173,13 @@ class ProjectControllerRSR(app_manager.RyuApp):
             _ipv4 = pkt.get_protocol(ipv4.ipv4)
             src_ip = _ipv4.src
             dst_ip = _ipv4.dst
+            match = parser.OFPMatch(eth_type=eth.ethertype, in_port=in_port, ipv4_src=src_ip, ipv4_dst=dst_ip)
             pkt_type = 'IP'
         elif eth.ethertype == ether_types.ETH_TYPE_ARP:
             arp_pkt = pkt.get_protocol(arp.arp)
             src_ip = arp_pkt.src_ip
             dst_ip = arp_pkt.dst_ip
+            match = parser.OFPMatch(eth_type=eth.ethertype, in_port=in_port, arp_spa=src_ip, arp_tpa=dst_ip)
             pkt_type = 'ARP'
         else:
             return
@@ -184,7 +208,19 @@ class ProjectControllerRSR(app_manager.RyuApp):
             if src_ip == h_x and dst_ip in [h_x_4, h_x_5]:
                 print(f"Path: {src_ip} -> {dst_ip} via DPID {dpid}")
 
-        # 发送并转发
+            # 把转发决定下发为流表项（匹配以太网类型、入端口、源和目的地址），该流的后续报文
+            # 由交换机直接转发，不再经过控制器；表项删除时交换机发来 FlowRemoved
+            actions = [parser.OFPActionOutput(out_port)]
+            flags = ofproto.OFPFF_SEND_FLOW_REM
+            if msg.buffer_id != ofproto.OFP_NO_BUFFER:
+                # 报文缓存在交换机中，由流表项直接释放，不需要再发 PacketOut
+                self.add_flow(datapath, FLOW_PRIORITY, match, actions, msg.buffer_id,
+                              self.idle_timeout, self.hard_timeout, flags)
+                return
+            self.add_flow(datapath, FLOW_PRIORITY, match, actions,
+                          idle_timeout=self.idle_timeout, hard_timeout=self.hard_timeout, flags=flags)
+
+        # 发送并转发（流表项生效前到达的报文也由这里发出）
         actions = [parser.OFPActionOutput(out_port)]
 
         data = None
@@ -200,6 +236,20 @@ class ProjectControllerRSR(app_manager.RyuApp):
         )
         datapath.send_msg(out)
 
+    # 流表项超时或被删除后清除对应的转发决定，该流的下一个报文重新送往控制器
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        match = msg.match
+        if match.get('ipv4_src') is not None:
+            src, dst = match['ipv4_src'], match['ipv4_dst']
+        elif match.get('arp_spa') is not None:
+            src, dst = match['arp_spa'], match['arp_tpa']
+        else:
+            return
+        info = (match['eth_type'], match['in_port'], src, dst)
+        self.table.get(msg.datapath.id, {}).pop(info, None)
+
     @set_ev_cls(event.EventSwitchEnter)
     def switch_enter_handler(self, ev):
         switch = ev.switch.dp